@@ -1,21 +1,36 @@
 import os
 import json
+import hashlib
+import threading
 import time
-import uuid
+from contextlib import closing
+from functools import wraps
 from pathlib import Path
 
-import requests
-from flask import Flask, render_template, request, jsonify
+from flask import (Blueprint, Flask, Response, current_app, g, render_template, request, jsonify, send_file,
+                   stream_with_context)
 from dotenv import load_dotenv
-from openai import OpenAI
 
+# Load .env before the local modules below read their settings from the environment
 load_dotenv()
 
-app = Flask(__name__)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import idempotency
+import image_pipeline
+import metrics
+import outbound
+import outfit_engine
+import prompt_encoder
+import response_cache
+import storage
+import users
+import weather
+from blob_store import BlobStore, decode_data_url
+from categorizer import categorize, categorize_many
+from chat_store import ChatNotFound
 
-PROFILE_PATH = Path("profile.json")
-CHATS_PATH = Path("chats.json")
+bp = Blueprint("main", __name__)
+
+USER_COOKIE_MAX_AGE = 2 * 365 * 24 * 3600
 
 # Обновленная структура профиля
 DEFAULT_PROFILE = {
@@ -35,58 +50,209 @@ DEFAULT_PROFILE = {
 
 # --- HELPERS ---
 
+def merge_profile(data) -> dict:
+    merged = DEFAULT_PROFILE.copy()
+    if isinstance(data, dict):
+        merged.update(data)
+    return merged
+
+
+class Services:
+    """
+    One app's clients and stores. Each is built from the app config when a
+    request first needs it, unless the config injects a ready-made one under
+    the same name (LLM_CLIENT, BLOB_STORE, USER_SPACES, ...). Until then
+    nothing is opened or imported, so a pre-fork master holds no SQLite
+    handles and tests never construct an OpenAI client.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._built = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name: str, build):
+        value = self._built.get(name)
+        if value is None:
+            with self._lock:
+                value = self._built.get(name)
+                if value is None:
+                    injected = self.config.get(name)
+                    value = self._built[name] = injected if injected is not None else build()
+        return value
+
+    def built(self, name: str):
+        """
+        What _get(name) has returned so far, or None; for callers such as
+        /metrics that report on things without creating them.
+        """
+        return self._built.get(name)
+
+    @property
+    def llm(self):
+        return self._get("LLM_CLIENT", outbound.llm)
+
+    @property
+    def async_llm(self):
+        # AsyncOpenAI client for calls run on the background loop (batch recognition, chat summaries)
+        return self._get("ASYNC_LLM_CLIENT", outbound.async_llm)
+
+    @property
+    def http(self):
+        return self._get("HTTP_SESSION", outbound.session)
+
+    @property
+    def weather(self) -> weather.Weather:
+        return self._get("WEATHER", lambda: weather.Weather(lambda: self.http))
+
+    @property
+    def blobs(self) -> BlobStore:
+        # Images are content-addressed and shared; profile, chats and wardrobe are per user
+        return self._get("BLOB_STORE", lambda: BlobStore(Path(self.config["BLOBS_DIR"])))
+
+    @property
+    def user_spaces(self) -> users.UserDirectory:
+        return self._get("USER_SPACES", lambda: users.UserDirectory(
+            Path(self.config["USERS_DIR"]), self.blobs, profile_transform=merge_profile,
+            async_llm=lambda: self.async_llm))
+
+    @property
+    def outfit_cache(self) -> response_cache.ResponseCache:
+        # Outfit responses keyed on wardrobe + profile + weather bucket + event.
+        # Set OUTFIT_CACHE_DB to a file path to persist them across restarts/workers.
+        return self._get("OUTFIT_CACHE", lambda: response_cache.ResponseCache(
+            maxsize=512, ttl=self.config["OUTFIT_CACHE_TTL"], disk_path=self.config["OUTFIT_CACHE_DB"],
+            max_rows=self.config["CACHE_DB_MAX_ROWS"]))
+
+    @property
+    def recognize_cache(self) -> response_cache.ResponseCache:
+        # Vision results keyed on the sha256 of the decoded image; always on disk, a photo is recognized once
+        return self._get("RECOGNIZE_CACHE", lambda: response_cache.ResponseCache(
+            maxsize=1024, ttl=self.config["RECOGNIZE_CACHE_TTL"], disk_path=self.config["RECOGNIZE_CACHE_DB"],
+            max_rows=self.config["CACHE_DB_MAX_ROWS"]))
+
+    @property
+    def idempotency(self) -> idempotency.Idempotency:
+        # Responses to POSTs sent with an Idempotency-Key, so a retry gets the original result instead of a
+        # second LLM call; IDEMPOTENCY_DB keeps them, and the keys being run, shared between workers.
+        # Identical in-flight requests share one call
+        return self._get("IDEMPOTENCY", lambda: idempotency.Idempotency(
+            lambda: g.user_id, ttl=self.config["IDEMPOTENCY_TTL"], disk_path=self.config["IDEMPOTENCY_DB"],
+            max_rows=self.config["CACHE_DB_MAX_ROWS"]))
+
+
+def services() -> Services:
+    return current_app.extensions["services"]
+
+
+def idempotent(view):
+    """
+    Runs view through the app's idempotency store (see idempotency.py).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return services().idempotency.run(view, *args, **kwargs)
+    return wrapper
+
+
+@bp.before_app_request
+def identify_user():
+    """
+    Takes the user id from the X-User-Id header or the uid cookie. Visitors
+    without one get a new id (set as a cookie after the request) unless
+    DEFAULT_USER_ID is configured. Nothing is opened until current_user().
+    """
+    if request.endpoint in (None, "static", "main.get_blob", "main.prometheus_metrics"):
+        return None
+    header = request.headers.get(users.USER_HEADER)
+    if header is not None and not users.valid_user_id(header):
+        return jsonify({"error": "Invalid user id"}), 400
+    user_id = header or request.cookies.get(users.USER_COOKIE)
+    if not users.valid_user_id(user_id):
+        default_user_id = current_app.config["DEFAULT_USER_ID"]
+        user_id = default_user_id or users.new_user_id()
+        if not default_user_id:
+            g.new_user_id = user_id
+    g.user_id = user_id
+    return None
+
+
+@bp.after_app_request
+def set_user_cookie(response):
+    if g.get("new_user_id"):
+        response.set_cookie(users.USER_COOKIE, g.new_user_id, max_age=USER_COOKIE_MAX_AGE, httponly=True,
+                            samesite="Lax")
+    return response
+
+
+def current_user() -> users.UserSpace:
+    """
+    The requesting user's profile, chats and wardrobe (parsed profile and store handles come from an LRU).
+    """
+    space = g.get("user_space")
+    if space is None:
+        space = g.user_space = services().user_spaces.get(g.user_id)
+    return space
+
+
+@metrics.timed("load_profile")
 def load_profile():
-    if PROFILE_PATH.exists():
-        try:
-            data = json.loads(PROFILE_PATH.read_text(encoding="utf-8"))
-            merged = DEFAULT_PROFILE.copy()
-            merged.update(data)
-            return merged
-        except:
-            return DEFAULT_PROFILE.copy()
-    return DEFAULT_PROFILE.copy()
+    try:
+        return dict(current_user().profile.get())
+    except storage.StorageError as e:
+        # Serve defaults but leave the file alone so it can be recovered
+        print(e)
+        metrics.ERRORS.inc(where="load_profile")
+        return DEFAULT_PROFILE.copy()
 
 
-def save_profile(data: dict) -> None:
-    PROFILE_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+def update_profile(mutate) -> dict:
+    """
+    Applies mutate(profile) under the profile lock and saves the result.
+    """
+    return dict(current_user().profile.update(mutate))
 
 
-def load_chats():
-    if CHATS_PATH.exists():
-        try:
-            return json.loads(CHATS_PATH.read_text(encoding="utf-8"))
-        except:
-            return {}
-    return {}
+@metrics.timed("load_wardrobe")
+def request_wardrobe(data: dict) -> list:
+    """
+    The wardrobe for an outfit request: inline "wardrobe" from older clients,
+    otherwise ("wardrobe_ref": "server") the server-side store.
+    """
+    if "wardrobe" in data:
+        return data.get("wardrobe") or []
+    return current_user().wardrobe.all_items()
 
 
-def save_chats(data: dict) -> None:
-    CHATS_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+RECOGNIZE_BATCH_MAX = int(os.getenv("RECOGNIZE_BATCH_MAX", "200"))
+RECOGNIZE_CONCURRENCY = int(os.getenv("RECOGNIZE_CONCURRENCY", "8"))
+# "low" makes the model look at one 512px tile (a fixed, small token cost), which matches IMAGE_MAX_SIDE
+VISION_DETAIL = os.getenv("VISION_DETAIL", "low")
 
+# Profile fields that go into the outfit prompts (and so into the cache key)
+PROFILE_PROMPT_FIELDS = ["name", "gender", "height", "weight", "body_type", "skin_tone", "style"]
 
-# --- OUTFIT VALIDATION ---
 
-# Define incompatible clothing combinations
-INCOMPATIBLE_ITEMS = {
-    "bottoms": ["jeans", "pants", "shorts", "skirt", "trousers", "leggings", "cargo"],
-    "shoes": ["sneakers", "boots", "heels", "sandals", "loafers", "oxfords", "flats"],
-    "outerwear": ["jacket", "coat", "blazer", "cardigan", "sweater", "hoodie"],
-}
+def describe_profile(profile: dict) -> str:
+    return (
+        f"Name: {profile.get('name')}. "
+        f"Gender: {profile.get('gender')}. "
+        f"Body: {profile.get('height')}cm, {profile.get('weight')}kg, {profile.get('body_type')} build. "
+        f"Skin Tone: {profile.get('skin_tone')}. "
+        f"Style Preference: {profile.get('style')}."
+    )
+
+
+# --- OUTFIT VALIDATION ---
 
 def get_item_category(item: dict) -> str:
     """
     Determine the category of a clothing item based on its type.
     """
-    item_type = item.get("type", "").lower()
-    
-    for category, types in INCOMPATIBLE_ITEMS.items():
-        for item_type_name in types:
-            if item_type_name in item_type:
-                return category
-    
-    return "accessory"  # Default category
+    return categorize(str(item.get("type") or ""))
 
 
+@metrics.timed("validate_outfit")
 def validate_outfit(wardrobe: list, outfit_items: list) -> tuple:
     """
     Validates an outfit to ensure no incompatible items are combined.
@@ -106,26 +272,16 @@ def validate_outfit(wardrobe: list, outfit_items: list) -> tuple:
     accessories = []
     conflicts = []
     
-    for item_id in outfit_items:
-        if item_id not in wardrobe_map:
-            continue
-            
-        item = wardrobe_map[item_id]
-        item_type = item.get("type", "").lower()
-        
-        # Categorize item
-        is_bottom = any(x in item_type for x in ["jeans", "pants", "shorts", "skirt", "trousers", "leggings", "cargo"])
-        is_shoe = any(x in item_type for x in ["sneaker", "boot", "heel", "sandal", "loafer", "oxford", "flat", "shoe"])
-        is_outerwear = any(x in item_type for x in ["jacket", "coat", "blazer", "cardigan", "sweater", "hoodie", "vest"])
-        is_top = any(x in item_type for x in ["shirt", "blouse", "tshirt", "t-shirt", "top", "dress", "tank"])
-        
-        if is_bottom:
+    selected = [wardrobe_map[item_id] for item_id in outfit_items if item_id in wardrobe_map]
+
+    for item, category in zip(selected, categorize_many(selected)):
+        if category == "bottoms":
             bottoms.append(item)
-        elif is_shoe:
+        elif category == "shoes":
             shoes.append(item)
-        elif is_outerwear:
+        elif category == "outerwear":
             outerwear.append(item)
-        elif is_top:
+        elif category == "tops":
             tops.append(item)
         else:
             accessories.append(item)
@@ -166,172 +322,552 @@ def validate_outfit(wardrobe: list, outfit_items: list) -> tuple:
 
 # --- TOKEN OPTIMIZATION ---
 
-def optimize_wardrobe(wardrobe: list, max_items: int = 50) -> list:
+# Prompt wardrobe size: at most this many items / roughly this many tokens
+WARDROBE_PROMPT_ITEMS = int(os.getenv("WARDROBE_PROMPT_ITEMS", "50"))
+WARDROBE_PROMPT_TOKENS = int(os.getenv("WARDROBE_PROMPT_TOKENS", "2500"))
+# Share of the prompt slots per category, so every part of an outfit has choices
+CATEGORY_SHARE = {"tops": 0.3, "bottoms": 0.2, "shoes": 0.15, "outerwear": 0.15, "accessories": 0.2}
+
+
+def compact_item(item: dict) -> dict:
+    """
+    Keeps only essential attributes (id, type, color, style, season, warmth), non-empty values only.
+    """
+    compact = {
+        "id": item.get("id", ""),
+        "type": item.get("type", ""),
+        "color": item.get("color", ""),
+        "style": item.get("style", ""),
+        "season": item.get("season", ""),
+        "warmth": item.get("warmth", ""),
+    }
+    return {k: v for k, v in compact.items() if v}
+
+
+@metrics.timed("optimize_wardrobe")
+def optimize_wardrobe(wardrobe: list, max_items: int = WARDROBE_PROMPT_ITEMS, weather="", profile: dict = None,
+                      event="", token_budget: int = WARDROBE_PROMPT_TOKENS) -> list:
     """
     Optimizes wardrobe data to reduce token usage by:
-    1. Limiting items count
+    1. Selecting the items most relevant to the weather and event, balanced
+       across categories, within max_items and token_budget
     2. Keeping only essential attributes (id, type, color, style, season)
     3. Removing verbose descriptions
     """
     if not wardrobe:
         return []
-    
-    # Limit to max_items to prevent token overflow
-    limited_wardrobe = wardrobe[:max_items]
-    
-    optimized = []
-    for item in limited_wardrobe:
-        optimized_item = {
-            "id": item.get("id", ""),
-            "type": item.get("type", ""),
-            "color": item.get("color", ""),
-            "style": item.get("style", ""),
-            "season": item.get("season", ""),
-            "warmth": item.get("warmth", ""),
-        }
-        # Only add non-empty values
-        optimized.append({k: v for k, v in optimized_item.items() if v})
-    
-    return optimized
 
+    ranked = outfit_engine.index_for(wardrobe).ranked(weather, profile or {}, event, k=max_items)
+    quotas = {category: max(1, round(share * max_items)) for category, share in CATEGORY_SHARE.items()}
+    queues = {category: iter(ranked[category]) for category in CATEGORY_SHARE}
+    counts = dict.fromkeys(CATEGORY_SHARE, 0)
+
+    # Round-robin over categories: first up to each quota, then fill leftover slots from any category
+    selected, tokens = [], 0
+    for use_quota in (True, False):
+        active = [category for category in CATEGORY_SHARE if ranked[category]]
+        while active and len(selected) < max_items:
+            for category in list(active):
+                item = None
+                if not (use_quota and counts[category] >= quotas[category]):
+                    item = next(queues[category], None)
+                if item is None:
+                    active.remove(category)
+                    continue
+                compact = compact_item(item)
+                cost = prompt_encoder.row_tokens(compact)
+                if tokens + cost > token_budget:
+                    continue
+                tokens += cost
+                counts[category] += 1
+                selected.append(compact)
+                if len(selected) >= max_items:
+                    break
+    return selected
+
+
+def wardrobe_messages(system_prompt: str, user_head: str, items: list) -> tuple:
+    """
+    Chat messages with the wardrobe as a compact table, cut to fit PROMPT_TOKEN_BUDGET.
+    Returns (messages, {short id: real id}, estimated prompt tokens).
+    """
+    label = f"Wardrobe ({'|'.join(prompt_encoder.COLUMNS)}; answer with the id numbers):\n"
+    fixed = prompt_encoder.count_messages([{"content": system_prompt}, {"content": user_head + label}])
+    table, id_map, tokens = prompt_encoder.fit_wardrobe(items, prompt_encoder.PROMPT_TOKEN_BUDGET - fixed)
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_head + label + table}]
+    return messages, id_map, fixed + tokens
+
+
+# --- LOCAL OUTFIT ENGINE ---
+
+OUTFIT_MODES = ["local", "llm", "hybrid"]
+DEFAULT_OUTFIT_MODE = os.getenv("OUTFIT_MODE", "llm")
+HYBRID_CANDIDATES = 5
 
-def create_wardrobe_summary(wardrobe: list) -> str:
+
+def outfit_mode(data: dict) -> str:
     """
-    Creates a concise text summary of wardrobe instead of full JSON
-    to save tokens when wardrobe is very large.
+    Picks local | llm | hybrid from the request body or ?mode=, else OUTFIT_MODE.
     """
-    if not wardrobe:
-        return "No wardrobe items"
-    
-    # Group items by type
-    types = {}
-    for item in wardrobe:
-        item_type = item.get("type", "Other")
-        if item_type not in types:
-            types[item_type] = 0
-        types[item_type] += 1
-    
-    # Create summary
-    summary = "Available wardrobe items:\n"
-    for item_type, count in sorted(types.items()):
-        summary += f"- {item_type}: {count} items\n"
-    
-    summary += f"\nTotal: {len(wardrobe)} items"
-    return summary
+    mode = str(data.get("mode") or request.args.get("mode") or DEFAULT_OUTFIT_MODE).lower()
+    return mode if mode in OUTFIT_MODES else DEFAULT_OUTFIT_MODE
+
+
+def local_outfit(wardrobe: list, weather, profile: dict, user_event, exclude=()) -> dict:
+    with metrics.stage("outfit_engine"):
+        candidates = outfit_engine.generate(wardrobe, weather, profile, user_event, exclude=exclude)
+    if not candidates:
+        return {"items": [], "reason": "Add a few more items to your wardrobe first.", "mode": "local"}
+    return {"items": candidates[0]["items"], "reason": candidates[0]["reason"], "mode": "local"}
+
+
+def hybrid_outfit(wardrobe: list, weather, profile: dict, user_event, exclude=()) -> dict:
+    """
+    The local engine proposes a few valid outfits and the LLM only ranks them,
+    which needs a much smaller prompt than the full wardrobe.
+    """
+    with metrics.stage("outfit_engine"):
+        candidates = outfit_engine.generate(wardrobe, weather, profile, user_event, exclude=exclude,
+                                            n=HYBRID_CANDIDATES)
+    if len(candidates) < 2:
+        return local_outfit(wardrobe, weather, profile, user_event, exclude)
+
+    by_id = {item.get("id"): item for item in wardrobe}
+
+    def describe(item: dict) -> str:
+        return f"{item.get('type', 'item')} ({item.get('color') or item.get('style') or '-'})"
+
+    options = "\n".join(
+        f"{i}: " + "; ".join(describe(by_id[item_id]) for item_id in candidate["items"])
+        for i, candidate in enumerate(candidates)
+    )
+    with metrics.stage("llm.hybrid"):
+        resp = services().llm.chat.completions.create(
+            model="gpt-4o-mini",
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": (
+                    "You are an expert AI Personal Stylist. Pick the ONE best outfit from the numbered candidates "
+                    "for this user, weather and event. Consider body type, skin tone, occasion and style.\n"
+                    "Return ONLY valid JSON: { \"choice\": number, \"reason\": \"explanation\" }"
+                )},
+                {"role": "user", "content": (
+                    f"User: {describe_profile(profile)}\n"
+                    f"Weather: {weather}\n"
+                    f"Event: {user_event}\n"
+                    f"Candidates:\n{options}"
+                )},
+            ],
+        )
+    prompt_encoder.record_usage("hybrid", resp)
+    answer = json.loads(resp.choices[0].message.content)
+    try:
+        choice = min(max(int(answer.get("choice", 0)), 0), len(candidates) - 1)
+    except (TypeError, ValueError):
+        choice = 0
+    return {"items": candidates[choice]["items"], "reason": answer.get("reason") or candidates[choice]["reason"],
+            "mode": "hybrid"}
+
+
+def outfit_request(remix: bool = False) -> tuple:
+    """
+    (body, wardrobe) of an outfit or remix request. Raises ValueError when
+    malformed, so bad input is a 400 rather than an error halfway through.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    original = (data.get("original_outfit") or {}) if remix else {}
+    if not isinstance(original, dict):
+        raise ValueError("original_outfit must be an object")
+    wardrobe = request_wardrobe(data)
+    outfit_engine.check_inputs(wardrobe, original.get("items") or [])
+    return data, wardrobe
+
+
+def local_fallback(data, remix: bool = False):
+    """
+    Local engine answer used when the AI call fails, or None if there is nothing to offer.
+    """
+    if not isinstance(data, dict):
+        return None
+    exclude = (data.get("original_outfit") or {}).get("items", []) if remix else ()
+    try:
+        result = local_outfit(request_wardrobe(data), data.get("weather", "Unknown"), load_profile(),
+                              (data.get("user") or {}).get("event", "General Day"), exclude)
+    except Exception as e:
+        print(e)
+        metrics.ERRORS.inc(where="local_fallback")
+        return None
+    if not result["items"]:
+        return None
+    result["fallback"] = True
+    return result
 
 
 # --- PAGES ---
 
-@app.route("/")
+@bp.route("/")
 def home():
     return render_template("home.html", page="home", profile=load_profile())
 
 
-@app.route("/wardrobe")
+@bp.route("/wardrobe")
 def wardrobe():
     return render_template("wardrobe.html", page="wardrobe")
 
 
-@app.route("/wardrobe/item/<item_id>")
+@bp.route("/wardrobe/item/<item_id>")
 def wardrobe_item(item_id):
     return render_template("wardrobe_item.html", page="wardrobe", view="wardrobe-item", item_id=item_id)
 
 
-@app.route("/chat")
+@bp.route("/chat")
 def chat():
     return render_template("chat.html", page="chat")
 
 
-@app.route("/profile")
+@bp.route("/profile")
 def profile():
     return render_template("profile.html", page="profile", view="profile-overview", profile=load_profile())
 
 
-@app.route("/profile/basic")
+@bp.route("/profile/basic")
 def profile_basic():
     return render_template("profile_basic.html", page="profile", view="profile-basic", profile=load_profile())
 
 
-@app.route("/profile/parameters")
+@bp.route("/profile/parameters")
 def profile_parameters():
     return render_template("profile_params.html", page="profile", view="profile-params", profile=load_profile())
 
 
 # --- API ---
 
-@app.route("/api/profile", methods=["GET", "POST"])
+@bp.route("/api/profile", methods=["GET", "POST"])
 def api_profile():
     if request.method == "GET":
         return jsonify(load_profile())
 
     data = request.get_json() or {}
-    profile = load_profile()
 
     # Список всех разрешенных полей
     allowed_keys = ["name", "email", "city", "about", "gender", "height", "weight", "body_type", "skin_tone", "style"]
 
-    for key in allowed_keys:
-        if key in data:
-            profile[key] = str(data[key]).strip()
+    def apply(profile):
+        for key in allowed_keys:
+            if key in data:
+                profile[key] = str(data[key]).strip()
+        return profile
 
-    save_profile(profile)
+    try:
+        profile = update_profile(apply)
+    except storage.StorageError as e:
+        print(e)
+        metrics.ERRORS.inc(where="api_profile")
+        return jsonify({"error": "Profile storage is corrupt"}), 500
     return jsonify(profile)
 
 
-@app.route("/api/weather")
+# --- WARDROBE ---
+
+def etag_json(payload, etag: str):
+    """
+    JSON response with a weak ETag; answers 304 when the client already has it.
+    The payload is the requesting user's, so shared caches must key on who asks.
+    """
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+    else:
+        resp = jsonify(payload)
+    resp.set_etag(etag, weak=True)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.update((users.USER_HEADER, "Cookie"))
+    return resp
+
+
+@bp.route("/api/wardrobe", methods=["GET"])
+def api_wardrobe_list():
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    wardrobe = current_user().wardrobe
+    version = wardrobe.version()
+    etag = f"wardrobe-{g.user_id}-{version}-{offset}-{limit}"
+    if request.if_none_match.contains_weak(etag):
+        return etag_json(None, etag)
+    items, total = wardrobe.page(offset, limit)
+    return etag_json({"items": items, "total": total, "offset": offset, "limit": limit, "version": version}, etag)
+
+
+@bp.route("/api/wardrobe", methods=["POST"])
+def api_wardrobe_add():
+    """
+    Adds one item, or several with {"items": [...]}. An inline imageDataUrl
+    is moved to the blob store and replaced by imageUrl.
+    """
+    data = request.get_json(silent=True)
+    wardrobe = current_user().wardrobe
+    try:
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        if isinstance(data.get("items"), list):
+            return jsonify({"items": wardrobe.add_many(data["items"])}), 201
+        return jsonify(wardrobe.add(data)), 201
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@bp.route("/api/wardrobe/worn", methods=["POST"])
+def api_wardrobe_worn():
+    data = request.get_json() or {}
+    ids = [str(i) for i in data.get("ids", [])]
+    when = data.get("when") or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    return jsonify({"updated": current_user().wardrobe.mark_worn(ids, when)})
+
+
+@bp.route("/api/wardrobe/<item_id>", methods=["GET"])
+def api_wardrobe_item(item_id):
+    wardrobe = current_user().wardrobe
+    item = wardrobe.get(item_id)
+    if item is None: return jsonify({"error": "Not found"}), 404
+    return etag_json(item, f"wardrobe-{g.user_id}-{wardrobe.version()}-{item_id}")
+
+
+@bp.route("/api/wardrobe/<item_id>", methods=["PUT"])
+def api_wardrobe_update(item_id):
+    try:
+        item = current_user().wardrobe.update(item_id, request.get_json() or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(item) if item is not None else (jsonify({"error": "Not found"}), 404)
+
+
+@bp.route("/api/wardrobe/<item_id>", methods=["DELETE"])
+def api_wardrobe_delete(item_id):
+    current_user().wardrobe.delete(item_id)
+    return jsonify({"status": "deleted"})
+
+
+@bp.route("/blobs/<blob_id>")
+def get_blob(blob_id):
+    blobs = services().blobs
+    path = blobs.path(blob_id)
+    if path is None: return jsonify({"error": "Not found"}), 404
+    # Content-addressed: the bytes behind a blob id never change
+    resp = send_file(path, mimetype=blobs.mime_type(blob_id), etag=blob_id.split(".")[0],
+                     conditional=True, max_age=31536000)
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
+
+
+@bp.route("/api/weather")
 def api_weather():
     city = (request.args.get("city") or "").strip()
     if not city: return jsonify({"error": "City required"}), 400
     try:
-        geo = requests.get("https://geocoding-api.open-meteo.com/v1/search",
-                           params={"name": city, "count": 1, "language": "en", "format": "json"}, timeout=3).json()
-        if not geo.get("results"): return jsonify({"error": "City not found"}), 404
-        loc = geo["results"][0]
-        w = requests.get("https://api.open-meteo.com/v1/forecast",
-                         params={"latitude": loc["latitude"], "longitude": loc["longitude"], "current_weather": True},
-                         timeout=3).json().get("current_weather", {})
-        return jsonify({"city": loc["name"], "country": loc.get("country", ""), "temperature": w.get("temperature"),
-                        "windspeed": w.get("windspeed")})
-    except:
+        return jsonify(services().weather.get_weather(city))
+    except weather.CityNotFound:
+        return jsonify({"error": "City not found"}), 404
+    except weather.WeatherError as e:
+        print(e)
+        metrics.ERRORS.inc(where="api_weather")
         return jsonify({"error": "Weather service unavailable"}), 503
 
 
-@app.route("/api/recognize", methods=["POST"])
+RECOGNIZE_PROMPT = (
+    "Analyze this image. Return JSON: { \"is_clothing\": boolean, \"type\": string, \"style\": string, "
+    "\"season\": string, \"warmth\": string, \"brand\": string, \"tags\": [] }"
+)
+
+
+def recognize_call(img_url: str) -> dict:
+    """
+    chat.completions.create kwargs for recognizing one image.
+    """
+    return {
+        "model": "gpt-4o-mini",
+        "response_format": {"type": "json_object"},
+        "messages": [{"role": "user", "content": [{"type": "text", "text": RECOGNIZE_PROMPT},
+                                                  {"type": "image_url",
+                                                   "image_url": {"url": img_url, "detail": VISION_DETAIL}}]}],
+    }
+
+
+def image_hash(img_url: str) -> str:
+    """
+    sha256 of the decoded image bytes, so the same photo matches whatever the data URL header says.
+    """
+    try:
+        data, _ = decode_data_url(img_url)
+    except ValueError:
+        data = str(img_url).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def near_duplicate_groups(normalized: dict) -> list:
+    """
+    Groups {key: normalized image} whose perceptual hashes are within
+    NEAR_DUPLICATE_BITS of a group's first image. Returns lists of keys.
+    """
+    groups = []
+    for key, image in normalized.items():
+        phash = image["phash"]
+        for group in groups:
+            first = normalized[group[0]]["phash"]
+            if phash and first and image_pipeline.hash_distance(phash, first) <= image_pipeline.NEAR_DUPLICATE_BITS:
+                group.append(key)
+                break
+        else:
+            groups.append([key])
+    return groups
+
+
+@bp.route("/api/recognize", methods=["POST"])
+@idempotent
 def api_recognize():
     try:
         data = request.get_json()
         img_url = data.get("imageDataUrl")
         if not img_url: return jsonify({"error": "No image"}), 400
-        prompt = "Analyze this image. Return JSON: { \"is_clothing\": boolean, \"type\": string, \"style\": string, \"season\": string, \"warmth\": string, \"brand\": string, \"tags\": [] }"
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            response_format={"type": "json_object"},
-            messages=[{"role": "user", "content": [{"type": "text", "text": prompt},
-                                                   {"type": "image_url", "image_url": {"url": img_url}}]}]
-        )
-        return jsonify(json.loads(resp.choices[0].message.content))
+        key = image_hash(img_url)
+        cache = services().recognize_cache
+        cached = cache.get(key)
+        if cached is not None:
+            return jsonify(cached)
+        try:
+            image = image_pipeline.normalize_data_url(img_url)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            print(e)
+            metrics.ERRORS.inc(where="image_pipeline")
+            return jsonify({"error": "Image processing failed"}), 503
+        phash_key = f"phash:{image['phash']}" if image["phash"] else None
+        cached = cache.get(phash_key) if phash_key else None
+        if cached is None:
+            with metrics.stage("llm.recognize"):
+                resp = services().llm.chat.completions.create(**recognize_call(image["data_url"]))
+            prompt_encoder.record_usage("recognize", resp)
+            cached = json.loads(resp.choices[0].message.content)
+            if phash_key:
+                cache.set(phash_key, cached)
+        cache.set(key, cached)
+        return jsonify(cached)
     except Exception as e:
         print(e)
+        metrics.ERRORS.inc(where="api_recognize")
         return jsonify({"error": "AI Error"}), 500
 
 
-@app.route("/api/outfit", methods=["POST"])
+@bp.route("/api/recognize/batch", methods=["POST"])
+def api_recognize_batch():
+    """
+    Recognizes many images: {"images": [dataUrl | {"id", "imageDataUrl"}, ...]}.
+    Streams NDJSON, one line per image as soon as its result is known:
+    {"index", "id", "hash", "result", "cached"} or {"index", "id", "error"}.
+    Exact and near-duplicate images (same photo re-encoded or resized) share
+    one LLM call; previously recognized ones cost none.
+    """
+    images = (request.get_json(silent=True) or {}).get("images")
+    if not isinstance(images, list) or not images: return jsonify({"error": "No images"}), 400
+    if len(images) > RECOGNIZE_BATCH_MAX:
+        return jsonify({"error": f"At most {RECOGNIZE_BATCH_MAX} images per batch"}), 413
+
+    entries = []
+    for index, image in enumerate(images):
+        img_url = image.get("imageDataUrl") if isinstance(image, dict) else image
+        item_id = image.get("id") if isinstance(image, dict) else None
+        entries.append((index, item_id, img_url if isinstance(img_url, str) and img_url else None))
+    cache = services().recognize_cache
+    client = services().async_llm
+
+    def lines(keys, by_hash, **payload):
+        for key in keys:
+            for index, item_id, _ in by_hash[key]:
+                yield json.dumps({"index": index, "id": item_id, "hash": key, **payload}, ensure_ascii=False) + "\n"
+
+    def generate():
+        by_hash = {}
+        for index, item_id, img_url in entries:
+            if img_url is None:
+                yield json.dumps({"index": index, "id": item_id, "error": "No image"}) + "\n"
+                continue
+            by_hash.setdefault(image_hash(img_url), []).append((index, item_id, img_url))
+
+        pending = []
+        for key in by_hash:
+            cached = cache.get(key)
+            if cached is None:
+                pending.append(key)
+            else:
+                yield from lines([key], by_hash, result=cached, cached=True)
+
+        # Decode/downscale the rest in the process pool, then fold near-duplicates together
+        normalized = {}
+        try:
+            images = image_pipeline.normalize_data_urls([by_hash[k][0][2] for k in pending])
+        except Exception as e:
+            print(e)
+            metrics.ERRORS.inc(where="image_pipeline")
+            images = [ValueError("Image processing failed")] * len(pending)
+        for key, image in zip(pending, images):
+            if isinstance(image, ValueError):
+                yield from lines([key], by_hash, error=str(image))
+            else:
+                normalized[key] = image
+
+        groups = []
+        for group in near_duplicate_groups(normalized):
+            phash = normalized[group[0]]["phash"]
+            cached = cache.get(f"phash:{phash}") if phash else None
+            if cached is None:
+                groups.append(group)
+                continue
+            for key in group:
+                cache.set(key, cached)
+            yield from lines(group, by_hash, result=cached, cached=True)
+
+        calls = [recognize_call(normalized[group[0]]["data_url"]) for group in groups]
+        completed = outbound.complete_as_completed(calls, concurrency=RECOGNIZE_CONCURRENCY, client=client)
+        with closing(completed):  # a client that goes away cancels the calls still running
+            for n, resp in completed:
+                group = groups[n]
+                try:
+                    if isinstance(resp, Exception):
+                        raise resp
+                    prompt_encoder.record_usage("recognize", resp)
+                    result = json.loads(resp.choices[0].message.content)
+                except Exception as e:
+                    print(e)
+                    metrics.ERRORS.inc(where="api_recognize_batch")
+                    yield from lines(group, by_hash, error="AI Error")
+                    continue
+                phash = normalized[group[0]]["phash"]
+                for key in group + ([f"phash:{phash}"] if phash else []):
+                    cache.set(key, result)
+                yield from lines(group, by_hash, result=result, cached=False)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@bp.route("/api/outfit", methods=["POST"])
+@idempotent
 def api_outfit():
     try:
-        data = request.get_json()
-        wardrobe = data.get("wardrobe", [])
+        data, wardrobe = outfit_request()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
         weather = data.get("weather", "Unknown")
         user_event = data.get("user", {}).get("event", "General Day")
 
         profile = load_profile()
+        user_desc = describe_profile(profile)
 
-        user_desc = (
-            f"Name: {profile.get('name')}. "
-            f"Gender: {profile.get('gender')}. "
-            f"Body: {profile.get('height')}cm, {profile.get('weight')}kg, {profile.get('body_type')} build. "
-            f"Skin Tone: {profile.get('skin_tone')}. "
-            f"Style Preference: {profile.get('style')}."
-        )
+        mode = outfit_mode(data)
+        if mode == "local":
+            return jsonify(local_outfit(wardrobe, weather, profile, user_event))
 
         system_prompt = (
             "You are an expert AI Personal Stylist. Create ONE complete outfit - a single cohesive look.\n\n"
@@ -358,23 +894,35 @@ def api_outfit():
         )
 
         # Optimize wardrobe data to reduce tokens
-        optimized_wardrobe = optimize_wardrobe(wardrobe, max_items=50)
-        
-        user_content = (
+        optimized_wardrobe = optimize_wardrobe(wardrobe, weather=weather, profile=profile, event=user_event)
+
+        # Page refreshes with the same inputs reuse the previous answer; "cache": false forces a fresh one
+        cache_key = response_cache.make_key(
+            f"outfit:{mode}", optimized_wardrobe, {k: profile.get(k) for k in PROFILE_PROMPT_FIELDS}, weather,
+            user_event,
+        )
+        if data.get("cache", True):
+            cached = services().outfit_cache.get(cache_key)
+            if cached is not None:
+                return jsonify({**cached, "cached": True})
+
+        user_head = (
             f"Create ONE outfit (not variations or options) for:\n"
             f"User: {user_desc}\n"
             f"Weather: {weather}\n"
             f"Event: {user_event}\n"
-            f"Wardrobe: {json.dumps(optimized_wardrobe)}"
         )
 
-        resp = client.chat.completions.create(
-            model="gpt-4o",
-            response_format={"type": "json_object"},
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_content}]
-        )
-        
-        result = json.loads(resp.choices[0].message.content)
+        if mode == "hybrid":
+            result = hybrid_outfit(wardrobe, weather, profile, user_event)
+        else:
+            messages, id_map, estimated = wardrobe_messages(system_prompt, user_head, optimized_wardrobe)
+            with metrics.stage("llm.outfit"):
+                resp = services().llm.chat.completions.create(model="gpt-4o", messages=messages,
+                                                              response_format={"type": "json_object"})
+            prompt_encoder.record_usage("outfit", resp, estimated)
+            result = json.loads(resp.choices[0].message.content)
+            result["items"] = prompt_encoder.decode_ids(result.get("items"), id_map)
         outfit_items = result.get("items", [])
         
         # STRICT VALIDATION: Fix invalid outfits automatically
@@ -384,43 +932,48 @@ def api_outfit():
         if not is_valid:
             result["items"] = filtered_items
             result["validation_applied"] = True
+            metrics.OUTFIT_FIXES.inc(endpoint="outfit")
             result["original_conflicts"] = conflicts
-        
+
+        services().outfit_cache.set(cache_key, result)
         return jsonify(result)
     except Exception as e:
         print(e)
-        return jsonify({"error": "AI Error"}), 500
+        metrics.ERRORS.inc(where="api_outfit")
+        fallback = local_fallback(request.get_json(silent=True))
+        return jsonify(fallback) if fallback else (jsonify({"error": "AI Error"}), 500)
 
 
-@app.route("/api/outfit/remix", methods=["POST"])
+@bp.route("/api/outfit/remix", methods=["POST"])
+@idempotent
 def api_outfit_remix():
     """
     Regenerates outfit recommendations using different wardrobe items
     while preserving the original outfit's style and characteristics.
     """
     try:
-        data = request.get_json()
-        wardrobe = data.get("wardrobe", [])
+        data, wardrobe = outfit_request(remix=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
         weather = data.get("weather", "Unknown")
         user_event = data.get("user", {}).get("event", "General Day")
         original_outfit = data.get("original_outfit", {})  # Previous outfit for style reference
 
         profile = load_profile()
-
-        user_desc = (
-            f"Name: {profile.get('name')}. "
-            f"Gender: {profile.get('gender')}. "
-            f"Body: {profile.get('height')}cm, {profile.get('weight')}kg, {profile.get('body_type')} build. "
-            f"Skin Tone: {profile.get('skin_tone')}. "
-            f"Style Preference: {profile.get('style')}."
-        )
+        user_desc = describe_profile(profile)
 
         # Extract style characteristics from original outfit if available
         original_reason = original_outfit.get("reason", "casual") if original_outfit else ""
         original_items = original_outfit.get("items", []) if original_outfit else []
-        
+
+        mode = outfit_mode(data)
+        if mode == "local":
+            return jsonify(local_outfit(wardrobe, weather, profile, user_event, exclude=original_items))
+
         system_prompt = (
-            "You are an expert AI Personal Stylist. Create ONE complete outfit - a fresh remix while preserving the original style.\n\n"
+            "You are an expert AI Personal Stylist. Create ONE complete outfit - a fresh remix while preserving "
+            "the original style.\n\n"
             "ABSOLUTE RULES (MUST FOLLOW EXACTLY):\n"
             "• AVOID using items from the original outfit (create a different combination)\n"
             "• NEVER include multiple bottoms (NO jeans + pants, NO skirt + shorts, etc.)\n"
@@ -448,25 +1001,39 @@ def api_outfit_remix():
         )
 
         # Optimize wardrobe data to reduce tokens
-        optimized_wardrobe = optimize_wardrobe(wardrobe, max_items=50)
-        
-        user_content = (
+        optimized_wardrobe = optimize_wardrobe(wardrobe, weather=weather, profile=profile, event=user_event)
+
+        # A remix is expected to differ each time, so the cache is bypassed unless "cache": true
+        use_cache = bool(data.get("cache", False))
+        cache_key = response_cache.make_key(
+            f"remix:{mode}", optimized_wardrobe, {k: profile.get(k) for k in PROFILE_PROMPT_FIELDS}, weather,
+            user_event,
+            extra={"items": sorted(map(str, original_items)), "reason": original_reason},
+        )
+        if use_cache:
+            cached = services().outfit_cache.get(cache_key)
+            if cached is not None:
+                return jsonify({**cached, "cached": True})
+
+        user_head = (
             f"Create ONE fresh outfit (remix) that:\n"
-            f"- Uses DIFFERENT items than: {original_items}\n"
+            f"- Uses DIFFERENT items than: {prompt_encoder.short_ids(original_items, optimized_wardrobe)}\n"
             f"- Maintains the style of: {original_reason}\n\n"
             f"User: {user_desc}\n"
             f"Weather: {weather}\n"
             f"Event: {user_event}\n"
-            f"Wardrobe: {json.dumps(optimized_wardrobe)}"
         )
 
-        resp = client.chat.completions.create(
-            model="gpt-4o",
-            response_format={"type": "json_object"},
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_content}]
-        )
-        
-        result = json.loads(resp.choices[0].message.content)
+        if mode == "hybrid":
+            result = hybrid_outfit(wardrobe, weather, profile, user_event, exclude=original_items)
+        else:
+            messages, id_map, estimated = wardrobe_messages(system_prompt, user_head, optimized_wardrobe)
+            with metrics.stage("llm.remix"):
+                resp = services().llm.chat.completions.create(model="gpt-4o", messages=messages,
+                                                              response_format={"type": "json_object"})
+            prompt_encoder.record_usage("remix", resp, estimated)
+            result = json.loads(resp.choices[0].message.content)
+            result["items"] = prompt_encoder.decode_ids(result.get("items"), id_map)
         outfit_items = result.get("items", [])
         
         # STRICT VALIDATION: Fix invalid outfits automatically
@@ -476,54 +1043,260 @@ def api_outfit_remix():
         if not is_valid:
             result["items"] = filtered_items
             result["validation_applied"] = True
+            metrics.OUTFIT_FIXES.inc(endpoint="remix")
             result["original_conflicts"] = conflicts
-        
+
+        if use_cache:
+            services().outfit_cache.set(cache_key, result)
         return jsonify(result)
     except Exception as e:
         print(e)
-        return jsonify({"error": "AI Error"}), 500
+        metrics.ERRORS.inc(where="api_outfit_remix")
+        fallback = local_fallback(request.get_json(silent=True), remix=True)
+        return jsonify(fallback) if fallback else (jsonify({"error": "AI Error"}), 500)
+
+
+# --- WEEK PLANNER ---
+
+WEEK_MAX_DAYS = int(os.getenv("WEEK_MAX_DAYS", "14"))
+
+WEEK_SYSTEM_PROMPT = (
+    "You are an expert AI Personal Stylist. Plan ONE complete outfit for EACH day listed.\n\n"
+    "ABSOLUTE RULES PER OUTFIT (MUST FOLLOW EXACTLY):\n"
+    "• EXACTLY 1 bottom and EXACTLY 1 pair of shoes\n"
+    "• 1-2 tops, 0-1 outerwear item, accessories as desired\n\n"
+    "ACROSS THE PLAN:\n"
+    "• NEVER use the same pair of shoes on two days\n"
+    "• Vary the other pieces where the wardrobe allows\n"
+    "• Fit each day's weather and event, the user's body type, skin tone and style\n\n"
+    "RESPONSE:\n"
+    "Return ONLY valid JSON: "
+    "{ \"outfits\": [ { \"day\": 1, \"items\": [id1, id2, ...], \"reason\": \"explanation\" }, ... ] } "
+    "with one entry per day, in order."
+)
+
+
+def week_slots(data: dict) -> list:
+    """
+    Normalized [{"date", "weather", "event"}] from the request; raises ValueError when malformed.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    slots = data.get("slots")
+    if not isinstance(slots, list) or not slots:
+        raise ValueError("slots must be a non-empty list")
+    if len(slots) > WEEK_MAX_DAYS:
+        raise ValueError(f"At most {WEEK_MAX_DAYS} slots per plan")
+    if not all(isinstance(slot, dict) for slot in slots):
+        raise ValueError("Each slot must be an object")
+    default_event = (data.get("user") or {}).get("event") or "General Day"
+    return [{"date": str(slot.get("date") or ""),
+             "weather": slot.get("weather") or data.get("weather") or "Unknown",
+             "event": slot.get("event") or default_event} for slot in slots]
+
+
+def week_wardrobe(wardrobe: list, slots: list, profile: dict) -> list:
+    """
+    Prompt items for a plan: each day's optimize_wardrobe selection, interleaved
+    so every day's best items come first (and survive fit_wardrobe), without duplicates.
+    """
+    selections = [optimize_wardrobe(wardrobe, weather=slot["weather"], profile=profile, event=slot["event"])
+                  for slot in slots]
+    merged, seen = [], set()
+    for rank in range(max(len(s) for s in selections)):
+        for selection in selections:
+            if rank < len(selection) and selection[rank].get("id") not in seen:
+                seen.add(selection[rank].get("id"))
+                merged.append(selection[rank])
+    return merged
+
+
+def finish_week(wardrobe: list, slots: list, profile: dict, outfits: list, mode: str) -> dict:
+    """
+    Validates every day's outfit, then swaps shoes worn on an earlier day.
+    """
+    days = []
+    for slot, outfit in zip(slots, outfits):
+        day = {**slot, "items": list(outfit.get("items") or []), "reason": outfit.get("reason") or ""}
+        is_valid, conflicts, filtered_items = validate_outfit(wardrobe, day["items"])
+        if not is_valid:
+            day["items"] = filtered_items
+            day["validation_applied"] = True
+            metrics.OUTFIT_FIXES.inc(endpoint="week")
+            day["original_conflicts"] = conflicts
+        days.append(day)
+
+    swaps = outfit_engine.replace_repeats(wardrobe, [day["items"] for day in days], slots, profile)
+    for day, old, new in swaps:
+        days[day].setdefault("replaced", []).append({"old": old, "new": new})
+    return {"outfits": days, "mode": mode}
+
+
+@bp.route("/api/outfit/week", methods=["POST"])
+@idempotent
+def api_outfit_week():
+    """
+    Plans one outfit per slot of {"slots": [{"date", "weather", "event"}, ...]}
+    with a single LLM call: the rules, profile and wardrobe table are sent once
+    for the whole plan instead of once per day. Shoes are not repeated across
+    days and every outfit goes through validate_outfit. "mode": "local" plans
+    with the local engine; hybrid is served like llm.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        slots = week_slots(data)
+        outfit_engine.check_inputs(request_wardrobe(data))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        wardrobe = request_wardrobe(data)
+        profile = load_profile()
+        if outfit_mode(data) == "local":
+            with metrics.stage("outfit_engine"):
+                outfits = outfit_engine.plan(wardrobe, slots, profile)
+            return jsonify(finish_week(wardrobe, slots, profile, outfits, "local"))
+
+        candidates = week_wardrobe(wardrobe, slots, profile)
+        cache_key = response_cache.make_key(
+            "week:llm", candidates, {k: profile.get(k) for k in PROFILE_PROMPT_FIELDS}, "", "",
+            extra=[[s["date"], response_cache.weather_bucket(s["weather"]), " ".join(str(s["event"]).lower().split())]
+                   for s in slots],
+        )
+        if data.get("cache", True):
+            cached = services().outfit_cache.get(cache_key)
+            if cached is not None:
+                return jsonify({**cached, "cached": True})
+
+        days = "\n".join(
+            f"Day {n}{' (' + s['date'] + ')' if s['date'] else ''}: weather {s['weather']}; event {s['event']}"
+            for n, s in enumerate(slots, start=1)
+        )
+        user_head = f"Plan {len(slots)} outfits, one per day, for:\nUser: {describe_profile(profile)}\n{days}\n"
+        messages, id_map, estimated = wardrobe_messages(WEEK_SYSTEM_PROMPT, user_head, candidates)
+        with metrics.stage("llm.week"):
+            resp = services().llm.chat.completions.create(model="gpt-4o", messages=messages,
+                                                          response_format={"type": "json_object"})
+        prompt_encoder.record_usage("week", resp, estimated)
+        answer = json.loads(resp.choices[0].message.content)
+
+        by_day = {}
+        for n, entry in enumerate(answer.get("outfits") or [], start=1):
+            if isinstance(entry, dict):
+                try:
+                    by_day.setdefault(int(entry.get("day", n)), entry)
+                except (TypeError, ValueError):
+                    by_day.setdefault(n, entry)
+        outfits = []
+        for n, slot in enumerate(slots, start=1):
+            entry = by_day.get(n)
+            items = prompt_encoder.decode_ids(entry.get("items"), id_map) if entry else []
+            if not items:
+                # Day missing from the answer: fill it locally rather than failing the whole plan
+                outfits.append(local_outfit(wardrobe, slot["weather"], profile, slot["event"]))
+            else:
+                outfits.append({"items": items, "reason": entry.get("reason") or ""})
+
+        result = finish_week(wardrobe, slots, profile, outfits, "llm")
+        services().outfit_cache.set(cache_key, result)
+        return jsonify(result)
+    except Exception as e:
+        print(e)
+        metrics.ERRORS.inc(where="api_outfit_week")
+        try:
+            wardrobe, profile = request_wardrobe(data), load_profile()
+            result = finish_week(wardrobe, slots, profile, outfit_engine.plan(wardrobe, slots, profile), "local")
+        except Exception as e:
+            print(e)
+            metrics.ERRORS.inc(where="api_outfit_week")
+            return jsonify({"error": "AI Error"}), 500
+        result["fallback"] = True
+        return jsonify(result)
+
+
+def cache_samples(app_services: Services) -> list:
+    """
+    Cache counters for /metrics, read from the caches' own stats at scrape time.
+    Caches no request has used yet are left out rather than built (and their files created) by a scrape.
+    """
+    caches = {name: built.stats() for name, built in (
+        ("users", app_services.built("USER_SPACES")), ("outfit", app_services.built("OUTFIT_CACHE")),
+        ("recognize", app_services.built("RECOGNIZE_CACHE")), ("idempotency", app_services.built("IDEMPOTENCY")),
+    ) if built is not None}
+    weather_service = app_services.built("WEATHER")
+    weather_stats = weather_service.stats() if weather_service is not None else None
+    if weather_stats is not None:
+        caches.update(geocode=weather_stats["geocode"], forecast=weather_stats["forecast"])
+    samples = []
+    for name, stats in caches.items():
+        for result in ("hits", "misses", "stale_hits", "disk_hits"):
+            if result in stats:
+                samples.append(("cache_requests_total", "counter", "Cache lookups by result",
+                                {"cache": name, "result": result}, stats[result]))
+        if "size" in stats:
+            samples.append(("cache_entries", "gauge", "Entries held in memory", {"cache": name}, stats["size"]))
+    if weather_stats is not None:
+        samples.append(("weather_coalesced_requests_total", "counter",
+                        "Weather lookups served by an in-flight request", {}, weather_stats["coalesced"]))
+    for result in ("coalesced", "replayed", "rejected") if "idempotency" in caches else ():
+        samples.append(("idempotent_requests_total", "counter",
+                        "POSTs answered from an in-flight or stored result, or rejected for a reused key",
+                        {"result": result}, caches["idempotency"][result]))
+    return samples
+
+
+@bp.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@bp.route("/api/cache/stats")
+def api_cache_stats():
+    app_services = services()
+    return jsonify({"profile": current_user().profile.stats(), "users": app_services.user_spaces.stats(),
+                    "weather": app_services.weather.stats(), "outfit": app_services.outfit_cache.stats(),
+                    "recognize": app_services.recognize_cache.stats(), "idempotency": app_services.idempotency.stats(),
+                    "tokens": prompt_encoder.usage_stats()})
 
 
 # --- CHATS ---
 
-@app.route("/api/chats", methods=["GET"])
+CHAT_PAGE_MAX = 200
+
+
+@bp.route("/api/chats", methods=["GET"])
 def get_chats():
-    chats = load_chats()
-    summary = []
-    for cid, data in chats.items():
-        summary.append({"id": cid, "title": data.get("title", "New Conversation"), "last_ts": data.get("last_ts", 0)})
-    summary.sort(key=lambda x: x["last_ts"], reverse=True)
-    return jsonify(summary)
+    """
+    Chat summaries, most recent first; ?limit=&offset= for a page. The total is in X-Total-Count.
+    """
+    limit = request.args.get("limit", type=int)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    store = current_user().chats
+    chats = store.list_chats(limit=None if limit is None else min(max(limit, 1), CHAT_PAGE_MAX), offset=offset)
+    resp = jsonify(chats)
+    resp.headers["X-Total-Count"] = str(store.chat_count())
+    return resp
 
 
-@app.route("/api/chats/<chat_id>", methods=["GET"])
+@bp.route("/api/chats/<chat_id>", methods=["GET"])
 def get_chat_history(chat_id):
-    chats = load_chats()
-    return jsonify(chats.get(chat_id, {})) if chat_id in chats else (jsonify({"error": "Not found"}), 404)
+    """
+    The newest `limit` messages (default 50) in chronological order; pass the
+    returned next_before as ?before= to get the page before them.
+    """
+    limit = min(max(request.args.get("limit", 50, type=int), 1), CHAT_PAGE_MAX)
+    chat = current_user().chats.message_page(chat_id, before=request.args.get("before", type=int), limit=limit)
+    return jsonify(chat) if chat is not None else (jsonify({"error": "Not found"}), 404)
 
 
-@app.route("/api/chats", methods=["POST"])
+@bp.route("/api/chats", methods=["POST"])
 def create_chat():
-    chats = load_chats()
-    new_id = str(uuid.uuid4())
-    chats[new_id] = {"title": "New Chat", "messages": [], "last_ts": time.time()}
-    save_chats(chats)
-    return jsonify({"id": new_id})
-
-
-@app.route("/api/chats/<chat_id>/message", methods=["POST"])
-def send_chat_message(chat_id):
-    chats = load_chats()
-    if chat_id not in chats: return jsonify({"error": "Not found"}), 404
-
-    user_text = request.get_json().get("message", "").strip()
-    if not user_text: return jsonify({"error": "Empty"}), 400
+    return jsonify({"id": current_user().chats.create_chat("New Chat")})
 
-    profile = load_profile()
-    chats[chat_id]["messages"].append({"role": "user", "content": user_text})
 
+def chat_system_message(profile: dict) -> dict:
     # AI Context injection with strict fashion-focused prompt
-    system_msg = {
+    return {
         "role": "system",
         "content": (
             f"You are a helpful fashion assistant that specializes in clothing and style advice.\n\n"
@@ -540,33 +1313,209 @@ def send_chat_message(chat_id):
             f"✓ Seasonal trends and occasion-appropriate clothing\n\n"
             f"OUT OF SCOPE - Politely decline and redirect:\n"
             f"✗ Questions NOT about fashion or clothing\n"
-            f"Respond with: 'I focus on fashion and clothing advice. Ask me about outfits, styling tips, or your wardrobe!'\n\n"
+            f"Respond with: 'I focus on fashion and clothing advice. Ask me about outfits, styling tips, "
+            f"or your wardrobe!'\n\n"
             f"TONE: Be conversational, helpful, and friendly. Keep responses natural and not overly formal."
         )
     }
 
-    context = chats[chat_id]["messages"][-10:]
+
+def cached_chat_system_message() -> dict:
+    """
+    chat_system_message for the current profile, rendered once per profile version.
+    """
+    profile = load_profile()
+    space = current_user()
+    version = space.profile.version
+    if space.chat_system[0] != version:
+        space.chat_system = (version, chat_system_message(profile))
+    return space.chat_system[1]
+
+
+def chat_context(chat_id: str, user_text: str) -> list:
+    """
+    Messages sent to the model for the next turn: system prompt, summary of
+    older turns and as much recent history as fits CHAT_CONTEXT_TOKENS.
+    """
+    return current_user().chat_window.build(chat_id, cached_chat_system_message(), user_text)
+
+
+def save_chat_exchange(chat_id: str, user_text: str, reply: str) -> None:
+    space = current_user()
+    title = user_text[:30] + "..." if space.chats.message_count(chat_id) == 0 else None
+    space.chats.append_messages(
+        chat_id, [{"role": "user", "content": user_text}, {"role": "assistant", "content": reply}], title=title
+    )
+    space.chat_window.refresh_summary(chat_id, cached_chat_system_message())
+
+
+@bp.route("/api/chats/<chat_id>/message", methods=["POST"])
+@idempotent
+def send_chat_message(chat_id):
+    if not current_user().chats.exists(chat_id): return jsonify({"error": "Not found"}), 404
+
+    user_text = request.get_json().get("message", "").strip()
+    if not user_text: return jsonify({"error": "Empty"}), 400
+
     try:
-        resp = client.chat.completions.create(model="gpt-4o-mini", messages=[system_msg] + context)
+        with metrics.stage("chat_context"):
+            messages = chat_context(chat_id, user_text)
+        with metrics.stage("llm.chat"):
+            resp = services().llm.chat.completions.create(model="gpt-4o-mini", messages=messages)
+        prompt_encoder.record_usage("chat", resp)
         reply = resp.choices[0].message.content
-        chats[chat_id]["messages"].append({"role": "assistant", "content": reply})
-        chats[chat_id]["last_ts"] = time.time()
-        if len(chats[chat_id]["messages"]) <= 2: chats[chat_id]["title"] = user_text[:30] + "..."
-        save_chats(chats)
+        with metrics.stage("save_chat"):
+            save_chat_exchange(chat_id, user_text, reply)
         return jsonify({"reply": reply})
+    except ChatNotFound:
+        return jsonify({"error": "Not found"}), 404
     except Exception as e:
         print(e)
+        metrics.ERRORS.inc(where="send_chat_message")
         return jsonify({"error": "AI Error"}), 500
 
 
-@app.route("/api/chats/<chat_id>", methods=["DELETE"])
+def sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@bp.route("/api/chats/<chat_id>/message/stream", methods=["POST"])
+def stream_chat_message(chat_id):
+    """
+    Same as send_chat_message, but forwards the reply as Server-Sent Events:
+    'data: {"delta": ...}' per token chunk, then 'event: done' with the full
+    reply once it has been saved (or 'event: error').
+
+    With an Idempotency-Key, a retry after the reply was saved gets it back as
+    one delta plus 'event: done'; a retry while it is still streaming is a 409.
+    """
+    store = services().idempotency
+    try:
+        key = store.request_key()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    request_fingerprint = idempotency.fingerprint()
+    if key is not None:
+        replayed = store.replay(key, request_fingerprint)
+        if replayed is not None:
+            return replayed
+
+    if not current_user().chats.exists(chat_id): return jsonify({"error": "Not found"}), 404
+
+    user_text = request.get_json().get("message", "").strip()
+    if not user_text: return jsonify({"error": "Empty"}), 400
+
+    if key is not None:
+        if not store.begin(key):
+            return store.running_response()
+        replayed = store.replay(key, request_fingerprint)  # finished in another worker meanwhile
+        if replayed is not None:
+            store.end(key)
+            return replayed
+    try:
+        with metrics.stage("chat_context"):
+            messages = chat_context(chat_id, user_text)
+    except Exception:
+        if key is not None:
+            store.end(key)
+        raise
+
+    def generate():
+        parts = []
+        try:
+            start = time.perf_counter()
+            stream = services().llm.chat.completions.create(model="gpt-4o-mini", messages=messages, stream=True,
+                                                            stream_options={"include_usage": True})
+            with closing(stream):  # a client that goes away stops the upstream stream
+                for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        prompt_encoder.record_usage("chat_stream", chunk)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        if not parts:
+                            metrics.STAGE_SECONDS.observe(time.perf_counter() - start,
+                                                          stage="llm.chat_stream.first_token")
+                        parts.append(delta)
+                        yield sse_event({"delta": delta})
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm.chat_stream")
+            reply = "".join(parts)
+            with metrics.stage("save_chat"):
+                save_chat_exchange(chat_id, user_text, reply)
+            if key is not None:
+                store.save(key, request_fingerprint, 200, "text/event-stream",
+                           sse_event({"delta": reply}) + sse_event({"reply": reply}, event="done"))
+            yield sse_event({"reply": reply}, event="done")
+        except ChatNotFound:
+            yield sse_event({"error": "Not found"}, event="error")
+        except Exception as e:
+            print(e)
+            metrics.ERRORS.inc(where="stream_chat_message")
+            yield sse_event({"error": "AI Error"}, event="error")
+        finally:
+            if key is not None:
+                store.end(key)
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    if key is not None:
+        response.call_on_close(lambda: store.end(key))  # in case the client left before the stream started
+    return response
+
+
+@bp.route("/api/chats/<chat_id>", methods=["DELETE"])
 def delete_chat(chat_id):
-    chats = load_chats()
-    if chat_id in chats:
-        del chats[chat_id]
-        save_chats(chats)
+    current_user().chats.delete_chat(chat_id)
     return jsonify({"status": "deleted"})
 
 
+# --- APP FACTORY ---
+
+def create_app(config: dict = None) -> Flask:
+    """
+    Builds the app. Settings come from the environment (and .env) unless
+    config overrides them. config can also inject the objects Services would
+    otherwise build (LLM_CLIENT, ASYNC_LLM_CLIENT, HTTP_SESSION, WEATHER,
+    BLOB_STORE, USER_SPACES, OUTFIT_CACHE, RECOGNIZE_CACHE, IDEMPOTENCY), e.g.
+    a fake LLM client in tests.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        USERS_DIR=os.getenv("USERS_DIR", "users"),
+        BLOBS_DIR=os.getenv("BLOBS_DIR", "blobs"),
+        # Requests without a user id get this user instead of a new one; "local" serves the single-user
+        # files next to app.py to everyone, "" gives every visitor their own data
+        DEFAULT_USER_ID=os.getenv("DEFAULT_USER_ID", ""),
+        OUTFIT_CACHE_TTL=float(os.getenv("OUTFIT_CACHE_TTL", "3600")),
+        OUTFIT_CACHE_DB=os.getenv("OUTFIT_CACHE_DB") or None,
+        RECOGNIZE_CACHE_TTL=float(os.getenv("RECOGNIZE_CACHE_TTL", str(30 * 24 * 3600))),
+        RECOGNIZE_CACHE_DB=os.getenv("RECOGNIZE_CACHE_DB", "recognitions.db"),
+        IDEMPOTENCY_TTL=float(os.getenv("IDEMPOTENCY_TTL", "600")),
+        IDEMPOTENCY_DB=os.getenv("IDEMPOTENCY_DB", "idempotency.db"),
+        # Rows kept in each of the files above; expired and least recently used ones are deleted first
+        CACHE_DB_MAX_ROWS=int(os.getenv("CACHE_DB_MAX_ROWS", "20000")),
+    )
+    app.config.update(config or {})
+    legacy = users.legacy_files()
+    if legacy and app.config["DEFAULT_USER_ID"] != users.LOCAL_USER:
+        print(f"Found single-user data ({', '.join(legacy)}), which visitors don't see. "
+              f"Set DEFAULT_USER_ID={users.LOCAL_USER} to serve it to everyone, see README.md")
+    app_services = app.extensions["services"] = Services(app.config)
+    metrics.init_app(app)
+    metrics.register_collector(lambda: cache_samples(app_services), name="app.caches")
+    if not image_pipeline.available():
+        print("Pillow is not installed: uploaded images are sent to the vision model as they are")
+    app.register_blueprint(bp)
+    return app
+
+
+def __getattr__(name):
+    # Keeps `gunicorn app:app` working: the module-level app is built on first access
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+Local stand-in for the OpenAI and Open-Meteo APIs, with injectable
+latency and failures. Used by the benchmarks; point the app at it with
+
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1
+    OPEN_METEO_GEOCODING_URL=http://127.0.0.1:8900/v1/search
+    OPEN_METEO_FORECAST_URL=http://127.0.0.1:8900/v1/forecast
+
+Run standalone: python bench/mock_upstream.py --port 8900 --latency 0.3
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockConfig:
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, fail_rate: float = 0.0, max_concurrent: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.max_concurrent = max_concurrent  # 0 = unlimited, otherwise extra requests get 429
+        self.in_flight = 0
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                self.calls["429"] = self.calls.get("429", 0) + 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+
+def _completion(content: str, prompt_chars: int) -> dict:
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "mock",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4,
+                  "total_tokens": (prompt_chars + len(content)) // 4},
+    }
+
+
+def _reply_for(body: dict) -> str:
+    messages = body.get("messages", [])
+    has_image = any(isinstance(m.get("content"), list) and
+                    any(part.get("type") == "image_url" for part in m["content"]) for m in messages)
+    if has_image:
+        return json.dumps({"is_clothing": True, "type": "T-shirt", "style": "casual", "season": "summer",
+                           "warmth": "light", "brand": "", "tags": ["cotton"]})
+    if body.get("response_format", {}).get("type") == "json_object":
+        text = " ".join(m["content"] for m in messages if isinstance(m.get("content"), str))
+        # JSON wardrobes carry "id" keys, table wardrobes start each row with a short numeric id
+        ids = re.findall(r'"id":\s*"([^"]+)"', text)[:4] or [int(i) for i in re.findall(r"^(\d+)\|", text, re.M)[:4]]
+        days = re.findall(r"^Day (\d+)", text, re.M)
+        if days:
+            # Week plans: the same top, bottom and shoes every day, so the server has repeats to fix
+            rows = re.findall(r"^(\d+)\|([^|\n]*)", text, re.M)
+            look = [next((int(i) for i, kind in rows if re.search(pattern, kind, re.I)), None)
+                    for pattern in (r"shirt|blouse|top", r"jeans|pants|skirt|shorts", r"sneaker|boot|loafer|sandal")]
+            look = [i for i in look if i is not None] or ids
+            return json.dumps({"outfits": [{"day": int(d), "items": look, "reason": "Mock day look."} for d in days]})
+        return json.dumps({"items": ids, "reason": "Mock stylist picked a balanced look."})
+    return "Mock stylist reply. " * 20
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, content: str, chunk_delay: float = 0.01) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for word in content.split(" "):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": "mock", "choices": [{"index": 0, "delta": {"content": word + " "},
+                                                   "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(chunk_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def _maybe_fail(self) -> bool:
+        time.sleep(self.config.delay())
+        if random.random() < self.config.fail_rate:
+            self._send_json(503, {"error": {"message": "injected failure"}})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.config.count(url.path)
+        if self._maybe_fail():
+            return
+        if url.path.endswith("/search"):
+            name = query.get("name", [""])[0]
+            self._send_json(200, {"results": [{"name": name.title(), "country": "Mockland",
+                                               "latitude": 48.72, "longitude": 21.26}]})
+        elif url.path.endswith("/forecast"):
+            self._send_json(200, {"current_weather": {"temperature": 12.5, "windspeed": 9.0}})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self.config.count(url.path)
+        if not self.config.acquire():
+            self.send_response(429)
+            self.send_header("Retry-After", "0.2")
+            self.send_header("Content-Type", "application/json")
+            data = json.dumps({"error": {"message": "rate limited", "type": "rate_limit"}}).encode()
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        try:
+            if self._maybe_fail():
+                return
+            if url.path.endswith("/chat/completions") and body.get("stream"):
+                self._send_stream(_reply_for(body))
+            elif url.path.endswith("/chat/completions"):
+                self._send_json(200, _completion(_reply_for(body), len(json.dumps(body))))
+            else:
+                self._send_json(404, {"error": "not found"})
+        finally:
+            self.config.release()
+
+
+def start(port: int = 0, latency: float = 0.2, jitter: float = 0.0, fail_rate: float = 0.0, max_concurrent: int = 0):
+    """
+    Starts the mock server in a background thread; returns (server, config).
+    """
+    config = MockConfig(latency, jitter, fail_rate, max_concurrent)
+    handler = type("ConfiguredHandler", (Handler,), {"config": config})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--max-concurrent", type=int, default=0,
+                        help="answer POSTs beyond this many in flight with 429")
+    args = parser.parse_args()
+    server, _ = start(args.port, args.latency, args.jitter, args.fail_rate, args.max_concurrent)
+    print(f"Mock upstream listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,71 @@
+"""
+Throughput of the outbound layer against the local mock upstream.
+
+Compares the old call patterns (module-level requests.get, one blocking
+LLM call per worker thread) with the pooled session and the async fan-out
+in outbound.py. Of the endpoints only batch recognition fans out; bench/run.py
+measures what the endpoints themselves sustain.
+
+    python bench/outbound_bench.py --calls 200 --latency 0.2 --threads 16
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mock_upstream  # noqa: E402
+
+
+def timed(label: str, calls: int, fn) -> float:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<48} {elapsed:7.2f}s  {calls / elapsed:8.1f} req/s")
+    return calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--threads", type=int, default=16, help="worker threads for the blocking baselines")
+    args = parser.parse_args()
+
+    server, _ = mock_upstream.start(latency=args.latency)
+    base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["OPENAI_BASE_URL"] = base
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+
+    import requests
+    import outbound
+
+    url = f"{base}/forecast"
+    params = {"latitude": 48.72, "longitude": 21.26, "current_weather": True}
+    session = outbound.make_session(pool_size=args.threads)
+
+    print(f"{args.calls} calls, {args.latency * 1000:.0f} ms upstream latency, {args.threads} threads\n")
+    with ThreadPoolExecutor(args.threads) as pool:
+        timed("HTTP: requests.get per call", args.calls,
+              lambda: list(pool.map(lambda _: requests.get(url, params=params, timeout=5), range(args.calls))))
+        timed("HTTP: pooled keep-alive session", args.calls,
+              lambda: list(pool.map(lambda _: session.get(url, params=params, timeout=5), range(args.calls))))
+
+        kwargs = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "What should I wear?"}]}
+        client = outbound.llm()
+        blocking = timed("LLM: blocking call per worker thread", args.calls,
+                         lambda: list(pool.map(lambda _: client.chat.completions.create(**kwargs),
+                                               range(args.calls))))
+
+    fanout = timed("LLM: async fan-out on the shared event loop", args.calls,
+                   lambda: outbound.complete_many([kwargs] * args.calls, concurrency=args.calls))
+    print(f"\nAsync fan-out speedup over {args.threads} threads: {fanout / blocking:.1f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""
+End-to-end benchmark: runs app.py against the local mock of OpenAI and
+Open-Meteo (bench/mock_upstream.py) and reports latency percentiles and
+throughput per endpoint, plus micro-benchmarks of the hot helpers and
+app startup (import, create_app, first request, first LLM request), each
+measured in a fresh process.
+
+For every wardrobe size a fresh app process is started in a scratch
+directory with a synthetic wardrobe (and chats of each history size)
+already in its databases. Outfit requests use a different event each time
+so they miss the outfit cache; weather requests cycle through a fixed set
+of cities, so after the first round they measure the weather cache.
+
+    python bench/run.py
+    python bench/run.py --sizes 10,1000 --requests 100 --latency 0.3 --fail-rate 0.05
+    python bench/run.py --json baseline.json
+    python bench/run.py --compare baseline.json --tolerance 0.25   # exits 1 on a p95 regression
+
+The synthetic data comes from a seeded RNG (--seed), so runs are comparable.
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import mock_upstream  # noqa: E402
+
+TYPES = ["T-shirt", "Oxford shirt", "Blouse", "Tank top", "Slim jeans", "Chino pants", "Pleated skirt",
+         "Cargo shorts", "Leather boots", "White sneakers", "Loafers", "Sandals", "Denim jacket", "Wool coat",
+         "Blazer", "Hoodie", "Cardigan", "Scarf", "Belt", "Cap", "Watch", "Tote bag"]
+COLORS = ["black", "white", "navy", "grey", "beige", "red", "green", "blue", "brown", "pink", "olive", "mustard"]
+STYLES = ["casual", "smart", "formal", "sport", "street", "classic", "elegant", "comfortable"]
+SEASONS = ["summer", "winter", "spring", "autumn", "all season", "spring, autumn"]
+WARMTH = ["light", "medium", "warm"]
+EVENTS = ["office meeting", "university", "date night", "gym", "walk in the park", "wedding", "travel day",
+          "job interview", "party", "weekend brunch"]
+CITIES = ["Kosice", "Prague", "Vienna", "Berlin", "Paris", "Madrid", "Oslo", "Rome", "Warsaw", "Lisbon"]
+PAGES = ["/", "/wardrobe", "/chat", "/profile", "/profile/basic", "/profile/parameters"]
+
+BENCH_USER = "bench-user-0001"
+PROFILE = {"name": "Bench User", "city": "Kosice", "gender": "Unisex", "height": "175", "weight": "70",
+           "body_type": "Regular", "skin_tone": "Neutral", "style": "Smart casual"}
+
+SERVE = ("import sys; sys.path.insert(0, sys.argv[1]); import app; "
+         "app.create_app().run(port=int(sys.argv[2]), threaded=True)")
+
+# Run in a fresh interpreter: argv = root, user id, time.time() at spawn. Prints one JSON line of timings.
+STARTUP = """
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+boot = time.time() - float(sys.argv[3])
+loaded = sorted({"openai", "requests"} & {name.split(".")[0] for name in sys.modules})
+flask_app = app.create_app()
+created = time.perf_counter()
+client = flask_app.test_client()
+headers = {"X-User-Id": sys.argv[2]}
+client.get("/api/cache/stats", headers=headers)
+first = time.perf_counter()
+outfits = []
+for event in ("startup check one", "startup check two"):
+    t = time.perf_counter()
+    status = client.post("/api/outfit", headers=headers, json={"wardrobe_ref": "server", "weather": "Kosice: 12°C",
+                                                              "user": {"event": event}}).status_code
+    outfits.append((time.perf_counter() - t) * 1000)
+print(json.dumps({"boot_ms": boot * 1000, "import_ms": (imported - start) * 1000,
+                  "create_app_ms": (created - imported) * 1000, "first_request_ms": (first - created) * 1000,
+                  "first_outfit_ms": outfits[0], "second_outfit_ms": outfits[1], "loaded_at_import": loaded}))
+"""
+
+
+# --- SYNTHETIC DATA ---
+
+def make_wardrobe(n: int, rng: random.Random) -> list:
+    return [{
+        "id": f"item-{i}",
+        "type": rng.choice(TYPES),
+        "color": rng.choice(COLORS),
+        "style": rng.choice(STYLES),
+        "season": rng.choice(SEASONS),
+        "warmth": rng.choice(WARMTH),
+        "usageCount": rng.randint(0, 30),
+    } for i in range(n)]
+
+
+def weather_string(rng: random.Random) -> str:
+    return f"{rng.randint(-10, 32)}°C, wind {rng.randint(0, 40)}km/h in {rng.choice(CITIES)}"
+
+
+def seed_chat(store, messages: int, rng: random.Random) -> str:
+    """
+    A chat with `messages` messages whose older part is already summarized, as in steady use.
+    """
+    chat_id = store.create_chat("Bench chat")
+    batch = []
+    for i in range(messages):
+        role = "user" if i % 2 == 0 else "assistant"
+        words = rng.randint(8, 60)
+        batch.append({"role": role, "content": " ".join(rng.choice(COLORS + STYLES + TYPES) for _ in range(words))})
+        if len(batch) == 500:
+            store.append_messages(chat_id, batch)
+            batch = []
+    if batch:
+        store.append_messages(chat_id, batch)
+    if messages > 30:
+        seq = store.messages_after(chat_id, 0, 31)[0]["seq"]
+        store.set_summary(chat_id, "The user prefers smart casual outfits in neutral colors.", seq)
+    return chat_id
+
+
+def prepare_workdir(workdir: Path, wardrobe_size: int, chat_sizes: list, rng: random.Random) -> tuple:
+    """
+    Seeds BENCH_USER's profile, wardrobe and chats in workdir; returns (wardrobe items, {history size: chat id}).
+    """
+    import users
+    from blob_store import BlobStore
+
+    space = users.UserDirectory(workdir / "users", BlobStore(workdir / "blobs")).get(BENCH_USER)
+    space.profile.update(lambda _: PROFILE)
+    wardrobe = make_wardrobe(wardrobe_size, rng)
+    space.wardrobe.add_many(wardrobe)
+    return wardrobe, {size: seed_chat(space.chats, size, rng) for size in chat_sizes}
+
+
+# --- APP PROCESS ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(workdir: Path, env: dict, session, timeout: float = 60.0) -> tuple:
+    """
+    Runs app.py in its own process with workdir as the current directory; returns (process, base url).
+    """
+    port = free_port()
+    log = open(workdir / "app.log", "w")
+    proc = subprocess.Popen([sys.executable, "-c", SERVE, str(ROOT), str(port)], cwd=workdir, env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"app.py exited with {proc.returncode}, see {workdir / 'app.log'}")
+        try:
+            if session.get(f"{base}/api/cache/stats", timeout=1).status_code == 200:
+                return proc, base
+        except Exception:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("app.py did not start in time")
+
+
+def stop_app(proc) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def startup_benchmark(workdir: Path, env: dict, runs: int) -> tuple:
+    """
+    Runs STARTUP in runs fresh processes. boot_ms is process spawn to app
+    imported; the two outfit requests (cache misses against the mock) differ
+    by what the first one sets up lazily. Returns ({metric: stats}, modules
+    loaded by the import).
+    """
+    samples, loaded = {}, []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", STARTUP, str(ROOT), BENCH_USER, repr(time.time())], cwd=workdir,
+                             env=env, capture_output=True, text=True, check=True).stdout
+        timings = json.loads(out.strip().splitlines()[-1])
+        loaded = timings.pop("loaded_at_import")
+        for name, value in timings.items():
+            samples.setdefault(name, []).append(value)
+    stats = {}
+    for name, values in samples.items():
+        values.sort()
+        stats[name] = {"p50_ms": percentile(values, 50), "p95_ms": percentile(values, 95), "min_ms": values[0],
+                       "runs": len(values)}
+    return stats, loaded
+
+
+# --- LOAD ---
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))]
+
+
+def run_load(session, make_request, count: int, concurrency: int, warmup: int = 3) -> dict:
+    """
+    Sends count requests from concurrency threads; make_request(i) returns (method, url, json body or None).
+    """
+    def send(i):
+        method, url, body = make_request(i)
+        start = time.perf_counter()
+        try:
+            resp = session.request(method, url, json=body, timeout=120)
+            ok = resp.status_code < 400
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    for i in range(warmup):
+        send(-1 - i)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(send, range(count)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(t for t, _ in results)
+    return {
+        "requests": count,
+        "errors": sum(1 for _, ok in results if not ok),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rps": count / elapsed if elapsed else 0.0,
+    }
+
+
+def endpoint_scenarios(base: str, wardrobe: list, chats: dict, rng: random.Random, first: bool) -> dict:
+    """
+    {name: make_request}. Outfit endpoints run for every wardrobe size; pages,
+    weather and chat don't depend on it and run for the first size only.
+    """
+    def outfit(i):
+        body = {"wardrobe_ref": "server", "weather": weather_string(rng),
+                "user": {"event": f"{rng.choice(EVENTS)} #{i}", "style": PROFILE["style"]}}
+        return "POST", f"{base}/api/outfit", body
+
+    def remix(i):
+        original = [item["id"] for item in rng.sample(wardrobe, min(4, len(wardrobe)))]
+        body = {"wardrobe_ref": "server", "weather": weather_string(rng),
+                "user": {"event": f"{rng.choice(EVENTS)} #{i}", "style": PROFILE["style"]},
+                "original_outfit": {"items": original, "reason": "Smart casual look"}}
+        return "POST", f"{base}/api/outfit/remix", body
+
+    def week(i):
+        slots = [{"date": f"day {d + 1}", "weather": weather_string(rng), "event": f"{rng.choice(EVENTS)} #{i}"}
+                 for d in range(7)]
+        return "POST", f"{base}/api/outfit/week", {"wardrobe_ref": "server", "slots": slots}
+
+    scenarios = {"POST /api/outfit": outfit, "POST /api/outfit/remix": remix, "POST /api/outfit/week": week}
+    if not first:
+        return scenarios
+
+    scenarios["GET /api/weather"] = lambda i: ("GET", f"{base}/api/weather?city={CITIES[i % len(CITIES)]}", None)
+    scenarios["GET pages"] = lambda i: ("GET", base + PAGES[i % len(PAGES)], None)
+    for size, chat_id in chats.items():
+        scenarios[f"POST /api/chats/<id>/message [{size} msgs]"] = (
+            lambda i, chat_id=chat_id: ("POST", f"{base}/api/chats/{chat_id}/message",
+                                        {"message": f"What goes with my {rng.choice(TYPES).lower()}? ({i})"})
+        )
+    return scenarios
+
+
+# --- MICRO-BENCHMARKS ---
+
+def micro(fn, min_time: float = 0.5, max_runs: int = 1000) -> dict:
+    runs = []
+    deadline = time.perf_counter() + min_time
+    while len(runs) < max_runs and (len(runs) < 5 or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    runs.sort()
+    return {"runs": len(runs), "p50_ms": percentile(runs, 50) * 1000, "p95_ms": percentile(runs, 95) * 1000}
+
+
+def micro_benchmarks(sizes: list, rng: random.Random, workdir: Path) -> dict:
+    """
+    validate_outfit and optimize_wardrobe in-process. The first optimize_wardrobe
+    call on a wardrobe also builds its index and is reported separately.
+    """
+    cwd = os.getcwd()
+    os.chdir(workdir)  # app.py opens its data files relative to the current directory
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+
+    results = {}
+    for size in sizes:
+        wardrobe = make_wardrobe(size, rng)
+        outfit = [item["id"] for item in rng.sample(wardrobe, min(8, size))]
+        weather, event = weather_string(rng), rng.choice(EVENTS)
+        results[f"validate_outfit [{size}]"] = micro(lambda: app.validate_outfit(wardrobe, outfit))
+
+        start = time.perf_counter()
+        app.optimize_wardrobe(wardrobe, weather=weather, profile=PROFILE, event=event)
+        cold = (time.perf_counter() - start) * 1000
+        results[f"optimize_wardrobe [{size}]"] = micro(
+            lambda: app.optimize_wardrobe(wardrobe, weather=weather, profile=PROFILE, event=event)
+        )
+        results[f"optimize_wardrobe [{size}]"]["first_ms"] = cold
+    return results
+
+
+# --- REPORT ---
+
+def print_table(title: str, results: dict, columns: list, digits: int = 1) -> None:
+    print(f"\n{title}")
+    print(f"{'':<52}" + "".join(f"{c:>11}" for c in columns))
+    for name, row in results.items():
+        print(f"{name:<52}" + "".join(f"{row[c]:>11.{digits}f}" if isinstance(row.get(c), float)
+                                      else f"{row.get(c, ''):>11}" for c in columns))
+
+
+def regressions(results: dict, baseline: dict, tolerance: float, slack_ms: float = 2.0) -> list:
+    """
+    Entries whose p95 grew more than tolerance (and slack_ms) over the baseline.
+    """
+    found = []
+    for section in ("startup", "endpoints", "micro"):
+        for name, row in results.get(section, {}).items():
+            before = baseline.get(section, {}).get(name)
+            if before and row["p95_ms"] > before["p95_ms"] * (1 + tolerance) + slack_ms:
+                found.append(f"{name}: p95 {before['p95_ms']:.1f} -> {row['p95_ms']:.1f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="wardrobe sizes")
+    parser.add_argument("--chat-sizes", default="0,100,1000,10000", help="messages already in the chat")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="mock upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of upstream calls answered with 503")
+    parser.add_argument("--mode", default="llm", choices=["llm", "hybrid", "local"], help="OUTFIT_MODE for the app")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-micro", action="store_true", help="skip the in-process micro-benchmarks")
+    parser.add_argument("--startup-runs", type=int, default=5, help="fresh processes for the startup timings")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --json run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    chat_sizes = [int(s) for s in args.chat_sizes.split(",") if s]
+    rng = random.Random(args.seed)
+
+    server, upstream = mock_upstream.start(latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate)
+    mock = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    env = dict(os.environ, OPENAI_BASE_URL=mock, OPENAI_API_KEY="mock", OUTFIT_MODE=args.mode, USERS_DIR="users",
+               OPEN_METEO_GEOCODING_URL=f"{mock}/search", OPEN_METEO_FORECAST_URL=f"{mock}/forecast")
+    os.environ.update(env)
+
+    import outbound
+
+    session = outbound.make_session(pool_size=args.concurrency)
+    session.headers["X-User-Id"] = BENCH_USER
+    print(f"{args.requests} requests per scenario, {args.concurrency} concurrent, upstream latency "
+          f"{args.latency * 1000:.0f}±{args.jitter * 1000:.0f} ms, fail rate {args.fail_rate:.0%}, mode {args.mode}")
+
+    results = {"config": vars(args), "startup": {}, "endpoints": {}, "micro": {}}
+    with tempfile.TemporaryDirectory(prefix="wardrobe-bench-") as scratch:
+        for n, size in enumerate(sizes):
+            workdir = Path(scratch) / f"w{size}"
+            workdir.mkdir()
+            wardrobe, chats = prepare_workdir(workdir, size, chat_sizes if n == 0 else [], rng)
+            if n == 0 and args.startup_runs:
+                results["startup"], loaded = startup_benchmark(workdir, env, args.startup_runs)
+                results["startup_loaded_at_import"] = loaded
+            proc, base = start_app(workdir, env, session)
+            try:
+                for name, make_request in endpoint_scenarios(base, wardrobe, chats, rng, n == 0).items():
+                    label = f"{name} [{size} items]" if "outfit" in name else name
+                    results["endpoints"][label] = run_load(session, make_request, args.requests, args.concurrency)
+                    print(".", end="", flush=True)
+            finally:
+                stop_app(proc)
+
+        if not args.no_micro:
+            micro_dir = Path(scratch) / "micro"
+            micro_dir.mkdir()
+            results["micro"] = micro_benchmarks(sizes, rng, micro_dir)
+    print()
+    server.shutdown()
+
+    if results["startup"]:
+        print_table("Startup (ms)", results["startup"], ["p50_ms", "p95_ms", "min_ms", "runs"])
+        loaded = ", ".join(results["startup_loaded_at_import"]) or "neither openai nor requests"
+        print(f"Loaded by `import app`: {loaded}")
+    print_table("Endpoints (ms)", results["endpoints"], ["p50_ms", "p95_ms", "p99_ms", "rps", "errors"])
+    if results["micro"]:
+        print_table("Micro-benchmarks (ms)", results["micro"], ["p50_ms", "p95_ms", "first_ms", "runs"], digits=3)
+    print(f"\nUpstream calls: {dict(sorted(upstream.calls.items()))}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.compare:
+        found = regressions(results, json.loads(Path(args.compare).read_text(encoding="utf-8")), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+        print(f"No p95 regressions over {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Content-addressed blob store for wardrobe images.
+
+Blobs are written once to <root>/<first 2 hex chars>/<sha256>.<ext> and
+never change, so they can be served with immutable cache headers and the
+same photo uploaded twice is stored once.
+"""
+
+import base64
+import binascii
+import hashlib
+import re
+from pathlib import Path
+
+import storage
+
+EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif"}
+MIME_TYPES = {ext: mime for mime, ext in EXTENSIONS.items()}
+
+_DATA_URL = re.compile(r"^data:(?P<mime>[\w/+.-]+)?(?:;[\w=.-]+)*;base64,(?P<data>.*)$", re.S)
+_BLOB_ID = re.compile(r"^[0-9a-f]{64}\.(?:" + "|".join(MIME_TYPES) + ")$")
+
+
+def decode_data_url(data_url: str) -> tuple:
+    """
+    Returns (bytes, mime type) for a base64 data URL. Raises ValueError otherwise.
+    """
+    match = _DATA_URL.match(data_url or "")
+    if not match:
+        raise ValueError("Not a base64 data URL")
+    try:
+        data = base64.b64decode(match.group("data"), validate=False)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 image: {e}") from e
+    return data, (match.group("mime") or "image/jpeg").lower()
+
+
+class BlobStore:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path(self, blob_id: str) -> Path:
+        return self.root / blob_id[:2] / blob_id
+
+    def put(self, data: bytes, mime: str = "image/jpeg") -> str:
+        """
+        Stores data and returns its blob id ("<sha256>.<ext>").
+        """
+        ext = EXTENSIONS.get(mime)
+        if ext is None:
+            raise ValueError(f"Unsupported image type: {mime}")
+        blob_id = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = self._path(blob_id)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            storage.atomic_write_bytes(path, data)
+        return blob_id
+
+    def put_data_url(self, data_url: str) -> str:
+        return self.put(*decode_data_url(data_url))
+
+    def path(self, blob_id: str):
+        """
+        Filesystem path of a stored blob, or None for unknown/malformed ids.
+        """
+        if not _BLOB_ID.match(blob_id or ""):
+            return None
+        path = self._path(blob_id)
+        return path if path.exists() else None
+
+    @staticmethod
+    def mime_type(blob_id: str) -> str:
+        return MIME_TYPES.get(blob_id.rsplit(".", 1)[-1], "application/octet-stream")
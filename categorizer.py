@@ -0,0 +1,51 @@
+"""
+Clothing category rules shared by outfit validation, generation and prompt
+building.
+
+All keywords are compiled into one regex, so an item type is classified in
+a single scan, and results are memoized per type string (wardrobes repeat
+the same few dozen types).
+"""
+
+import re
+from functools import lru_cache
+
+# Earlier categories win when a type matches several, e.g. "sweater dress" is outerwear
+CATEGORY_KEYWORDS = [
+    ("bottoms", ["jeans", "pants", "shorts", "skirt", "trousers", "leggings", "cargo"]),
+    ("shoes", ["sneaker", "boot", "heel", "sandal", "loafer", "oxford", "flat", "shoe"]),
+    ("outerwear", ["jacket", "coat", "blazer", "cardigan", "sweater", "hoodie", "vest"]),
+    ("tops", ["shirt", "blouse", "tshirt", "t-shirt", "top", "dress", "tank"]),
+]
+
+CATEGORIES = [name for name, _ in CATEGORY_KEYWORDS] + ["accessories"]
+
+_PRIORITY = {name: i for i, name in enumerate(CATEGORIES)}
+_KEYWORD_CATEGORY = {kw: name for name, keywords in CATEGORY_KEYWORDS for kw in keywords}
+
+# Zero-width lookahead so every start position is tried (overlapping keywords
+# are all seen); alternatives are ordered by category priority, then length.
+_PATTERN = re.compile("(?=(" + "|".join(
+    re.escape(kw) for kw in sorted(_KEYWORD_CATEGORY, key=lambda k: (_PRIORITY[_KEYWORD_CATEGORY[k]], -len(k)))
+) + "))")
+
+
+@lru_cache(maxsize=8192)
+def categorize(item_type: str) -> str:
+    """
+    Returns the category for a free-text item type, e.g. "Slim Jeans" -> "bottoms".
+    Anything unrecognised is an accessory.
+    """
+    best = len(CATEGORIES) - 1
+    for match in _PATTERN.finditer((item_type or "").lower()):
+        best = min(best, _PRIORITY[_KEYWORD_CATEGORY[match.group(1)]])
+        if best == 0:
+            break
+    return CATEGORIES[best]
+
+
+def categorize_many(items: list) -> list:
+    """
+    Categories for a list of wardrobe items, in the same order.
+    """
+    return [categorize(str(item.get("type") or "")) for item in items]
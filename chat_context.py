@@ -0,0 +1,129 @@
+"""
+Token-budgeted chat context with a rolling summary.
+
+A turn is sent as: system prompt, the chat's stored summary of older
+messages, as many of the newest messages as fit in CHAT_CONTEXT_TOKENS,
+then the new user message. Messages that no longer fit are folded into the
+summary after the reply has been saved, a batch at a time on the
+background event loop, so the prompt stays bounded and the user never
+waits for summarization.
+"""
+
+import asyncio
+import os
+import threading
+
+import outbound
+import prompt_encoder
+from chat_store import ChatStore
+
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "2000"))
+WINDOW_MESSAGES = 40  # newest unsummarized messages considered for the verbatim window
+SUMMARY_BATCH = 20  # messages folded into the summary per update
+SUMMARY_MAX_TOKENS = 300
+MESSAGE_CHARS = 2000  # per message, when feeding the summarizer
+RESERVED_USER_TOKENS = 100  # room kept for the next user message when planning a summary update
+MIN_VERBATIM = 2  # the latest exchange is never summarized away
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and their fashion assistant. "
+    "Merge the new messages into the summary. Keep facts that matter for future advice: the user's "
+    "preferences, plans, events, items they own or want, and advice already given. Be concise, "
+    "at most 150 words, plain text."
+)
+
+
+class ChatContext:
+    def __init__(self, store: ChatStore, budget: int = CHAT_CONTEXT_TOKENS, model: str = "gpt-4o-mini",
+                 async_llm=outbound.async_llm):
+        self.store = store
+        self.async_llm = async_llm  # () -> AsyncOpenAI client for summaries
+        self.budget = budget
+        self.model = model
+        self._summarizing = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _summary_message(summary: str):
+        if not summary:
+            return None
+        return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+
+    def _window(self, chat_id: str, reserved: int) -> tuple:
+        """
+        Returns (summary, seq it covers, recent messages, how many of the oldest recent messages don't fit).
+        """
+        summary, summary_seq = self.store.get_summary(chat_id)
+        recent = self.store.messages_after(chat_id, summary_seq, WINDOW_MESSAGES)
+        summary_message = self._summary_message(summary)
+        available = self.budget - reserved - (prompt_encoder.count_messages([summary_message]) if summary else 0)
+
+        kept = 0
+        for message in reversed(recent):
+            cost = prompt_encoder.count_tokens(message["content"], self.model) + 4
+            if cost > available:
+                break
+            available -= cost
+            kept += 1
+        return summary, summary_seq, recent, len(recent) - kept
+
+    def build(self, chat_id: str, system_message: dict, user_text: str) -> list:
+        """
+        Messages for the next turn, within the token budget.
+        """
+        user_message = {"role": "user", "content": user_text}
+        reserved = prompt_encoder.count_messages([system_message, user_message], self.model)
+        summary, _, recent, dropped = self._window(chat_id, reserved)
+        history = [{"role": m["role"], "content": m["content"]} for m in recent[dropped:]]
+        summary_message = self._summary_message(summary)
+        return [system_message] + ([summary_message] if summary_message else []) + history + [user_message]
+
+    def refresh_summary(self, chat_id: str, system_message: dict):
+        """
+        Folds the oldest messages that fall outside the window into the
+        summary, in the background. Returns the Future, or None when there
+        is nothing to do (or an update for this chat is already running).
+        """
+        reserved = prompt_encoder.count_messages([system_message], self.model) + RESERVED_USER_TOKENS
+        summary, summary_seq, recent, dropped = self._window(chat_id, reserved)
+        if not dropped and len(recent) < WINDOW_MESSAGES:
+            return None
+        # Oldest unsummarized messages first, never past the ones still in the window
+        boundary = recent[min(dropped, max(len(recent) - MIN_VERBATIM, 0))]["seq"]
+        batch = [m for m in self.store.messages_after(chat_id, summary_seq, SUMMARY_BATCH, newest=False)
+                 if m["seq"] < boundary]
+        if not batch:
+            return None
+
+        with self._lock:
+            if chat_id in self._summarizing:
+                return None
+            self._summarizing.add(chat_id)
+
+        future = outbound.submit(self._summarize(chat_id, summary, batch))
+        future.add_done_callback(lambda f: self._finished(chat_id, f))
+        return future
+
+    async def _summarize(self, chat_id: str, summary: str, batch: list) -> str:
+        transcript = "\n".join(f"{m['role']}: {m['content'][:MESSAGE_CHARS]}" for m in batch)
+        resp = await self.async_llm().chat.completions.create(
+            model=self.model,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+            ],
+        )
+        prompt_encoder.record_usage("chat_summary", resp)
+        updated = (resp.choices[0].message.content or "").strip()
+        if updated:
+            # A blocking SQLite write (an fsync, and maybe a wait for the file lock): off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.store.set_summary, chat_id, updated,
+                                                             batch[-1]["seq"])
+        return updated
+
+    def _finished(self, chat_id: str, future) -> None:
+        with self._lock:
+            self._summarizing.discard(chat_id)
+        if future.exception() is not None:
+            print(f"Chat summary failed: {future.exception()}")
@@ -0,0 +1,296 @@
+"""
+Chat storage backed by an embedded SQLite database.
+
+Every message is its own row, so appending to a conversation costs O(1)
+no matter how much history the store holds. Chat listings come from the
+chats table and its last_ts index, and history is paged by message seq,
+so neither ever loads a whole conversation. Each chat also keeps a rolling
+text summary of its older messages (summary_seq is the last message it
+covers) for building LLM context.
+"""
+
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chats (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    last_ts REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    summary TEXT NOT NULL DEFAULT '',
+    summary_seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_chat ON messages (chat_id, seq);
+CREATE INDEX IF NOT EXISTS chats_by_last_ts ON chats (last_ts DESC);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('rev', 0), ('migrated', 0);
+"""
+
+
+class ChatNotFound(LookupError):
+    """Raised when writing to a chat that doesn't exist (or was deleted meanwhile)."""
+
+
+class ChatStore:
+    """
+    Append-only chat store.
+
+    Messages are keyed by (chat_id, seq), which doubles as the per-chat
+    offset index. Each write bumps a revision counter in the database; the
+    in-memory summary index remembers the revision it reflects and reloads
+    itself when another process has written in the meantime.
+    """
+
+    def __init__(self, path: Path, legacy_json: Path = None):
+        self.path = Path(path)
+        self.db = storage.SQLiteFile(self.path, SCHEMA, setup=lambda conn: self._add_columns(
+            conn, {"summary": "TEXT NOT NULL DEFAULT ''", "summary_seq": "INTEGER NOT NULL DEFAULT 0"}))
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_rev = -1
+        if legacy_json is not None:
+            self._migrate(Path(legacy_json))
+
+    # --- CONNECTIONS ---
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _write(self, fn, apply_to_index=None, create: bool = True):
+        """
+        Runs fn(conn) in a write transaction and bumps the revision.
+        apply_to_index(index) mirrors the change into the summary index.
+        create=False when fn only changes existing chats (see SQLiteFile).
+        """
+        with self._lock:
+            with self.db.transaction(create) as conn:
+                result = fn(conn)
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'rev'")
+                rev = conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0]
+
+            if self._index is not None and self._index_rev == rev - 1 and apply_to_index:
+                apply_to_index(self._index)
+                self._index_rev = rev
+            else:
+                self._index = None
+        return result
+
+    @staticmethod
+    def _add_columns(conn, columns: dict) -> None:
+        """
+        Adds columns introduced after a database was created.
+        """
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(chats)")}
+        for name, ddl in columns.items():
+            if name not in existing:
+                try:
+                    conn.execute(f"ALTER TABLE chats ADD COLUMN {name} {ddl}")
+                except sqlite3.OperationalError:  # another worker added it first
+                    pass
+
+    def _current_rev(self) -> int:
+        with self.db.read() as conn:
+            return conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0]
+
+    # --- MIGRATION ---
+
+    def _migrate(self, legacy_json: Path) -> None:
+        """
+        One-shot import of the old chats.json file. The 'migrated' flag is
+        checked inside the write transaction so concurrent workers import once.
+        """
+        if not legacy_json.exists():
+            return
+        with self.db.read() as conn:
+            if conn.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone()[0]:
+                return
+
+        try:
+            chats = storage.read_json(legacy_json, {})
+        except storage.StorageError as e:
+            print(f"Skipping chat migration: {e}")
+            return
+
+        def migrate(conn):
+            if conn.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone()[0]:
+                return
+            for cid, data in chats.items():
+                messages = data.get("messages", [])
+                last_ts = data.get("last_ts", 0)
+                conn.execute(
+                    "INSERT OR IGNORE INTO chats (id, title, last_ts, message_count) VALUES (?, ?, ?, ?)",
+                    (cid, data.get("title", "New Conversation"), last_ts, len(messages)),
+                )
+                conn.executemany(
+                    "INSERT INTO messages (chat_id, role, content, ts) VALUES (?, ?, ?, ?)",
+                    [(cid, m.get("role", "user"), m.get("content", ""), last_ts) for m in messages],
+                )
+            conn.execute("UPDATE meta SET value = 1 WHERE key = 'migrated'")
+
+        self._write(migrate)
+
+    # --- READS ---
+
+    def _summary_index(self) -> dict:
+        with self._lock:
+            rev = self._current_rev()
+            if self._index is None or self._index_rev != rev:
+                with self.db.read() as conn:
+                    rows = conn.execute("SELECT id, title, last_ts FROM chats").fetchall()
+                self._index = {r["id"]: {"title": r["title"], "last_ts": r["last_ts"]} for r in rows}
+                self._index_rev = rev
+            return self._index
+
+    def list_chats(self, limit: int = None, offset: int = 0) -> list:
+        """
+        Returns chat summaries, most recently active first. Served from the
+        last_ts index, never touching messages.
+        """
+        with self.db.read() as conn:
+            rows = conn.execute(
+                "SELECT id, title, last_ts FROM chats ORDER BY last_ts DESC, id LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset),
+            ).fetchall()
+        return [{"id": r["id"], "title": r["title"], "last_ts": r["last_ts"]} for r in rows]
+
+    def chat_count(self) -> int:
+        return len(self._summary_index())
+
+    def exists(self, chat_id: str) -> bool:
+        return chat_id in self._summary_index()
+
+    def message_page(self, chat_id: str, before: int = None, limit: int = 50):
+        """
+        One page of a chat, walking back from the newest message: up to
+        `limit` messages with seq < before (all when before is None), in
+        chronological order as {"seq", "role", "content"}. Returns
+        {"title", "last_ts", "messages", "next_before"} or None; next_before
+        is the cursor for the previous page, None at the start of the chat.
+        """
+        with self.db.read() as conn:
+            row = conn.execute("SELECT title, last_ts FROM chats WHERE id = ?", (chat_id,)).fetchone()
+            if row is None:
+                return None
+            rows = conn.execute(
+                "SELECT seq, role, content FROM messages WHERE chat_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (chat_id, before if before is not None else 2 ** 63 - 1, limit + 1),
+            ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "title": row["title"],
+            "last_ts": row["last_ts"],
+            "messages": [{"seq": r["seq"], "role": r["role"], "content": r["content"]} for r in reversed(rows)],
+            "next_before": rows[-1]["seq"] if has_more else None,
+        }
+
+    def message_count(self, chat_id: str) -> int:
+        with self.db.read() as conn:
+            row = conn.execute("SELECT message_count FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        return row[0] if row else 0
+
+    def get_summary(self, chat_id: str) -> tuple:
+        """
+        Returns (summary text, seq of the last message it covers); ("", 0) when there is none.
+        """
+        with self.db.read() as conn:
+            row = conn.execute("SELECT summary, summary_seq FROM chats WHERE id = ?", (chat_id,)).fetchone()
+        return (row["summary"], row["summary_seq"]) if row else ("", 0)
+
+    def messages_after(self, chat_id: str, after_seq: int, limit: int, newest: bool = True) -> list:
+        """
+        Up to `limit` messages with seq > after_seq, in chronological order,
+        as {"seq", "role", "content"}. newest=False takes the oldest ones instead.
+        """
+        order = "DESC" if newest else "ASC"
+        with self.db.read() as conn:
+            rows = conn.execute(
+                f"SELECT seq, role, content FROM messages WHERE chat_id = ? AND seq > ? ORDER BY seq {order} LIMIT ?",
+                (chat_id, after_seq, limit),
+            ).fetchall()
+        messages = [{"seq": r["seq"], "role": r["role"], "content": r["content"]} for r in rows]
+        return messages[::-1] if newest else messages
+
+    # --- WRITES ---
+
+    def create_chat(self, title: str = "New Chat") -> str:
+        chat_id = str(uuid.uuid4())
+        now = time.time()
+
+        def create(conn):
+            conn.execute("INSERT INTO chats (id, title, last_ts) VALUES (?, ?, ?)", (chat_id, title, now))
+
+        def apply(index):
+            index[chat_id] = {"title": title, "last_ts": now}
+
+        self._write(create, apply)
+        return chat_id
+
+    def append_messages(self, chat_id: str, messages: list, title: str = None) -> None:
+        """
+        Appends messages to a chat and bumps its last_ts. When title is
+        given it replaces the chat title in the same transaction. Raises
+        ChatNotFound if the chat is gone, e.g. deleted while a reply was
+        being generated, so no orphan messages are left behind.
+        """
+        now = time.time()
+
+        def append(conn):
+            if conn.execute("SELECT 1 FROM chats WHERE id = ?", (chat_id,)).fetchone() is None:
+                raise ChatNotFound(chat_id)
+            conn.executemany(
+                "INSERT INTO messages (chat_id, role, content, ts) VALUES (?, ?, ?, ?)",
+                [(chat_id, m["role"], m["content"], now) for m in messages],
+            )
+            conn.execute(
+                "UPDATE chats SET last_ts = ?, message_count = message_count + ?, title = COALESCE(?, title) "
+                "WHERE id = ?",
+                (now, len(messages), title, chat_id),
+            )
+
+        def apply(index):
+            if chat_id in index:
+                index[chat_id]["last_ts"] = now
+                if title is not None:
+                    index[chat_id]["title"] = title
+
+        self._write(append, apply, create=False)
+
+    def set_summary(self, chat_id: str, summary: str, upto_seq: int) -> bool:
+        """
+        Stores a summary covering messages up to upto_seq. Ignored when a
+        newer summary is already stored, so out-of-order updates are safe.
+        """
+        def update(conn):
+            return conn.execute(
+                "UPDATE chats SET summary = ?, summary_seq = ? WHERE id = ? AND summary_seq < ?",
+                (summary, upto_seq, chat_id, upto_seq),
+            ).rowcount > 0
+
+        return self._write(update, lambda index: None, create=False)
+
+    def delete_chat(self, chat_id: str) -> bool:
+        def delete(conn):
+            conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            return conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,)).rowcount > 0
+
+        def apply(index):
+            index.pop(chat_id, None)
+
+        return self._write(delete, apply, create=False)
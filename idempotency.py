@@ -0,0 +1,212 @@
+"""
+Idempotency keys and in-flight coalescing for POST endpoints that call the LLM.
+
+A request carrying an Idempotency-Key header runs once per (user, key): its
+response is kept for the store's TTL, and a retry with the same key gets it
+back (marked Idempotent-Replayed: true) without calling OpenAI or appending
+to the chat again. Reusing a key for a different request is a 422.
+
+Identical requests in flight at the same time (same user, path and body, a
+double-click for example) share one execution whether or not they carry a
+key; callers arriving while it runs wait for the first one's response.
+With a disk_path, keys being run are also claimed in that file, so a retry
+that lands on another worker while the first is still running gets a 409
+(Retry-After: 1) instead of a second execution.
+
+    idempotent = Idempotency(lambda: g.user_id)
+
+    @app.route("/api/outfit", methods=["POST"])
+    @idempotent
+    def api_outfit(): ...
+
+(or store.run(view, ...) when the store is looked up per request).
+Streaming responses can't be shared while they are produced, so streaming
+routes use request_key/replay/begin/save/end directly (see
+stream_chat_message in app.py).
+"""
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from functools import wraps
+
+from flask import Response, current_app, jsonify, request
+
+import storage
+from cache import SingleFlight
+from response_cache import ResponseCache
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+RUNNING_ERROR = f"A request with this {IDEMPOTENCY_HEADER} is still running"
+
+RUNNING_SCHEMA = """
+CREATE TABLE IF NOT EXISTS running (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def fingerprint() -> str:
+    """
+    Hash of the current request's method, path and body.
+    """
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode("utf-8"))
+    digest.update(request.get_data())  # cached by Flask, the view can still call get_json()
+    return digest.hexdigest()
+
+
+class Idempotency:
+    LEASE = 300  # seconds a claim outlives a worker that died while running the key
+
+    def __init__(self, scope, ttl: float = 600, disk_path=None, maxsize: int = 4096, max_rows: int = 20000):
+        self.scope = scope  # () -> id of whoever owns the keys (the user)
+        self.results = ResponseCache(maxsize=maxsize, ttl=ttl, disk_path=disk_path, max_rows=max_rows)
+        self.flights = SingleFlight()
+        self.replayed = 0
+        self.rejected = 0
+        self._running = set()  # keys claimed by this process
+        self._lock = threading.Lock()
+        self._owner = uuid.uuid4().hex
+        # Keys being run, claimed in the results' file so every worker sharing it sees them
+        self.claims = storage.SQLiteFile(self.results.disk_path, RUNNING_SCHEMA) if disk_path else None
+
+    def request_key(self):
+        """
+        Store key for the current request's Idempotency-Key, or None without one.
+        Raises ValueError for an empty or oversized key.
+        """
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return None
+        if not 0 < len(key) <= MAX_KEY_LENGTH:
+            raise ValueError(f"Invalid {IDEMPOTENCY_HEADER}")
+        return hashlib.sha256(f"{self.scope()}\n{key}".encode("utf-8")).hexdigest()
+
+    def replay(self, key: str, request_fingerprint: str):
+        """
+        The stored response for key, a 422 if the key was used for a different
+        request, or None if nothing is stored.
+        """
+        stored = self.results.get(key)
+        if stored is None:
+            return None
+        if stored["fingerprint"] != request_fingerprint:
+            return self._mismatch()
+        with self._lock:
+            self.replayed += 1
+        response = self._response(stored)
+        response.headers[REPLAYED_HEADER] = "true"
+        return response
+
+    def save(self, key: str, request_fingerprint: str, status: int, mimetype: str, body: str) -> None:
+        # Server errors are not kept: retrying those should run the request again
+        if status < 500:
+            self.results.set(key, {"fingerprint": request_fingerprint, "status": status, "mimetype": mimetype,
+                                   "body": body})
+
+    def begin(self, key: str) -> bool:
+        """
+        Marks key as running, in every worker sharing the disk file; False if
+        it already is. Callers that got True must call end(key).
+        """
+        with self._lock:
+            if key in self._running:
+                self.rejected += 1
+                return False
+            if self.claims is not None:
+                now = time.time()
+                with self.claims.transaction() as conn:
+                    conn.execute("DELETE FROM running WHERE key = ? AND expires <= ?", (key, now))
+                    claimed = conn.execute("INSERT OR IGNORE INTO running (key, owner, expires) VALUES (?, ?, ?)",
+                                           (key, self._owner, now + self.LEASE)).rowcount
+                if not claimed:
+                    self.rejected += 1
+                    return False
+            self._running.add(key)
+            return True
+
+    def end(self, key: str) -> None:
+        with self._lock:
+            if key not in self._running:  # already ended (streams end from two places)
+                return
+            self._running.discard(key)
+            if self.claims is not None:
+                with self.claims.transaction(create=False) as conn:
+                    conn.execute("DELETE FROM running WHERE key = ? AND owner = ?", (key, self._owner))
+
+    def running_response(self):
+        return jsonify({"error": RUNNING_ERROR}), 409, {"Retry-After": "1"}
+
+    def __call__(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return self.run(view, *args, **kwargs)
+        return wrapper
+
+    def run(self, view, *args, **kwargs):
+        """
+        Answers the current request with view(*args, **kwargs), a stored
+        response or the response of an identical request in flight.
+        """
+        try:
+            key = self.request_key()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        request_fingerprint = fingerprint()
+        if key is not None:
+            replayed = self.replay(key, request_fingerprint)
+            if replayed is not None:
+                return replayed
+
+        def call() -> dict:
+            response = current_app.make_response(view(*args, **kwargs))
+            return {"fingerprint": request_fingerprint, "status": response.status_code,
+                    "mimetype": response.mimetype, "body": response.get_data(as_text=True)}
+
+        def execute() -> dict:
+            if key is None:
+                return call()
+            if not self.begin(key):  # running in another worker
+                return {"fingerprint": request_fingerprint, "status": 409, "mimetype": "application/json",
+                        "body": json.dumps({"error": RUNNING_ERROR}),
+                        "headers": {"Retry-After": "1"}}
+            try:
+                stored = self.results.get(key)  # finished elsewhere between replay() and begin()
+                if stored is not None:
+                    with self._lock:
+                        self.replayed += 1
+                    return dict(stored, headers={REPLAYED_HEADER: "true"})
+                result = call()
+                self.save(key, request_fingerprint, result["status"], result["mimetype"], result["body"])
+                return result
+            finally:
+                self.end(key)
+
+        flight = ("key", key) if key is not None else ("request", self.scope(), request_fingerprint)
+        result = self.flights.do(flight, execute)
+        if result["fingerprint"] != request_fingerprint:  # same key, different request, both in flight
+            return self._mismatch()
+        return self._response(result)
+
+    def _mismatch(self):
+        with self._lock:
+            self.rejected += 1
+        return jsonify({"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"}), 422
+
+    @staticmethod
+    def _response(result: dict) -> Response:
+        return Response(result["body"], status=result["status"], mimetype=result["mimetype"],
+                        headers=result.get("headers"))
+
+    def stats(self) -> dict:
+        stats = self.results.stats()
+        with self._lock:
+            stats.update(coalesced=self.flights.coalesced, replayed=self.replayed, rejected=self.rejected,
+                         running=len(self._running))
+        return stats
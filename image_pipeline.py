@@ -0,0 +1,197 @@
+"""
+Server-side image normalization for uploads going to the vision model.
+
+Each image is decoded once, rotated upright from its EXIF orientation,
+downscaled so its longest side is at most IMAGE_MAX_SIDE (the vision model
+works on 512px tiles at "low" detail, more is wasted upload and tokens),
+re-encoded as a compact JPEG without metadata, and given a perceptual hash
+(64-bit difference hash plus a coarse mean color, since the same garment
+in another color is a different item) so near-identical photos can share
+one recognition.
+
+Decoding is CPU-bound, so it runs in a process pool rather than on request
+threads. Pillow is optional: without it images pass through unchanged and
+have no perceptual hash.
+"""
+
+import base64
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from blob_store import decode_data_url
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = ImageOps = None
+
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "512"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+# Hashes this many bits apart (of 64) or fewer are treated as the same photo
+NEAR_DUPLICATE_BITS = int(os.getenv("NEAR_DUPLICATE_BITS", "4"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def perceptual_hash(image, size: int = 8) -> str:
+    """
+    "<64-bit difference hash in hex>-<mean R,G,B in 8 levels each>": brightness
+    gradients of a tiny grayscale copy, plus the overall color.
+    """
+    small = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            bits = (bits << 1) | (left > pixels[row * (size + 1) + col + 1])
+    mean = image.convert("RGB").resize((1, 1), Image.BOX).getpixel((0, 0))
+    return f"{bits:0{size * size // 4}x}-" + "".join(str(channel // 32) for channel in mean)
+
+
+def hash_distance(a: str, b: str) -> int:
+    """
+    Differing gradient bits between two perceptual hashes; 64 when the colors clearly differ.
+    """
+    bits_a, color_a = a.split("-")
+    bits_b, color_b = b.split("-")
+    if any(abs(int(x) - int(y)) > 1 for x, y in zip(color_a, color_b)):
+        return 64
+    return bin(int(bits_a, 16) ^ int(bits_b, 16)).count("1")
+
+
+def normalize_bytes(data: bytes, max_side: int = IMAGE_MAX_SIDE, quality: int = IMAGE_QUALITY) -> tuple:
+    """
+    Returns (jpeg bytes, width, height, perceptual hash). Raises ValueError for undecodable images.
+    Runs in the worker processes.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "L"):
+                # Transparent areas become white rather than black
+                background = Image.new("RGB", image.size, "white")
+                rgba = image.convert("RGBA")
+                background.paste(rgba, mask=rgba.getchannel("A"))
+                image = background
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            out = io.BytesIO()
+            # A fresh save carries no EXIF/GPS/ICC metadata unless passed explicitly
+            image.save(out, format="JPEG", quality=quality, optimize=True)
+            return out.getvalue(), image.width, image.height, perceptual_hash(image)
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError("Unreadable image") from e
+
+
+def _pool_executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Not fork: by now the server runs other threads (the asyncio loop, SQLite, locks held mid-request)
+            # and a forked child would inherit their state half-way
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Drops a broken pool (a worker died, e.g. to the OOM killer) so the next call starts a fresh one.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _outcome(normalize):
+    try:
+        return normalize()
+    except ValueError as e:
+        return e
+
+
+def _normalize_all(images: list) -> list:
+    """
+    normalize_bytes for each image: in the pool, once more in a fresh pool if
+    it breaks, then in this process. Returns results or ValueErrors, in order.
+    """
+    for _ in range(2):
+        pool = _pool_executor()
+        try:
+            futures = [pool.submit(normalize_bytes, data) for data in images]
+            return [_outcome(future.result) for future in futures]
+        except BrokenProcessPool as e:
+            print(f"Image pool broke, restarting it: {e}")
+            _discard_pool(pool)
+    print("Image pool unavailable, normalizing in-process")
+    return [_outcome(lambda data=data: normalize_bytes(data)) for data in images]
+
+
+def _result(original: bytes, mime: str, normalized) -> dict:
+    if normalized is None:
+        data, width, height, phash = original, None, None, None
+    else:
+        data, width, height, phash = normalized
+        mime = "image/jpeg"
+    return {
+        "data_url": f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}",
+        "bytes": len(data),
+        "original_bytes": len(original),
+        "width": width,
+        "height": height,
+        "phash": phash,
+    }
+
+
+def normalize_data_urls(data_urls: list) -> list:
+    """
+    Normalizes many data URLs in the process pool. Returns, in order, a dict
+    {"data_url", "bytes", "original_bytes", "width", "height", "phash"} per
+    image, or a ValueError for images that can't be decoded.
+    """
+    decoded = []
+    for data_url in data_urls:
+        if isinstance(data_url, str) and data_url.startswith(("http://", "https://")):
+            # Remote images are fetched by the model itself; nothing to normalize here
+            decoded.append({"data_url": data_url, "bytes": None, "original_bytes": None,
+                            "width": None, "height": None, "phash": None})
+            continue
+        try:
+            decoded.append(decode_data_url(data_url))
+        except ValueError as e:
+            decoded.append(e)
+
+    if not available():
+        return [d if isinstance(d, (ValueError, dict)) else _result(d[0], d[1], None) for d in decoded]
+
+    normalized = iter(_normalize_all([d[0] for d in decoded if isinstance(d, tuple)]))
+    results = []
+    for d in decoded:
+        if not isinstance(d, tuple):
+            results.append(d)
+            continue
+        image = next(normalized)
+        results.append(image if isinstance(image, ValueError) else _result(d[0], d[1], image))
+    return results
+
+
+def normalize_data_url(data_url: str) -> dict:
+    """
+    Single-image normalize_data_urls; raises ValueError for undecodable images.
+    """
+    result = normalize_data_urls([data_url])[0]
+    if isinstance(result, ValueError):
+        raise result
+    return result
@@ -0,0 +1,176 @@
+"""
+Lightweight in-process metrics with a Prometheus text endpoint.
+
+Counters and histograms are plain dicts guarded by a lock, so recording a
+sample is a dict lookup and an addition; cheap enough to leave on. Values
+that components already track themselves (cache hit counts and the like)
+are not duplicated: collectors read them only when /metrics is scraped.
+
+    with metrics.stage("llm"):
+        resp = client.chat.completions.create(...)
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_collectors = {}
+
+
+def _label_text(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_label_text(self.labels, key)} {_number(v)}" for key, v in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            series = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                labels = _label_text(self.labels + ("le",), key + (_number(float(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def register_collector(fn, name: str = None) -> None:
+    """
+    fn() returns [(name, type, help, {label: value}, value), ...], read at scrape time.
+    Registering again under the same name replaces the earlier collector.
+    """
+    _collectors[name or fn] = fn
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines += metric.render()
+    families = {}  # name -> header lines + samples; a family's lines must be contiguous
+    for collector in list(_collectors.values()):
+        try:
+            samples = collector()
+        except Exception as e:  # a broken collector must not break the endpoint
+            print(f"Metrics collector failed: {e}")
+            continue
+        for name, kind, help_text, labels, value in samples:
+            family = families.setdefault(name, [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+            family.append(f"{name}{_label_text(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    for family in families.values():
+        lines += family
+    return "\n".join(lines) + "\n"
+
+
+# --- STANDARD METRICS ---
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time to build the response (first byte for streams)",
+                            ["method", "route", "status"])
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Time spent per processing stage", ["stage"])
+OUTBOUND_SECONDS = Histogram("outbound_http_duration_seconds", "Outbound HTTP calls made with the shared session",
+                             ["host", "status"])
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the LLM API", ["endpoint", "kind"])
+OUTFIT_FIXES = Counter("outfit_validation_fixes_total", "Outfits corrected by validate_outfit", ["endpoint"])
+ERRORS = Counter("errors_total", "Handled errors by where they happened", ["where"])
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+
+
+def timed(name: str):
+    """
+    Decorator form of stage().
+    """
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def init_app(app) -> None:
+    """
+    Times every request by route template (not raw path, to keep label
+    cardinality bounded).
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route,
+                                    status=str(response.status_code))
+        return response
@@ -0,0 +1,195 @@
+"""
+Shared outbound clients.
+
+All HTTP to third parties goes through one pooled requests.Session (with
+retry + backoff for idempotent calls) and one OpenAI client per process,
+so keep-alive connections are reused instead of reopened per request.
+
+For fan-out work (many LLM calls for one request, e.g. batch recognition)
+there is an asyncio event loop running in a background thread with a
+shared AsyncOpenAI client: hundreds of calls can be in flight there
+without holding a thread each.
+
+Nothing is created (or imported: the OpenAI SDK alone takes a few hundred
+milliseconds) until first use, so importing the app, forking workers and
+running tests against mocks don't pay for clients they never call.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+from urllib.parse import urlparse
+
+import metrics
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.2"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "64"))
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "5"))
+RATE_LIMIT_BACKOFF = float(os.getenv("RATE_LIMIT_BACKOFF", "1.0"))
+
+
+def make_session(pool_size: int = HTTP_POOL_SIZE, retries: int = HTTP_RETRIES,
+                 backoff: float = HTTP_BACKOFF):
+    """
+    requests.Session with a keep-alive pool of pool_size connections per host
+    and exponential backoff on connection errors and 429/5xx for GET requests.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset({"GET", "HEAD"}), respect_retry_after_header=True,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.hooks["response"].append(_observe_response)
+    return s
+
+
+def _observe_response(response, *args, **kwargs):
+    metrics.OUTBOUND_SECONDS.observe(response.elapsed.total_seconds(), host=urlparse(response.url).hostname or "",
+                                     status=str(response.status_code))
+
+
+_lock = threading.Lock()
+_session = None
+_llm = None
+_async_llm = None
+_loop = None
+
+
+def session():
+    """
+    Process-wide pooled session (see make_session).
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+
+def llm():
+    """
+    Process-wide OpenAI client. The SDK retries 429/5xx with backoff and
+    honours Retry-After; OPENAI_BASE_URL points it at a mock server.
+    """
+    global _llm
+    with _lock:
+        if _llm is None:
+            from openai import OpenAI
+            _llm = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=LLM_RETRIES, timeout=LLM_TIMEOUT)
+        return _llm
+
+
+# --- ASYNC FAN-OUT ---
+
+def event_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="outbound-loop", daemon=True).start()
+        return _loop
+
+
+def async_llm():
+    global _async_llm
+    with _lock:
+        if _async_llm is None:
+            from openai import AsyncOpenAI
+            _async_llm = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=LLM_RETRIES,
+                                     timeout=LLM_TIMEOUT)
+        return _async_llm
+
+
+def submit(coro):
+    """
+    Schedules a coroutine on the background loop; returns a concurrent Future.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, event_loop())
+
+
+def complete_many(calls: list, concurrency: int = LLM_CONCURRENCY, timeout: float = None, client=None) -> list:
+    """
+    Runs chat.completions.create(**kwargs) for every kwargs dict in calls
+    concurrently, at most `concurrency` at a time, on client (an AsyncOpenAI,
+    async_llm() by default). Returns responses in the same order; failed
+    calls are returned as their exception.
+    """
+    async def run():
+        sem = asyncio.Semaphore(concurrency)
+        llm_client = client or async_llm()
+
+        async def one(kwargs):
+            async with sem:
+                return await llm_client.chat.completions.create(**kwargs)
+
+        return await asyncio.gather(*(one(kw) for kw in calls), return_exceptions=True)
+
+    return submit(run()).result(timeout)
+
+
+def _retry_after(error):
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def complete_as_completed(calls: list, concurrency: int = LLM_CONCURRENCY, retries: int = RATE_LIMIT_RETRIES,
+                          client=None):
+    """
+    Like complete_many, but yields (index, response or exception) as each
+    call finishes. Closing the generator early cancels the calls still
+    running. A 429 pauses the whole pool (Retry-After, or exponential
+    backoff) before the call is retried, instead of every worker hammering
+    the limit on its own.
+    """
+    from openai import RateLimitError
+
+    results = queue.Queue()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        sem = asyncio.Semaphore(concurrency)
+        llm_client = (client or async_llm()).with_options(max_retries=0)
+        resume_at = 0.0
+
+        async def one(index, kwargs):
+            nonlocal resume_at
+            async with sem:
+                for attempt in range(retries + 1):
+                    wait = resume_at - loop.time()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    try:
+                        result = await llm_client.chat.completions.create(**kwargs)
+                    except RateLimitError as e:
+                        result = e
+                        delay = _retry_after(e) or RATE_LIMIT_BACKOFF * 2 ** attempt
+                        resume_at = max(resume_at, loop.time() + delay)
+                        continue
+                    except Exception as e:
+                        result = e
+                    break
+                results.put((index, result))
+
+        try:
+            await asyncio.gather(*(one(i, kw) for i, kw in enumerate(calls)))
+        finally:
+            results.put(None)
+
+    future = submit(run())
+    try:
+        yield from iter(results.get, None)
+    finally:
+        future.cancel()  # no-op once done; the consumer stopped early (e.g. its client went away)
@@ -0,0 +1,462 @@
+"""
+Local, deterministic outfit generator.
+
+Builds outfits with the same structure validate_outfit enforces (1 bottom,
+1 pair of shoes, 1-2 tops, 0-1 outerwear, a couple of accessories) and
+scores them on:
+- weather fit: item season and warmth against the temperature,
+- style fit: item style/tags against the profile style and the event,
+- color harmony between the pieces,
+- rotation: rarely worn items get a small boost (slow fashion).
+
+Items are scored individually first, so only the best few per category are
+combined; generation stays in the millisecond range for wardrobes with
+thousands of items.
+
+WardrobeIndex serves the LLM prompt: it ranks a wardrobe per category
+against the weather and event so the prompt gets the most relevant items
+rather than the first few.
+
+plan builds one outfit per day for a multi-day plan; replace_repeats keeps
+shoes (NO_REPEAT_CATEGORIES) from being worn twice in one plan.
+"""
+
+import heapq
+import itertools
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from categorizer import categorize
+
+CANDIDATES_PER_CATEGORY = {"bottoms": 4, "shoes": 4, "tops": 5, "outerwear": 4, "accessories": 3}
+MAX_ACCESSORIES = 2
+
+# Keyword -> warmth level (1 light .. 3 heavy)
+WARMTH_WORDS = [
+    (3, ["heavy", "warm", "thick", "wool", "down", "fleece", "insulated", "high"]),
+    (2, ["medium", "moderate", "mid"]),
+    (1, ["light", "thin", "cool", "breathable", "low"]),
+]
+TYPE_WARMTH = [
+    (3, ["coat", "parka", "puffer", "sweater", "hoodie", "boot", "beanie", "scarf", "glove"]),
+    (1, ["shorts", "tank", "sandal", "t-shirt", "tshirt", "skirt", "cap"]),
+]
+
+SEASONS = ("winter", "spring", "summer", "autumn")
+
+# Event keyword -> style words that suit it
+EVENT_STYLES = {
+    "office": ["formal", "business", "smart", "classic", "elegant"],
+    "work": ["formal", "business", "smart", "classic"],
+    "interview": ["formal", "business", "smart", "classic"],
+    "meeting": ["formal", "business", "smart"],
+    "university": ["casual", "smart", "comfortable", "street"],
+    "school": ["casual", "comfortable"],
+    "gym": ["sport", "athletic", "active", "sporty"],
+    "run": ["sport", "athletic", "active"],
+    "sport": ["sport", "athletic", "active"],
+    "date": ["elegant", "smart", "chic", "romantic"],
+    "party": ["party", "elegant", "chic", "trendy"],
+    "wedding": ["formal", "elegant", "classic"],
+    "walk": ["casual", "comfortable"],
+    "travel": ["casual", "comfortable"],
+}
+
+NEUTRALS = {"black", "white", "grey", "gray", "beige", "navy", "denim", "brown", "khaki", "cream",
+            "ivory", "tan", "camel", "charcoal", "silver", "nude", "taupe", "olive"}
+HUES = {"red": 0, "burgundy": 345, "pink": 330, "coral": 15, "orange": 30, "mustard": 45, "yellow": 55,
+        "lime": 80, "green": 120, "mint": 150, "teal": 175, "turquoise": 180, "cyan": 185, "blue": 220,
+        "purple": 275, "violet": 270, "lavender": 265, "magenta": 300}
+
+
+# --- PARSING ---
+
+def parse_weather(weather) -> tuple:
+    """
+    Extracts (temperature °C, wind km/h) from a string like
+    "12°C, wind 9km/h in Kosice". Missing values are None.
+    """
+    text = " ".join(str(weather or "").casefold().split())
+    temp = re.search(r"(-?\d+(?:\.\d+)?)\s*°?\s*c\b", text)
+    wind = re.search(r"wind\D*(\d+(?:\.\d+)?)", text)
+    return (float(temp.group(1)) if temp else None), (float(wind.group(1)) if wind else None)
+
+
+def _words(*values) -> frozenset:
+    text = " ".join(str(v) for v in values if v).lower()
+    return frozenset(re.findall(r"[a-z]+", text))
+
+
+@lru_cache(maxsize=65536)
+def _features(item_type, season, warmth, style, tags: tuple, colors, color) -> tuple:
+    """
+    (category, seasons, warmth level, style words, hues, has_neutral) for one item.
+    Memoized on the raw attribute values, so repeated wardrobes are cheap.
+    """
+    item_type = str(item_type or "")
+    category = categorize(item_type)
+    season_text = str(season or "").lower()
+    if not season_text or "all" in season_text:
+        seasons = frozenset(SEASONS)
+    else:
+        seasons = frozenset(s for s in SEASONS if s in season_text or (s == "autumn" and "fall" in season_text))
+        seasons = seasons or frozenset(SEASONS)
+
+    type_text = item_type.lower()
+    warmth_text = str(warmth or "").lower()
+    level = None
+    for value, words in WARMTH_WORDS:
+        if any(w in warmth_text for w in words):
+            level = value
+            break
+    if level is None:
+        level = next((value for value, words in TYPE_WARMTH if any(w in type_text for w in words)), 2)
+
+    hues = []
+    neutral = False
+    color_names = [colors] if isinstance(colors, str) else list(colors or ())
+    for name in color_names + [color]:
+        for word in re.findall(r"[a-z]+", str(name or "").lower()):
+            if word in NEUTRALS:
+                neutral = True
+            elif word in HUES:
+                hues.append(HUES[word])
+    return category, seasons, level, _words(style, type_text, *tags), tuple(hues), neutral
+
+
+def item_features(item: dict) -> tuple:
+    tags = item.get("tags")
+    colors = item.get("colors")
+    return _features(item.get("type"), item.get("season"), item.get("warmth"), item.get("style"),
+                     tuple(map(str, tags)) if isinstance(tags, list) else (),
+                     tuple(map(str, colors)) if isinstance(colors, list) else str(colors or ""),
+                     str(item.get("color") or ""))
+
+
+# --- SCORING ---
+
+def target_conditions(temp) -> tuple:
+    """
+    (season, ideal warmth level) for a temperature; unknown weather is mild.
+    """
+    if temp is None:
+        return None, 2
+    if temp >= 22:
+        return "summer", 1
+    if temp >= 14:
+        return "spring", 1.5
+    if temp >= 6:
+        return "autumn", 2.5
+    return "winter", 3
+
+
+def _style_words(profile: dict, event) -> tuple:
+    style = _words(profile.get("style"))
+    event_words = _words(event)
+    wanted = set()
+    for word in event_words:
+        wanted.update(EVENT_STYLES.get(word, []))
+    return style, frozenset(wanted)
+
+
+def weather_score(seasons: frozenset, warmth: int, season, ideal_warmth) -> float:
+    score = 0.0
+    if season is not None:
+        score += 1.0 if season in seasons or (season == "spring" and "autumn" in seasons) else -1.0
+    return score - abs(warmth - ideal_warmth) * 0.6
+
+
+def style_score(words: frozenset, style_words: frozenset, event_words: frozenset) -> float:
+    score = 0.0
+    if style_words:
+        score += 0.8 * len(words & style_words) / len(style_words)
+    if event_words:
+        score += 1.2 if words & event_words else 0.0
+    return score
+
+
+def rotation_score(usage) -> float:
+    # Nudge towards pieces that are rarely worn
+    try:
+        return 0.3 / (1 + max(int(usage or 0), 0))
+    except (TypeError, ValueError):
+        return 0.3
+
+
+def score_item(features: tuple, season, ideal_warmth, style_words: frozenset, event_words: frozenset,
+               usage: int = 0) -> float:
+    category, seasons, warmth, words, _, _ = features
+    return (weather_score(seasons, warmth, season, ideal_warmth) + style_score(words, style_words, event_words)
+            + rotation_score(usage))
+
+
+def conditions(weather) -> tuple:
+    """
+    (temperature, season, ideal warmth) for a weather string; strong wind asks for warmer pieces.
+    """
+    temp, wind = parse_weather(weather)
+    season, ideal = target_conditions(temp)
+    if wind is not None and wind >= 30:
+        ideal = min(3, ideal + 0.5)
+    return temp, season, ideal
+
+
+def hue_harmony(a: float, b: float) -> float:
+    diff = abs(a - b) % 360
+    diff = min(diff, 360 - diff)
+    if diff <= 40:
+        return 0.8  # analogous / monochrome
+    if diff >= 150:
+        return 0.9  # complementary
+    if 110 <= diff <= 130:
+        return 0.6  # triadic
+    return 0.2
+
+
+def pair_harmony(fa: tuple, fb: tuple) -> float:
+    hues_a, neutral_a = fa[4], fa[5]
+    hues_b, neutral_b = fb[4], fb[5]
+    if not hues_a or not hues_b:
+        return 1.0 if (neutral_a or not hues_a) and (neutral_b or not hues_b) else 0.9
+    return max(hue_harmony(a, b) for a in hues_a for b in hues_b)
+
+
+# --- GENERATION ---
+
+def _describe(items: list, temp, style: str) -> str:
+    names = ", ".join(str(item.get("type") or "item") for item in items)
+    parts = [f"Picked {names}"]
+    if temp is not None:
+        parts.append(f"for {temp:.0f}°C")
+    if style:
+        parts.append(f"to match your {style} style")
+    return " ".join(parts) + ", with colors that work together."
+
+
+def check_inputs(wardrobe, exclude=()) -> None:
+    """
+    Raises ValueError unless wardrobe is a list of item dicts and exclude a list of ids.
+    """
+    if not isinstance(wardrobe, list) or not all(isinstance(item, dict) for item in wardrobe):
+        raise ValueError("The wardrobe must be a list of item objects")
+    if not (isinstance(exclude, (list, tuple, set, frozenset))
+            and all(isinstance(item_id, (str, int)) for item_id in exclude)):
+        raise ValueError("Excluded items must be a list of item ids")
+
+
+def generate(wardrobe: list, weather, profile: dict, event="", exclude=(), n: int = 1) -> list:
+    """
+    Returns up to n candidate outfits, best first:
+    [{"items": [ids], "score": float, "reason": str}, ...].
+    Items in `exclude` (e.g. the previous outfit for a remix) are penalised.
+    Raises ValueError for malformed input (see check_inputs).
+    """
+    check_inputs(wardrobe, exclude or ())
+    temp, season, ideal = conditions(weather)
+    style_words, event_words = _style_words(profile, event)
+    exclude = set(exclude or ())
+
+    by_category = {category: [] for category in CANDIDATES_PER_CATEGORY}
+    for item in wardrobe:
+        item_id = item.get("id")
+        if item_id is None:
+            continue
+        features = item_features(item)
+        score = score_item(features, season, ideal, style_words, event_words, item.get("usageCount") or 0)
+        if item_id in exclude:
+            score -= 2.0
+        by_category[features[0]].append((score, item_id, item, features))
+
+    pools = {category: heapq.nlargest(CANDIDATES_PER_CATEGORY[category], entries, key=lambda e: e[0])
+             for category, entries in by_category.items()}
+
+    # Pairwise harmony between the few shortlisted pieces, computed once
+    shortlisted = [e for category in ("bottoms", "shoes", "tops", "outerwear") for e in pools[category]]
+    harmony = {(id(a), id(b)): pair_harmony(a[3], b[3]) for a, b in itertools.combinations(shortlisted, 2)}
+    harmony.update({(b, a): h for (a, b), h in list(harmony.items())})
+
+    # Cold days want a layer; hot days are better without one
+    outer_options = [None] + pools["outerwear"]
+    if temp is not None and temp >= 22:
+        outer_options = [None]
+    top_options = [(t,) for t in pools["tops"]] + list(itertools.combinations(pools["tops"], 2))
+    bottom_options = pools["bottoms"] or [None]
+    shoe_options = pools["shoes"] or [None]
+    top_options = top_options or [()]
+
+    outfits = []
+    for bottom, shoes, tops, outer in itertools.product(bottom_options, shoe_options, top_options, outer_options):
+        pieces = [p for p in (bottom, shoes, outer) if p is not None] + list(tops)
+        if not pieces:
+            continue
+        score = sum(p[0] for p in pieces) / len(pieces)
+        if len(tops) == 2:
+            score -= 0.15  # layering two tops only when it clearly helps
+        if outer is None and temp is not None and temp < 14:
+            score -= 1.0
+        pairs = [harmony[id(a), id(b)] for a, b in itertools.combinations(pieces, 2)]
+        score += 1.5 * (sum(pairs) / len(pairs) if pairs else 1.0)
+        outfits.append((score, pieces))
+
+    best = heapq.nlargest(n, outfits, key=lambda o: o[0])
+    result = []
+    for score, pieces in best:
+        features = [p[3] for p in pieces]
+        accessories = [a for a in pools["accessories"] if a[0] > 0 and
+                       all(pair_harmony(a[3], f) >= 0.6 for f in features)][:MAX_ACCESSORIES]
+        pieces = pieces + accessories
+        result.append({
+            "items": [p[1] for p in pieces],
+            "score": round(score, 3),
+            "reason": _describe([p[2] for p in pieces], temp, profile.get("style")),
+        })
+    return result
+
+
+# --- PROMPT PRESELECTION ---
+
+class WardrobeIndex:
+    """
+    A wardrobe indexed for fast ranking:
+    - per category, items are bucketed by (seasons, warmth), so the weather
+      part of the score is computed once per bucket; within a bucket items
+      are pre-sorted by rotation score,
+    - per category, an inverted index maps style words to items, so only
+      items that match the profile style or the event are scored one by one.
+    Ranking therefore touches a few entries per bucket plus the matching
+    items instead of the whole wardrobe.
+    """
+
+    def __init__(self, wardrobe: list):
+        self.size = len(wardrobe)
+        self.buckets = {category: {} for category in CANDIDATES_PER_CATEGORY}
+        self.by_word = {category: {} for category in CANDIDATES_PER_CATEGORY}
+        for pos, item in enumerate(wardrobe):
+            if not isinstance(item, dict) or item.get("id") is None:
+                continue
+            category, seasons, warmth, words, _, _ = item_features(item)
+            entry = (rotation_score(item.get("usageCount")), pos, item, words, (seasons, warmth))
+            self.buckets[category].setdefault(entry[4], []).append(entry)
+            for word in words:
+                self.by_word[category].setdefault(word, []).append(entry)
+        for buckets in self.buckets.values():
+            for entries in buckets.values():
+                entries.sort(key=lambda e: (-e[0], e[1]))
+
+    def top(self, category: str, k: int, season, ideal, style_words: frozenset, event_words: frozenset) -> list:
+        """
+        The k best items of a category, best first (ties keep wardrobe order).
+        """
+        matched = {}
+        by_word = self.by_word[category]
+        for word in style_words | event_words:
+            for entry in by_word.get(word, ()):
+                matched[entry[1]] = entry
+
+        scored = []
+        bases = {}
+        for bucket, entries in self.buckets[category].items():
+            base = bases[bucket] = weather_score(*bucket, season, ideal)
+            taken = 0
+            for entry in entries:
+                if taken == k:
+                    break
+                if entry[1] not in matched:
+                    scored.append((base + entry[0], entry[1], entry[2]))
+                    taken += 1
+        for rotation, pos, item, words, bucket in matched.values():
+            scored.append((bases[bucket] + rotation + style_score(words, style_words, event_words), pos, item))
+        return [item for _, _, item in heapq.nsmallest(k, scored, key=lambda e: (-e[0], e[1]))]
+
+    def ranked(self, weather, profile: dict, event="", k: int = 50) -> dict:
+        """
+        {category: up to k items, best first} for the given weather and event.
+        """
+        _, season, ideal = conditions(weather)
+        style_words, event_words = _style_words(profile or {}, event)
+        return {category: self.top(category, k, season, ideal, style_words, event_words)
+                for category in CANDIDATES_PER_CATEGORY}
+
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def index_for(wardrobe: list) -> WardrobeIndex:
+    """
+    WardrobeIndex for a wardrobe list, reused while the same (unmodified)
+    list object is passed in, e.g. the store's cached item list.
+    """
+    key = id(wardrobe)
+    with _index_lock:
+        cached = _index_cache.get(key)
+        if cached is not None and cached[0] is wardrobe and cached[1].size == len(wardrobe):
+            _index_cache.move_to_end(key)
+            return cached[1]
+    index = WardrobeIndex(wardrobe)
+    with _index_lock:
+        _index_cache[key] = (wardrobe, index)
+        while len(_index_cache) > 4:
+            _index_cache.popitem(last=False)
+    return index
+
+
+# --- MULTI-DAY PLANS ---
+
+# Categories whose items may be worn on only one day of a plan
+NO_REPEAT_CATEGORIES = ("shoes",)
+
+
+def replace_repeats(wardrobe: list, plan: list, slots: list, profile: dict,
+                    categories=NO_REPEAT_CATEGORIES) -> list:
+    """
+    Swaps items (in the given categories) already worn on an earlier day of
+    plan, a list of item-id lists changed in place, for the best unused item
+    of that category for the day's weather and event. A repeat stays when
+    nothing unused is left. Returns the swaps as [(day, old id, new id)].
+    """
+    index = index_for(wardrobe)
+    by_id = {item.get("id"): item for item in wardrobe if isinstance(item, dict)}
+    used = {category: set() for category in categories}
+    swaps = []
+    for day, (items, slot) in enumerate(zip(plan, slots)):
+        ranked = None
+        for position, item_id in enumerate(items):
+            item = by_id.get(item_id)
+            category = categorize(str(item.get("type") or "")) if item is not None else None
+            if category not in used:
+                continue
+            if item_id in used[category]:
+                if ranked is None:
+                    k = sum(len(ids) for ids in used.values()) + len(items) + 1
+                    ranked = index.ranked(slot.get("weather"), profile or {}, slot.get("event") or "", k=k)
+                spare = next((c.get("id") for c in ranked[category]
+                              if c.get("id") not in used[category] and c.get("id") not in items), None)
+                if spare is not None:
+                    items[position] = spare
+                    swaps.append((day, item_id, spare))
+                    item_id = spare
+            used[category].add(item_id)
+    return swaps
+
+
+def plan(wardrobe: list, slots: list, profile: dict, categories=NO_REPEAT_CATEGORIES) -> list:
+    """
+    One outfit per slot ({"weather", "event"}), as [{"items", "reason"}].
+    Pieces worn earlier in the plan are penalised so days differ, and items
+    in `categories` are not repeated at all while there are alternatives.
+    """
+    outfits, worn = [], set()
+    for slot in slots:
+        best = generate(wardrobe, slot.get("weather"), profile, slot.get("event") or "", exclude=worn)
+        items = list(best[0]["items"]) if best else []
+        outfits.append({"items": items, "reason": best[0]["reason"] if best else ""})
+        worn.update(items)
+
+    by_id = {item.get("id"): item for item in wardrobe if isinstance(item, dict)}
+    for day, _, _ in replace_repeats(wardrobe, [o["items"] for o in outfits], slots, profile, categories):
+        temp, _, _ = conditions(slots[day].get("weather"))
+        outfits[day]["reason"] = _describe([by_id[i] for i in outfits[day]["items"]], temp, profile.get("style"))
+    return outfits
@@ -0,0 +1,201 @@
+"""
+Compact, token-budgeted wardrobe encoding for LLM prompts.
+
+Instead of a JSON list that repeats every key for every item, the wardrobe
+is sent as a table: one header row, then one "|"-separated row per item
+with a short numeric id. The model answers with those short ids, which
+decode_ids maps back to the real item ids.
+
+Token counts come from tiktoken when it is installed (and its encoding is
+available offline), otherwise from a conservative word/punctuation
+heuristic, which is announced once at first use. fit_wardrobe drops the least relevant rows until the prompt fits
+the budget and summarises what was left out.
+"""
+
+import math
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+
+import metrics
+
+COLUMNS = ["id", "type", "color", "style", "season", "warmth"]
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+MIN_ROWS = 10
+LOG_TOKEN_USAGE = bool(int(os.getenv("LOG_TOKEN_USAGE", "0")))
+
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+# --- TOKEN COUNTING ---
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        print("tiktoken is not installed: prompt token counts are estimates and budgets may be overshot "
+              "(pip install tiktoken, see README.md)")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:  # unknown model, or the encoding file can't be fetched offline
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f"No tiktoken encoding for {model} ({e}): prompt token counts are estimates")
+            return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Tokens in text for the given model; estimated when tiktoken is unavailable.
+    """
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # ~4 characters per token for words, one token per punctuation mark
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PIECES.findall(text))
+
+
+def count_messages(messages: list, model: str = "gpt-4o") -> int:
+    # Chat format adds a few tokens per message and per reply
+    return sum(count_tokens(str(m.get("content") or ""), model) + 4 for m in messages) + 3
+
+
+# --- ENCODING ---
+
+def _cell(value) -> str:
+    if isinstance(value, (list, tuple)):
+        value = ",".join(str(v) for v in value)
+    return " ".join(str(value or "").replace("|", "/").split())
+
+
+def encode_row(short_id, item: dict) -> str:
+    return "|".join([str(short_id)] + [_cell(item.get(column)) for column in COLUMNS[1:]])
+
+
+def row_tokens(item: dict, model: str = "gpt-4o") -> int:
+    return count_tokens(encode_row(0, item), model) + 1
+
+
+def encode_wardrobe(items: list) -> tuple:
+    """
+    Returns (table text, {short id: real id}). Short ids are row numbers from 1.
+    """
+    id_map = {}
+    rows = ["|".join(COLUMNS)]
+    for short_id, item in enumerate(items, start=1):
+        id_map[str(short_id)] = item.get("id")
+        rows.append(encode_row(short_id, item))
+    return "\n".join(rows), id_map
+
+
+def short_ids(real_ids, items: list) -> list:
+    """
+    Short ids (row numbers) that encode_wardrobe(items) gives the real ids; unknown ids are skipped.
+    """
+    position = {str(item.get("id")): row for row, item in enumerate(items, start=1)}
+    return [position[str(i)] for i in real_ids or () if str(i) in position]
+
+
+def decode_ids(ids, id_map: dict) -> list:
+    """
+    Maps short ids from a model answer back to real ids, dropping unknown ones.
+    """
+    decoded = []
+    for short_id in ids or ():
+        real = id_map.get(str(short_id).strip())
+        if real is not None and real not in decoded:
+            decoded.append(real)
+    return decoded
+
+
+def create_wardrobe_summary(wardrobe: list) -> str:
+    """
+    Creates a concise text summary of wardrobe instead of full JSON
+    to save tokens when wardrobe is very large.
+    """
+    if not wardrobe:
+        return "No wardrobe items"
+    types = Counter(str(item.get("type") or "Other") for item in wardrobe)
+    summary = "Available wardrobe items:\n"
+    summary += "".join(f"- {item_type}: {count} items\n" for item_type, count in sorted(types.items()))
+    return summary + f"\nTotal: {len(wardrobe)} items"
+
+
+def fit_wardrobe(items: list, budget: int, model: str = "gpt-4o") -> tuple:
+    """
+    Encodes as many of items (most relevant first) as fit in budget tokens,
+    plus a summary of the rest when there is room for it.
+    Returns (text, id_map, tokens).
+    """
+    table, id_map = encode_wardrobe(items)
+    tokens = count_tokens(table, model)
+    if tokens <= budget or len(items) <= MIN_ROWS:
+        return table, id_map, tokens
+
+    # Largest prefix that fits (binary search, at least MIN_ROWS so the model can still pick an outfit)
+    low, high = MIN_ROWS, len(items)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(encode_wardrobe(items[:mid])[0], model) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    table, id_map = encode_wardrobe(items[:low])
+    tokens = count_tokens(table, model)
+
+    summary = "Not listed (for context only):\n" + create_wardrobe_summary(items[low:])
+    summary_tokens = count_tokens(summary, model)
+    if tokens + summary_tokens <= budget:
+        return table + "\n" + summary, id_map, tokens + summary_tokens
+    return table, id_map, tokens
+
+
+# --- USAGE ---
+
+_usage = Counter()
+_usage_lock = threading.Lock()
+
+
+def record_usage(endpoint: str, response, estimated_prompt: int = None) -> None:
+    """
+    Keeps running totals of the prompt/completion tokens reported by the API
+    (and prints them per call with LOG_TOKEN_USAGE=1). estimated_prompt is
+    our own count of the prompt, exact only with tiktoken.
+    """
+    usage = getattr(response, "usage", None)
+    prompt = getattr(usage, "prompt_tokens", None) or 0
+    completion = getattr(usage, "completion_tokens", None) or 0
+    with _usage_lock:
+        _usage["calls"] += 1
+        _usage["prompt_tokens"] += prompt
+        _usage["completion_tokens"] += completion
+        _usage[f"{endpoint}.prompt_tokens"] += prompt
+        _usage[f"{endpoint}.completion_tokens"] += completion
+        if estimated_prompt is not None:
+            _usage["estimated_prompt_tokens"] += estimated_prompt
+    metrics.LLM_TOKENS.inc(prompt, endpoint=endpoint, kind="prompt")
+    metrics.LLM_TOKENS.inc(completion, endpoint=endpoint, kind="completion")
+    if LOG_TOKEN_USAGE:
+        line = f"{endpoint} tokens: prompt={prompt} completion={completion}"
+        if estimated_prompt is not None:
+            line += f" estimated_prompt={estimated_prompt} ({tokenizer()})"
+        print(line)
+
+
+def tokenizer() -> str:
+    """
+    "tiktoken" when counts are exact, "heuristic" when they are estimates.
+    """
+    return "tiktoken" if _encoding("gpt-4o") is not None else "heuristic"
+
+
+def usage_stats() -> dict:
+    with _usage_lock:
+        stats = dict(_usage)
+    stats["tokenizer"] = tokenizer()
+    return stats
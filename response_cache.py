@@ -0,0 +1,158 @@
+"""
+Response cache for the outfit endpoints.
+
+Requests are keyed on what actually shapes the answer: the optimized
+wardrobe, the profile fields that go into the prompt, the weather rounded
+into buckets and the normalised event. Two page refreshes a few minutes
+apart ("12°C" then "13°C") therefore share one gpt-4o call.
+
+Entries live in an in-memory LRU/TTL cache and, optionally, in a SQLite
+file so they survive restarts and are shared between workers. The file
+drops expired rows and is capped at max_rows, least recently used first.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+
+import storage
+from cache import TTLCache
+from outfit_engine import parse_weather
+
+TEMP_BUCKET = 5  # °C
+WIND_BUCKETS = ((15, "calm"), (30, "breezy"), (float("inf"), "windy"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires);
+"""
+
+
+def _normalise(text) -> str:
+    return " ".join(str(text or "").casefold().split())
+
+
+def weather_bucket(weather) -> str:
+    """
+    Maps a weather string such as "12°C, wind 9km/h in Kosice" to a coarse
+    bucket like "10..15C/calm". Strings without a temperature are used as-is.
+    """
+    temp, wind = parse_weather(weather)
+    if temp is None:
+        return _normalise(weather)
+    low = int(temp // TEMP_BUCKET * TEMP_BUCKET)
+    bucket = f"{low}..{low + TEMP_BUCKET}C"
+    if wind is not None:
+        bucket += "/" + next(name for limit, name in WIND_BUCKETS if wind < limit)
+    return bucket
+
+
+def make_key(kind: str, wardrobe: list, profile_fields: dict, weather, event, extra=None) -> str:
+    """
+    Canonical sha256 over the inputs of an outfit request.
+    """
+    payload = {
+        "kind": kind,
+        "wardrobe": sorted(wardrobe, key=lambda item: str(item.get("id", ""))),
+        "profile": {k: _normalise(v) for k, v in sorted(profile_fields.items())},
+        "weather": weather_bucket(weather),
+        "event": _normalise(event),
+        "extra": extra,
+    }
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-level cache: in-memory LRU/TTL in front of an optional SQLite file.
+
+    The file is created by the first set() and kept bounded: every
+    PURGE_INTERVAL seconds a write also deletes expired rows and, above
+    max_rows, the least recently used ones.
+    """
+
+    PURGE_INTERVAL = 60  # seconds
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600, disk_path: Path = None, max_rows: int = 20000):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk_path = Path(disk_path) if disk_path else None
+        self.disk_hits = 0
+        self.disk_purged = 0
+        self._next_purge = 0.0
+        self._purge_lock = threading.Lock()
+        self.db = storage.SQLiteFile(self.disk_path, SCHEMA, setup=self._migrate) if self.disk_path else None
+
+    @staticmethod
+    def _migrate(conn) -> None:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(responses)")}
+        if "accessed" not in columns:  # files written before rows were capped
+            conn.execute("ALTER TABLE responses ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is not None or not self.disk_path:
+            return value
+        now = time.time()
+        with self.db.read() as conn:
+            row = conn.execute(
+                "SELECT value, expires FROM responses WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self.disk_hits += 1
+        value = json.loads(row[0])
+        self.memory.set(key, value, ttl=row[1] - now)
+        return value
+
+    def set(self, key: str, value) -> None:
+        self.memory.set(key, value)
+        if self.disk_path:
+            now = time.time()
+            with self.db.transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now + self.ttl, now),
+                )
+            if now >= self._next_purge:
+                self.purge(now)
+
+    def purge(self, now: float = None) -> int:
+        """
+        Deletes expired rows, then the least recently used ones above
+        max_rows. Returns how many rows went.
+        """
+        if not self.disk_path:
+            return 0
+        now = time.time() if now is None else now
+        with self._purge_lock:
+            self._next_purge = now + self.PURGE_INTERVAL
+            with self.db.transaction(create=False) as conn:
+                deleted = conn.execute("DELETE FROM responses WHERE expires <= ?", (now,)).rowcount
+                excess = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_rows
+                if excess > 0:
+                    deleted += conn.execute(
+                        "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                        (excess,),
+                    ).rowcount
+            self.disk_purged += deleted
+        return deleted
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats["disk_hits"] = self.disk_hits
+        stats["disk_purged"] = self.disk_purged
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + self.disk_hits) / lookups, 4) if lookups else 0.0
+        return stats
@@ -1,9 +1,10 @@
-const WARDROBE_KEY = "wardrobe_items_v2";
+const WARDROBE_KEY = "wardrobe_items_v2"; // legacy localStorage copy, migrated to the server once
+const WARDROBE_PAGE_SIZE = 200;
 let lastGeneratedOutfitIds = [];
 
 /* ---------- Helpers ---------- */
 
-function loadWardrobe() {
+function loadLocalWardrobe() {
     try {
         const raw = localStorage.getItem(WARDROBE_KEY);
         return raw ? JSON.parse(raw) : [];
@@ -12,16 +13,61 @@ function loadWardrobe() {
     }
 }
 
-function saveWardrobe(items) {
+// Uploads items saved by older versions of the app, then drops the local copy
+async function migrateLocalWardrobe() {
+    const items = loadLocalWardrobe();
+    for (let i = 0; i < items.length; i += 20) {
+        await apiFetch("/api/wardrobe", {
+            method: "POST",
+            headers: {"Content-Type": "application/json"},
+            body: JSON.stringify({items: items.slice(i, i + 20)}),
+        });
+    }
+    localStorage.removeItem(WARDROBE_KEY);
+}
+
+async function loadWardrobe() {
     try {
-        localStorage.setItem(WARDROBE_KEY, JSON.stringify(items));
+        if (localStorage.getItem(WARDROBE_KEY)) await migrateLocalWardrobe();
+        const items = [];
+        let total = Infinity;
+        while (items.length < total) {
+            const page = await apiFetch(`/api/wardrobe?offset=${items.length}&limit=${WARDROBE_PAGE_SIZE}`);
+            items.push(...page.items);
+            total = page.total;
+            if (!page.items.length) break;
+        }
+        return items;
     } catch (e) {
-        alert("Storage full! Please delete some items to add new ones.");
+        console.error(e);
+        return [];
     }
 }
 
+// Items shown in an outfit, fetched by id once per page view rather than paging the whole wardrobe
+const outfitItemCache = new Map();
+
+async function loadItems(ids) {
+    const missing = ids.filter(id => !outfitItemCache.has(id));
+    await Promise.all(missing.map(async id => {
+        try {
+            outfitItemCache.set(id, await apiFetch(`/api/wardrobe/${encodeURIComponent(id)}`));
+        } catch (e) {
+            console.warn("Wardrobe item error", e);
+        }
+    }));
+    return ids.map(id => outfitItemCache.get(id)).filter(Boolean);
+}
+
+function itemImage(item) {
+    return item.imageUrl || item.imageDataUrl || "";
+}
+
 async function apiFetch(url, options = {}) {
-    const res = await fetch(url, options);
+    return readApiResponse(await fetch(url, options));
+}
+
+async function readApiResponse(res) {
     if (!res.ok) {
         let text;
         try { text = await res.text(); } catch { text = ""; }
@@ -30,6 +76,63 @@ async function apiFetch(url, options = {}) {
     try { return await res.json(); } catch { return null; }
 }
 
+// One Idempotency-Key per request: the same request sent again while the first is
+// pending (a double-click) and the retries below reuse its key, so the server
+// generates the outfit (or chat reply) once and hands the same result back.
+const pendingKeys = {};
+const RETRY_STATUSES = [409, 502, 503, 504];
+const MAX_RETRIES = 2;
+
+function newIdempotencyKey() {
+    if (window.crypto?.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+async function postIdempotent(url, body) {
+    const payload = JSON.stringify(body);
+    const pending = `${url}\n${payload}`;
+    const key = pendingKeys[pending] || (pendingKeys[pending] = newIdempotencyKey());
+    const options = {
+        method: "POST",
+        headers: { "Content-Type": "application/json", "Idempotency-Key": key },
+        body: payload,
+    };
+    try {
+        for (let attempt = 0; ; attempt++) {
+            let res = null;
+            try {
+                res = await fetch(url, options);
+            } catch (e) {
+                if (attempt >= MAX_RETRIES) throw e;
+            }
+            if (res && (!RETRY_STATUSES.includes(res.status) || attempt >= MAX_RETRIES)) return res;
+            await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+        }
+    } finally {
+        delete pendingKeys[pending];
+    }
+}
+
+async function apiPostIdempotent(url, body) {
+    return readApiResponse(await postIdempotent(url, body));
+}
+
+// Calls onLine(object) for each line of an NDJSON response as it arrives
+async function readJsonLines(res, onLine) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+        const {value, done} = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), {stream: !done});
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+        lines.filter(l => l.trim()).forEach(l => onLine(JSON.parse(l)));
+        if (done) break;
+    }
+    if (buffer.trim()) onLine(JSON.parse(buffer));
+}
+
 // === IMAGE COMPRESSION (CRITICAL FOR PERFORMANCE) ===
 function resizeImage(file, maxWidth = 600, quality = 0.7) {
     return new Promise((resolve, reject) => {
@@ -69,59 +172,70 @@ function initWardrobePage() {
     const emptyEl = document.getElementById("wardrobe-empty");
     const gridEl = document.getElementById("items-grid");
 
-    const initial = loadWardrobe();
-    renderWardrobeGrid(initial, gridEl, emptyEl);
+    loadWardrobe().then(items => renderWardrobeGrid(items, gridEl, emptyEl));
 
     if (!fileInput) return;
 
     fileInput.addEventListener("change", async () => {
-        const file = fileInput.files[0];
-        if (!file) return;
+        const files = [...fileInput.files];
+        if (!files.length) return;
 
         errorEl.classList.add("hidden");
         uploadText.textContent = "Processing...";
 
         try {
-            // Resize before sending to AI or LocalStorage
-            const imageDataUrl = await resizeImage(file);
+            // Resize before sending to AI and the wardrobe store
+            const images = await Promise.all(files.map(file => resizeImage(file)));
 
-            const meta = await apiFetch("/api/recognize", {
+            const res = await fetch("/api/recognize/batch", {
                 method: "POST",
                 headers: {"Content-Type": "application/json"},
-                body: JSON.stringify({imageDataUrl}),
+                body: JSON.stringify({images}),
             });
+            if (!res.ok) throw new Error(`Request failed: ${res.status}`);
 
-            const isClothing = meta?.is_clothing;
-            const category = meta?.category || "";
+            const items = [];
+            let done = 0, rejected = 0;
+            const nowIso = new Date().toISOString();
+            await readJsonLines(res, (line) => {
+                done += 1;
+                uploadText.textContent = `Processing ${done}/${images.length}...`;
+                const meta = line.result;
+                if (!meta || (!meta.is_clothing && meta.category === "not_clothing")) {
+                    rejected += 1;
+                    return;
+                }
+                items.push({
+                    id: `${Date.now()}-${line.index}`,
+                    imageDataUrl: images[line.index], // Stored compressed as a blob, returned as imageUrl
+                    type: meta.type || "Item",
+                    style: meta.style || "",
+                    season: meta.season || "all",
+                    warmth: meta.warmth || "",
+                    colors: meta.colors || [],
+                    tags: meta.tags || [],
+                    brand: meta.brand || "",
+                    usageCount: 0,
+                    lastUsed: null,
+                    createdAt: nowIso,
+                });
+            });
 
-            if (!isClothing && category === "not_clothing") {
-                errorEl.textContent = "AI didn't detect clothing. Try a clearer photo.";
+            if (items.length) {
+                await apiFetch("/api/wardrobe", {
+                    method: "POST",
+                    headers: {"Content-Type": "application/json"},
+                    body: JSON.stringify({items}),
+                });
+                renderWardrobeGrid(await loadWardrobe(), gridEl, emptyEl);
+            }
+            if (rejected) {
+                errorEl.textContent = images.length === 1
+                    ? "AI didn't detect clothing. Try a clearer photo."
+                    : `${rejected} of ${images.length} photos could not be added. Try clearer photos.`;
                 errorEl.classList.remove("hidden");
-                uploadText.textContent = "Add item";
-                fileInput.value = "";
-                return;
             }
 
-            const nowIso = new Date().toISOString();
-            const item = {
-                id: Date.now().toString(),
-                imageDataUrl, // Saved compressed
-                type: meta?.type || "Item",
-                style: meta?.style || "",
-                season: meta?.season || "all",
-                warmth: meta?.warmth || "",
-                colors: meta?.colors || [],
-                tags: meta?.tags || [],
-                brand: meta?.brand || "",
-                usageCount: 0,
-                lastUsed: null,
-                createdAt: nowIso,
-            };
-
-            const updated = [...loadWardrobe(), item];
-            saveWardrobe(updated);
-            renderWardrobeGrid(updated, gridEl, emptyEl);
-
         } catch (e) {
             console.error(e);
             errorEl.textContent = "Processing failed. Try again.";
@@ -149,7 +263,8 @@ function renderWardrobeGrid(items, gridEl, emptyEl) {
         });
 
         const img = document.createElement("img");
-        img.src = item.imageDataUrl;
+        img.src = itemImage(item);
+        img.loading = "lazy";
         img.alt = item.type;
 
         const meta = document.createElement("div");
@@ -172,15 +287,19 @@ function renderWardrobeGrid(items, gridEl, emptyEl) {
 }
 
 /* ---------- Item Detail Logic ---------- */
-function initWardrobeItemPage() {
+async function initWardrobeItemPage() {
     const itemId = document.body.dataset.itemId;
     const errorEl = document.getElementById("item-error");
     const form = document.getElementById("item-form");
 
     if (!itemId) return;
 
-    let wardrobe = loadWardrobe();
-    let item = wardrobe.find((it) => it.id === itemId);
+    let item = null;
+    try {
+        item = await apiFetch(`/api/wardrobe/${encodeURIComponent(itemId)}`);
+    } catch (e) {
+        console.warn("Item load error", e);
+    }
 
     if (!item) {
         if (errorEl) {
@@ -193,8 +312,8 @@ function initWardrobeItemPage() {
 
     // Populate Fields
     const imgEl = document.getElementById("item-image");
-    if (imgEl && item.imageDataUrl) {
-        imgEl.src = item.imageDataUrl;
+    if (imgEl && itemImage(item)) {
+        imgEl.src = itemImage(item);
         imgEl.style.display = "block";
     }
 
@@ -210,7 +329,7 @@ function initWardrobeItemPage() {
     if(usageEl) usageEl.textContent = `Worn ${item.usageCount || 0} times. Added on ${new Date(item.createdAt).toLocaleDateString()}.`;
 
     // Save
-    form.addEventListener("submit", (e) => {
+    form.addEventListener("submit", async (e) => {
         e.preventDefault();
         ["type", "style", "season", "warmth", "brand"].forEach(field => {
              const el = document.getElementById(`item-${field}`);
@@ -219,8 +338,18 @@ function initWardrobeItemPage() {
 
         if(tagsEl) item.tags = tagsEl.value.split(",").map(s => s.trim()).filter(Boolean);
 
-        wardrobe = loadWardrobe().map(it => it.id === itemId ? item : it);
-        saveWardrobe(wardrobe);
+        try {
+            item = await apiFetch(`/api/wardrobe/${encodeURIComponent(itemId)}`, {
+                method: "PUT",
+                headers: {"Content-Type": "application/json"},
+                body: JSON.stringify(item),
+            });
+        } catch (err) {
+            console.error(err);
+            errorEl.textContent = "Saving failed. Try again.";
+            errorEl.classList.remove("hidden");
+            return;
+        }
 
         const saveBtn = document.getElementById("item-save");
         const originalText = saveBtn.textContent;
@@ -235,10 +364,9 @@ function initWardrobeItemPage() {
     // Delete
     const delBtn = document.getElementById("item-delete");
     if(delBtn) {
-        delBtn.addEventListener("click", () => {
+        delBtn.addEventListener("click", async () => {
             if(confirm("Delete this item?")) {
-                wardrobe = loadWardrobe().filter(it => it.id !== itemId);
-                saveWardrobe(wardrobe);
+                await apiFetch(`/api/wardrobe/${encodeURIComponent(itemId)}`, {method: "DELETE"});
                 window.location.href = "/wardrobe";
             }
         });
@@ -291,12 +419,20 @@ function initHomePage() {
     let cachedProfile = null;
 
     // Load Wardrobe Hint
-    const wardrobe = loadWardrobe();
-    if(hintEl) {
-        hintEl.textContent = wardrobe.length
-            ? `${wardrobe.length} items available for AI styling.`
-            : "⚠️ Wardrobe is empty. Add items first!";
-    }
+    let wardrobeTotal = 0;
+    const wardrobeLoaded = (async () => {
+        if (localStorage.getItem(WARDROBE_KEY)) await migrateLocalWardrobe().catch(console.error);
+        try {
+            wardrobeTotal = (await apiFetch("/api/wardrobe?limit=1")).total;
+        } catch (e) {
+            console.warn("Wardrobe error", e);
+        }
+        if(hintEl) {
+            hintEl.textContent = wardrobeTotal
+                ? `${wardrobeTotal} items available for AI styling.`
+                : "⚠️ Wardrobe is empty. Add items first!";
+        }
+    })();
 
     async function updateWeatherState() {
         const city = cityInput.value.trim();
@@ -337,8 +473,8 @@ function initHomePage() {
 
     if(btn) {
         btn.addEventListener("click", async () => {
-            const currentWardrobe = loadWardrobe();
-            if (!currentWardrobe.length) {
+            await wardrobeLoaded;
+            if (!wardrobeTotal) {
                 alert("Please add items to your wardrobe first!");
                 return;
             }
@@ -351,24 +487,19 @@ function initHomePage() {
             resultCard.classList.add("hidden");
 
             try {
-                const data = await apiFetch("/api/outfit", {
-                    method: "POST",
-                    headers: { "Content-Type": "application/json" },
-                    body: JSON.stringify({
-                        wardrobe: currentWardrobe,
-                        weather: currentWeatherDataString,
-                        user: {
-                            event: eventInput ? eventInput.value : "",
-                            style: cachedProfile?.style || "",
-                        },
-                    }),
+                const data = await apiPostIdempotent("/api/outfit", {
+                    wardrobe_ref: "server",
+                    weather: currentWeatherDataString,
+                    user: {
+                        event: eventInput ? eventInput.value : "",
+                        style: cachedProfile?.style || "",
+                    },
                 });
 
                 const ids = data?.items || [];
                 lastGeneratedOutfitIds = ids;
 
-                const byId = Object.fromEntries(currentWardrobe.map(it => [it.id, it]));
-                let selectedItems = ids.map(id => byId[id]).filter(Boolean);
+                let selectedItems = await loadItems(ids);
 
                 const orderScore = (item) => {
                     const t = (item.type || "").toLowerCase();
@@ -394,7 +525,7 @@ function initHomePage() {
                         const div = document.createElement("div");
                         div.className = "mannequin-item";
                         const img = document.createElement("img");
-                        img.src = item.imageDataUrl;
+                        img.src = itemImage(item);
                         div.appendChild(img);
                         stackEl.appendChild(div);
                     }
@@ -428,21 +559,20 @@ function initHomePage() {
     }
 
     if (wornBtn) {
-        wornBtn.addEventListener("click", () => {
-            const currentWardrobe = loadWardrobe();
-            let updated = false;
-            const nowIso = new Date().toISOString();
-
-            currentWardrobe.forEach((item) => {
-                if (lastGeneratedOutfitIds.includes(item.id)) {
-                    item.usageCount = (item.usageCount || 0) + 1;
-                    item.lastUsed = nowIso;
-                    updated = true;
-                }
-            });
+        wornBtn.addEventListener("click", async () => {
+            let updated = 0;
+            try {
+                const res = await apiFetch("/api/wardrobe/worn", {
+                    method: "POST",
+                    headers: {"Content-Type": "application/json"},
+                    body: JSON.stringify({ids: lastGeneratedOutfitIds, when: new Date().toISOString()}),
+                });
+                updated = res?.updated || 0;
+            } catch (e) {
+                console.error(e);
+            }
 
             if (updated) {
-                saveWardrobe(currentWardrobe);
                 wornStatusEl.textContent = "Great choice! Usage stats updated.";
                 wornBtn.disabled = true;
                 wornBtn.textContent = "Marked as Worn ✔";
@@ -463,8 +593,8 @@ function initHomePage() {
                 return;
             }
 
-            const currentWardrobe = loadWardrobe();
-            if (!currentWardrobe.length) {
+            await wardrobeLoaded;
+            if (!wardrobeTotal) {
                 alert("Wardrobe is empty!");
                 return;
             }
@@ -477,31 +607,25 @@ function initHomePage() {
 
             try {
                 // Get current outfit info for remix reference
-                const byId = Object.fromEntries(currentWardrobe.map(it => [it.id, it]));
-                const currentOutfitItems = lastGeneratedOutfitIds.map(id => byId[id]).filter(Boolean);
                 const currentReason = reasonEl.textContent || "similar style";
 
-                const data = await apiFetch("/api/outfit/remix", {
-                    method: "POST",
-                    headers: { "Content-Type": "application/json" },
-                    body: JSON.stringify({
-                        wardrobe: currentWardrobe,
-                        weather: currentWeatherDataString,
-                        user: {
-                            event: eventInput ? eventInput.value : "",
-                            style: cachedProfile?.style || "",
-                        },
-                        original_outfit: {
-                            items: lastGeneratedOutfitIds,
-                            reason: currentReason
-                        },
-                    }),
+                const data = await apiPostIdempotent("/api/outfit/remix", {
+                    wardrobe_ref: "server",
+                    weather: currentWeatherDataString,
+                    user: {
+                        event: eventInput ? eventInput.value : "",
+                        style: cachedProfile?.style || "",
+                    },
+                    original_outfit: {
+                        items: lastGeneratedOutfitIds,
+                        reason: currentReason
+                    },
                 });
 
                 const ids = data?.items || [];
                 lastGeneratedOutfitIds = ids;
 
-                let selectedItems = ids.map(id => byId[id]).filter(Boolean);
+                let selectedItems = await loadItems(ids);
 
                 const orderScore = (item) => {
                     const t = (item.type || "").toLowerCase();
@@ -526,7 +650,7 @@ function initHomePage() {
                         const div = document.createElement("div");
                         div.className = "mannequin-item";
                         const img = document.createElement("img");
-                        img.src = item.imageDataUrl;
+                        img.src = itemImage(item);
                         div.appendChild(img);
                         stackEl.appendChild(div);
                     }
@@ -571,15 +695,30 @@ function initChatPage() {
     const sendBtn = document.getElementById("chat-send");
     const newBtn = document.getElementById("new-chat-btn");
 
+    const CHAT_PAGE = 30;      // messages per history page
+    const CHAT_LIST_PAGE = 50; // chats per list page
+
     let currentChatId = null;
+    let olderCursor = null;    // ?before= cursor for the page above the oldest loaded message
+    let loadingOlder = false;
+    let listOffset = 0;
+    let listTotal = 0;
+    let loadingList = false;
 
     if (!windowEl) return;
 
     // --- 1. Load List ---
-    async function loadList() {
+    async function loadList(more = false) {
+        if (loadingList) return;
+        loadingList = true;
         try {
-            const chats = await apiFetch("/api/chats");
-            listEl.innerHTML = "";
+            const offset = more ? listOffset : 0;
+            const res = await fetch(`/api/chats?limit=${CHAT_LIST_PAGE}&offset=${offset}`);
+            if (!res.ok) throw new Error(`Request failed: ${res.status}`);
+            const chats = await res.json();
+            listTotal = Number(res.headers.get("X-Total-Count") || 0);
+            listOffset = offset + chats.length;
+            if (!more) listEl.innerHTML = "";
 
             chats.forEach(chat => {
                 const div = document.createElement("div");
@@ -620,11 +759,18 @@ function initChatPage() {
                // loadChat(chats[0].id); // Uncomment if you want auto-select
             }
         } catch(e) { console.error(e); }
+        finally { loadingList = false; }
     }
 
+    listEl.addEventListener("scroll", () => {
+        const nearBottom = listEl.scrollTop + listEl.clientHeight >= listEl.scrollHeight - 40;
+        if (nearBottom && listOffset < listTotal) loadList(true);
+    });
+
     // --- 2. Load Specific Chat ---
     async function loadChat(id) {
         currentChatId = id;
+        olderCursor = null;
         input.disabled = true;
         windowEl.innerHTML = ""; // Clear screen
 
@@ -634,9 +780,10 @@ function initChatPage() {
         loadList();
 
         try {
-            const chatData = await apiFetch(`/api/chats/${id}`);
+            const chatData = await apiFetch(`/api/chats/${id}?limit=${CHAT_PAGE}`);
+            olderCursor = chatData.next_before;
 
-            // Render history
+            // Render history (newest page; older pages load on scroll)
             if (chatData.messages && chatData.messages.length) {
                 chatData.messages.forEach(msg => {
                    addBubble(msg.content, msg.role === "user" ? "user" : "ai");
@@ -651,6 +798,29 @@ function initChatPage() {
         } catch(e) { console.error(e); }
     }
 
+    // Older messages, prepended when the user scrolls to the top
+    async function loadOlder() {
+        if (loadingOlder || olderCursor == null || !currentChatId) return;
+        loadingOlder = true;
+        const chatId = currentChatId;
+        try {
+            const page = await apiFetch(`/api/chats/${chatId}?limit=${CHAT_PAGE}&before=${olderCursor}`);
+            if (chatId !== currentChatId) return;
+            olderCursor = page.next_before;
+            const previousHeight = windowEl.scrollHeight;
+            const fragment = document.createDocumentFragment();
+            page.messages.forEach(msg => fragment.appendChild(makeBubble(msg.content, msg.role === "user" ? "user" : "ai")));
+            windowEl.prepend(fragment);
+            // Keep the messages the user was looking at in place
+            windowEl.scrollTop += windowEl.scrollHeight - previousHeight;
+        } catch(e) { console.error(e); }
+        finally { loadingOlder = false; }
+    }
+
+    windowEl.addEventListener("scroll", () => {
+        if (windowEl.scrollTop < 80) loadOlder();
+    });
+
     // --- 3. Create New ---
     async function createNew() {
         try {
@@ -660,6 +830,13 @@ function initChatPage() {
     }
 
     // --- 4. Send Message ---
+    function makeBubble(text, who) {
+        const div = document.createElement("div");
+        div.className = "bubble " + who;
+        div.innerHTML = text.replace(/\*\*(.*?)\*\*/g, '<b>$1</b>');
+        return div;
+    }
+
     function addBubble(text, who) {
         // Remove placeholder if exists
         const ph = document.getElementById("chat-placeholder");
@@ -667,11 +844,36 @@ function initChatPage() {
         const intro = document.querySelector(".chat-intro");
         if(intro) intro.remove();
 
-        const div = document.createElement("div");
-        div.className = "bubble " + who;
-        div.innerHTML = text.replace(/\*\*(.*?)\*\*/g, '<b>$1</b>');
+        const div = makeBubble(text, who);
         windowEl.appendChild(div);
         windowEl.scrollTop = windowEl.scrollHeight;
+        return div;
+    }
+
+    // Reads a text/event-stream response, calling onEvent(name, data) per event
+    async function readEventStream(res, onEvent) {
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        while (true) {
+            const {value, done} = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, {stream: true});
+
+            let sep;
+            while ((sep = buffer.indexOf("\n\n")) !== -1) {
+                const raw = buffer.slice(0, sep);
+                buffer = buffer.slice(sep + 2);
+                let name = "message";
+                let data = "";
+                raw.split("\n").forEach(line => {
+                    if (line.startsWith("event: ")) name = line.slice(7);
+                    else if (line.startsWith("data: ")) data += line.slice(6);
+                });
+                if (data) onEvent(name, JSON.parse(data));
+            }
+        }
     }
 
     async function send() {
@@ -691,18 +893,33 @@ function initChatPage() {
         windowEl.scrollTop = windowEl.scrollHeight;
 
         try {
-            const res = await apiFetch(`/api/chats/${currentChatId}/message`, {
-                method: "POST",
-                headers: {"Content-Type":"application/json"},
-                body: JSON.stringify({message: text})
+            const res = await postIdempotent(`/api/chats/${currentChatId}/message/stream`, {message: text});
+            if (!res.ok || !res.body) throw new Error(`Request failed: ${res.status}`);
+
+            // Render tokens as they arrive
+            let bubble = null;
+            let reply = "";
+            let failed = false;
+            await readEventStream(res, (event, data) => {
+                if (event === "error") {
+                    failed = true;
+                    return;
+                }
+                if (event === "done") return;
+                reply += data.delta || "";
+                if (!bubble) {
+                    typing.remove();
+                    bubble = addBubble(reply, "ai");
+                } else {
+                    bubble.innerHTML = reply.replace(/\*\*(.*?)\*\*/g, '<b>$1</b>');
+                    windowEl.scrollTop = windowEl.scrollHeight;
+                }
             });
 
             typing.remove();
-            if(res.reply) {
-                addBubble(res.reply, "ai");
-                // Refresh list titles
-                loadList();
-            }
+            if (failed || !reply) throw new Error("Stream failed");
+            // Refresh list titles
+            loadList();
         } catch(e) {
             typing.remove();
             addBubble("Error sending message", "ai");
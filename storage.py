@@ -0,0 +1,280 @@
+"""
+Crash-atomic, concurrency-safe JSON file persistence, and the shared
+SQLite connection the stores are built on.
+
+Writes go to a temp file in the same directory and are swapped in with
+os.replace, so readers see either the old or the new file, never a
+truncated one. Read-modify-write cycles hold a per-file lock that works
+across threads (threading.RLock) and processes (flock/msvcrt on a
+sidecar .lock file), so concurrent workers don't lose each other's updates.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# "always" fsyncs data and directory on every write, "never" leaves it to the OS
+FSYNC_POLICY = os.getenv("STORAGE_FSYNC", "always").lower()
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+class StorageError(Exception):
+    """Raised when a stored file exists but cannot be parsed."""
+
+
+def fsync_enabled() -> bool:
+    return FSYNC_POLICY != "never"
+
+
+# --- LOCKING ---
+
+def _thread_lock(path: Path) -> threading.RLock:
+    key = str(path.resolve())
+    with _thread_locks_guard:
+        if key not in _thread_locks:
+            _thread_locks[key] = threading.RLock()
+        return _thread_locks[key]
+
+
+@contextmanager
+def file_lock(path: Path):
+    """
+    Exclusive lock for a resource, held across threads and processes.
+    The OS lock is taken on '<path>.lock' so the data file itself can be
+    replaced atomically while the lock is held.
+    """
+    path = Path(path)
+    with _thread_lock(path):
+        lock_path = path.with_name(path.name + ".lock")
+        with open(lock_path, "a+b") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+                else:
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# --- READ / WRITE ---
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """
+    Writes data to path via temp file + rename.
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            if fsync_enabled():
+                os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+    if fsync_enabled() and hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def read_json(path: Path, default=None):
+    """
+    Returns the parsed file, or default if it doesn't exist.
+    Raises StorageError if the file is corrupt instead of hiding it.
+    """
+    path = Path(path)
+    try:
+        text = path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return default
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        raise StorageError(f"{path} is not valid JSON: {e}") from e
+
+
+# --- CACHED FILES ---
+
+class CachedJSONFile:
+    """
+    Parsed JSON file kept in memory and revalidated with a single stat()
+    per read. transform(data) is applied once per load, so callers get a
+    ready-to-use object. The cache is refreshed by our own writes through
+    update(), and by (mtime, size, inode) changes made by other processes.
+    """
+
+    def __init__(self, path: Path, transform=None, default=None):
+        self.path = Path(path)
+        self.transform = transform or (lambda data: data)
+        self.default = default
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._value = None
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return "missing"
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _store(self, value, signature) -> None:
+        self._value = value
+        self._signature = signature
+        self.version += 1
+
+    def get(self):
+        """
+        Returns the cached value. Treat it as read-only; copy before mutating.
+        """
+        signature = self._stat_signature()
+        with self._lock:
+            if self._signature is not None and signature == self._signature:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            value = self.transform(read_json(self.path, self.default))
+            self._store(value, signature)
+            return value
+
+    def update(self, mutate):
+        """
+        Locked read-modify-write; mutate(value) returns the new data to store.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.path):
+            value = mutate(self.transform(read_json(self.path, self.default)))
+            atomic_write_text(self.path, json.dumps(value, ensure_ascii=False, indent=2))
+            value = self.transform(value)
+            with self._lock:
+                self._store(value, self._stat_signature())
+            return value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._signature = None
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "version": self.version}
+
+
+# --- SQLITE ---
+
+class SQLiteFile:
+    """
+    One connection to a SQLite database, shared by every thread.
+
+    A connection per thread keeps three descriptors open (database, -wal,
+    -shm) for each thread that ever touched the file, which adds up across
+    many open users. Statements here are short and SQLite runs one writer
+    at a time anyway, so threads take turns on one connection instead.
+    Keeping it open also spares the WAL checkpoint (an fsync) SQLite runs
+    whenever the last connection to a database closes. setup(conn) runs
+    after the schema, for migrations.
+
+    The file (and its directory) is created by the first transaction that
+    may insert rows. Until then reads, and updates or deletes (which would
+    find nothing), run on an empty in-memory database with the same schema,
+    so looking at something that was never written leaves nothing on disk.
+    """
+
+    def __init__(self, path: Path, schema: str, setup=None):
+        self.path = Path(path)
+        self.schema = schema
+        self.setup = setup
+        self._conn = None
+        self._empty = None
+        self._lock = threading.RLock()
+
+    def exists(self) -> bool:
+        return self._conn is not None or self.path.exists()
+
+    def _connection(self, create: bool = False) -> sqlite3.Connection:
+        if self._conn is None:
+            if not create and not self.path.exists():
+                if self._empty is None:
+                    self._empty = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+                    self._empty.row_factory = sqlite3.Row
+                    self._empty.executescript(self.schema)
+                return self._empty
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL" if fsync_enabled() else "PRAGMA synchronous=NORMAL")
+            conn.executescript(self.schema)
+            if self.setup is not None:
+                self.setup(conn)
+            self._conn = conn
+            if self._empty is not None:
+                self._empty.close()
+                self._empty = None
+        return self._conn
+
+    @contextmanager
+    def read(self):
+        """
+        The connection, held for the duration of the block.
+        """
+        with self._lock:
+            yield self._connection()
+
+    @contextmanager
+    def transaction(self, create: bool = True):
+        """
+        The connection inside BEGIN IMMEDIATE: commits when the block
+        finishes, rolls back if it raises. create=False for changes to
+        existing rows only, which don't need the file to exist.
+        """
+        with self._lock:
+            conn = self._connection(create)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self) -> None:
+        """
+        Closes the connection, which checkpoints the WAL; the next use reopens it.
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
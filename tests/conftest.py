@@ -0,0 +1,109 @@
+"""
+Shared fixtures: an app built by create_app with fake LLM clients and all
+of its data (users, blobs, cache and idempotency files) in tmp_path.
+"""
+
+import base64
+import io
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "bench"))
+
+from app import create_app  # noqa: E402
+
+
+def png_data_url(color="navy", size=(900, 600)) -> str:
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def completion(content: str):
+    message = SimpleNamespace(role="assistant", content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, delta=message)],
+                           usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5))
+
+
+class FakeLLM:
+    """
+    Stands in for the OpenAI client: chat.completions.create(**kwargs)
+    answers reply(kwargs) after `delay` seconds and records the call;
+    `started` is set by the first call.
+    """
+
+    def __init__(self, reply=lambda kwargs: "Wear the navy coat.", delay: float = 0.0):
+        self.reply = reply
+        self.delay = delay
+        self.calls = []
+        self.started = threading.Event()
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls.append(kwargs)
+        self.started.set()
+        time.sleep(self.delay)
+        return completion(self.reply(kwargs))
+
+
+class FakeAsyncLLM:
+    """
+    AsyncOpenAI counterpart of FakeLLM, for chat summaries and batch recognition.
+    """
+
+    def __init__(self, reply=lambda kwargs: "Summary."):
+        self.reply = reply
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def with_options(self, **options):
+        return self
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return completion(self.reply(kwargs))
+
+
+@pytest.fixture
+def llm():
+    return FakeLLM()
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """
+    create_app with fakes and tmp_path as the working directory (where the
+    'local' user's files and the default cache files live); config overrides.
+    """
+    monkeypatch.chdir(tmp_path)
+
+    def make(**config):
+        settings = {"LLM_CLIENT": FakeLLM(), "ASYNC_LLM_CLIENT": FakeAsyncLLM(), "USERS_DIR": str(tmp_path / "users"),
+                    "BLOBS_DIR": str(tmp_path / "blobs"), "DEFAULT_USER_ID": ""}
+        settings.update(config)
+        return create_app(settings)
+
+    return make
+
+
+@pytest.fixture
+def app(make_app, llm):
+    return make_app(LLM_CLIENT=llm)
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.environ_base["HTTP_X_USER_ID"] = "test-user-0001"
+    return client
@@ -0,0 +1,32 @@
+from response_cache import ResponseCache
+
+
+def test_disk_entries_are_shared_and_capped(tmp_path):
+    path = tmp_path / "cache.db"
+    writer = ResponseCache(disk_path=path, max_rows=3)
+    reader = ResponseCache(disk_path=path)  # another worker
+
+    for n in range(5):
+        writer.set(f"key-{n}", {"n": n})
+        writer.purge()
+
+    assert reader.get("key-4") == {"n": 4} and reader.stats()["disk_hits"] == 1
+    assert reader.get("key-0") is None
+    assert writer.stats()["disk_purged"] == 2
+
+
+def test_cache_file_is_created_by_the_first_write(tmp_path):
+    cache = ResponseCache(disk_path=tmp_path / "cache.db")
+
+    assert cache.get("missing") is None
+    assert not (tmp_path / "cache.db").exists()
+    cache.set("key", "value")
+    assert (tmp_path / "cache.db").exists()
+
+
+def test_metrics_scrape_creates_no_cache_files(client, tmp_path):
+    before = set(tmp_path.iterdir())
+
+    assert client.get("/metrics").status_code == 200
+
+    assert set(tmp_path.iterdir()) == before
@@ -0,0 +1,36 @@
+import pytest
+
+from categorizer import CATEGORY_KEYWORDS, categorize, categorize_many
+
+
+def categorize_by_scan(item_type: str) -> str:
+    # One substring test per keyword, first category to match wins
+    lowered = item_type.lower()
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            return category
+    return "accessories"
+
+
+@pytest.mark.parametrize("item_type, category", [
+    ("Slim Jeans", "bottoms"),
+    ("Chelsea Boots", "shoes"),
+    ("Sweater Dress", "outerwear"),  # earlier categories win
+    ("Denim shirt jacket", "outerwear"),
+    ("Cargo shorts", "bottoms"),
+    ("T-Shirt", "tops"),
+    ("Silk scarf", "accessories"),
+    ("", "accessories"),
+])
+def test_examples(item_type, category):
+    assert categorize(item_type) == category
+
+
+def test_matches_a_keyword_scan():
+    types = [f"{a} {b}" for _, keywords in CATEGORY_KEYWORDS for a in keywords for b in ("", "Flat", "Hat", "top")]
+    assert [categorize(t) for t in types] == [categorize_by_scan(t) for t in types]
+
+
+def test_categorize_many_keeps_order_and_tolerates_missing_types():
+    items = [{"type": "Sneakers"}, {}, {"type": None}, {"type": "Blazer"}]
+    assert categorize_many(items) == ["shoes", "accessories", "accessories", "outerwear"]
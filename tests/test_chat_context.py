@@ -0,0 +1,28 @@
+import threading
+
+from chat_context import ChatContext
+from chat_store import ChatStore
+from conftest import FakeAsyncLLM
+
+SYSTEM = {"role": "system", "content": "You are a stylist."}
+
+
+def test_old_messages_are_folded_into_the_summary(tmp_path):
+    store = ChatStore(tmp_path / "chats.db")
+    chat_id = store.create_chat()
+    store.append_messages(chat_id, [{"role": "user", "content": f"message {n} " + "word " * 20} for n in range(30)])
+    writers = []
+    set_summary = store.set_summary
+    store.set_summary = lambda *args: writers.append(threading.current_thread().name) or set_summary(*args)
+    llm = FakeAsyncLLM(reply=lambda kwargs: "Likes navy.")
+    context = ChatContext(store, budget=300, async_llm=lambda: llm)
+
+    assert context.refresh_summary(chat_id, SYSTEM).result(5) == "Likes navy."
+
+    summary, upto = store.get_summary(chat_id)
+    assert summary == "Likes navy." and upto > 0
+    assert writers and writers[0] != "outbound-loop"  # the SQLite write stays off the event loop
+    messages = context.build(chat_id, SYSTEM, "What now?")
+    assert messages[1]["content"].endswith("Likes navy.")
+    assert messages[-1] == {"role": "user", "content": "What now?"}
+    store.close()
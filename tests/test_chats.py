@@ -0,0 +1,59 @@
+import json
+
+LEGACY_CHATS = {
+    "chat-old": {"title": "Old chat", "last_ts": 100.0,
+                 "messages": [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]},
+    "chat-new": {"title": "Newer chat", "last_ts": 200.0,
+                 "messages": [{"role": "user", "content": "What to wear?"}]},
+}
+
+
+def add_messages(app, user_id, chat_id, count):
+    store = app.extensions["services"].user_spaces.get(user_id).chats
+    for n in range(count):
+        store.append_messages(chat_id, [{"role": "user", "content": f"message {n}"}])
+
+
+def test_legacy_chats_json_is_migrated_once(make_app, tmp_path):
+    (tmp_path / "chats.json").write_text(json.dumps(LEGACY_CHATS), encoding="utf-8")
+
+    for _ in range(2):  # a second app (another worker, or a restart) must not import again
+        client = make_app(DEFAULT_USER_ID="local").test_client()
+        chats = client.get("/api/chats").get_json()
+        assert [c["id"] for c in chats] == ["chat-new", "chat-old"]
+        messages = client.get("/api/chats/chat-old").get_json()["messages"]
+        assert [(m["role"], m["content"]) for m in messages] == [("user", "Hi"), ("assistant", "Hello")]
+
+
+def test_message_pages_follow_next_before(app, client):
+    chat_id = client.post("/api/chats").get_json()["id"]
+    add_messages(app, "test-user-0001", chat_id, 7)
+
+    pages, before = [], None
+    while True:
+        page = client.get(f"/api/chats/{chat_id}", query_string={"limit": 3, "before": before}).get_json()
+        pages.append([m["content"] for m in page["messages"]])
+        before = page["next_before"]
+        if before is None:
+            break
+
+    assert pages == [["message 4", "message 5", "message 6"], ["message 1", "message 2", "message 3"],
+                     ["message 0"]]
+
+
+def test_chat_list_pages_with_total(client):
+    ids = [client.post("/api/chats").get_json()["id"] for _ in range(5)]
+
+    first = client.get("/api/chats?limit=2")
+    second = client.get("/api/chats?limit=2&offset=2")
+    rest = client.get("/api/chats?limit=2&offset=4")
+
+    assert first.headers["X-Total-Count"] == "5"
+    listed = [c["id"] for page in (first, second, rest) for c in page.get_json()]
+    assert sorted(listed) == sorted(ids)
+    assert len(rest.get_json()) == 1
+
+
+def test_unknown_chat_is_404(client):
+    assert client.get("/api/chats/missing").status_code == 404
+    assert client.post("/api/chats/missing/message", json={"message": "hi"}).status_code == 404
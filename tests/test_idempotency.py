@@ -0,0 +1,72 @@
+import threading
+
+from conftest import FakeLLM
+
+KEY = {"Idempotency-Key": "retry-me-1"}
+
+
+def new_chat(client):
+    return client.post("/api/chats").get_json()["id"]
+
+
+def test_retry_with_same_key_is_replayed(client, llm):
+    chat_id = new_chat(client)
+
+    first = client.post(f"/api/chats/{chat_id}/message", json={"message": "hi"}, headers=KEY)
+    retry = client.post(f"/api/chats/{chat_id}/message", json={"message": "hi"}, headers=KEY)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.get_json() == first.get_json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert len(llm.calls) == 1
+    assert len(client.get(f"/api/chats/{chat_id}").get_json()["messages"]) == 2
+
+
+def test_key_reused_for_another_request_is_rejected(client, llm):
+    chat_id = new_chat(client)
+
+    client.post(f"/api/chats/{chat_id}/message", json={"message": "hi"}, headers=KEY)
+    reused = client.post(f"/api/chats/{chat_id}/message", json={"message": "something else"}, headers=KEY)
+
+    assert reused.status_code == 422
+    assert len(llm.calls) == 1
+
+
+def test_keys_belong_to_one_user(app, client, llm):
+    chat_id = new_chat(client)
+    client.post(f"/api/chats/{chat_id}/message", json={"message": "hi"}, headers=KEY)
+
+    other = app.test_client()
+    other_chat = other.post("/api/chats", headers={"X-User-Id": "other-user-01"}).get_json()["id"]
+    response = other.post(f"/api/chats/{other_chat}/message", json={"message": "hi"},
+                          headers={**KEY, "X-User-Id": "other-user-01"})
+
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+    assert len(llm.calls) == 2
+
+
+def test_key_running_in_another_worker_gets_409(make_app, tmp_path):
+    # Two apps on one IDEMPOTENCY_DB stand in for two gunicorn workers
+    slow = FakeLLM(delay=0.5)
+    first_worker = make_app(LLM_CLIENT=slow)
+    second_worker = make_app(LLM_CLIENT=slow)
+    headers = {**KEY, "X-User-Id": "test-user-0001"}
+    chat_id = first_worker.test_client().post("/api/chats", headers=headers).get_json()["id"]
+    url = f"/api/chats/{chat_id}/message"
+
+    responses = {}
+    running = threading.Thread(target=lambda: responses.setdefault(
+        "first", first_worker.test_client().post(url, json={"message": "hi"}, headers=headers)))
+    running.start()
+    assert slow.started.wait(5)
+    responses["during"] = second_worker.test_client().post(url, json={"message": "hi"}, headers=headers)
+    running.join()
+    responses["after"] = second_worker.test_client().post(url, json={"message": "hi"}, headers=headers)
+
+    assert responses["first"].status_code == 200
+    assert responses["during"].status_code == 409
+    assert responses["during"].headers["Retry-After"] == "1"
+    assert responses["after"].headers["Idempotent-Replayed"] == "true"
+    assert responses["after"].get_json() == responses["first"].get_json()
+    assert len(slow.calls) == 1
@@ -0,0 +1,43 @@
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import image_pipeline
+from conftest import png_data_url
+
+pytestmark = pytest.mark.skipif(not image_pipeline.available(), reason="needs Pillow")
+
+
+class BrokenPool:
+    """
+    A process pool whose worker has died: every submit raises.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        raise BrokenProcessPool("A child process terminated abruptly")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_broken_pool_is_replaced(monkeypatch):
+    broken = BrokenPool()
+    monkeypatch.setattr(image_pipeline, "_pool", broken)
+
+    image = image_pipeline.normalize_data_url(png_data_url())
+
+    assert (image["width"], image["height"]) == (512, 341)
+    assert broken.shut_down and image_pipeline._pool is not broken
+
+
+def test_pool_that_keeps_breaking_falls_back_in_process(monkeypatch):
+    monkeypatch.setattr(image_pipeline, "_pool", None)
+    monkeypatch.setattr(image_pipeline, "ProcessPoolExecutor", BrokenPool)
+
+    images = image_pipeline.normalize_data_urls([png_data_url(), "data:image/png;base64,bm90IGFuIGltYWdl"])
+
+    assert images[0]["data_url"].startswith("data:image/jpeg;base64,")
+    assert isinstance(images[1], ValueError)
@@ -0,0 +1,64 @@
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "_metrics", [])
+    monkeypatch.setattr(metrics, "_collectors", {})
+
+
+def test_counter_renders_per_label_values(registry):
+    counter = metrics.Counter("jobs_total", "Jobs done", ["kind"])
+    counter.inc(kind="b")
+    counter.inc(2, kind="a")
+    counter.inc(kind='say "hi"\n')
+
+    assert metrics.render().splitlines() == [
+        "# HELP jobs_total Jobs done",
+        "# TYPE jobs_total counter",
+        'jobs_total{kind="a"} 2',
+        'jobs_total{kind="b"} 1',
+        'jobs_total{kind="say \\"hi\\"\\n"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = metrics.Histogram("wait_seconds", "Waiting", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    assert metrics.render().splitlines()[2:] == [
+        'wait_seconds_bucket{le="0.1"} 2',
+        'wait_seconds_bucket{le="1.0"} 3',
+        'wait_seconds_bucket{le="+Inf"} 4',
+        "wait_seconds_sum 3.65",
+        "wait_seconds_count 4",
+    ]
+
+
+def test_collectors_group_families_and_survive_failures(registry):
+    def broken():
+        raise RuntimeError("gone")
+
+    metrics.register_collector(lambda: [("cache_hits", "gauge", "Hits", {"cache": "a"}, 1)], "first")
+    metrics.register_collector(broken, "broken")
+    metrics.register_collector(lambda: [("cache_hits", "gauge", "Hits", {"cache": "b"}, 2)], "second")
+
+    assert metrics.render().splitlines() == [
+        "# HELP cache_hits Hits",
+        "# TYPE cache_hits gauge",
+        'cache_hits{cache="a"} 1',
+        'cache_hits{cache="b"} 2',
+    ]
+
+
+def test_metrics_endpoint_counts_requests(client):
+    client.get("/api/profile")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200 and response.mimetype == "text/plain"
+    assert any(line.startswith("http_request_duration_seconds_count{") and 'route="/api/profile"' in line
+               for line in response.get_data(as_text=True).splitlines())
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+
+import outbound
+from conftest import FakeAsyncLLM, completion
+
+
+class SlowAsyncLLM(FakeAsyncLLM):
+    """
+    Answers the first call at once; the others wait until they are cancelled.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.cancelled = []
+        self.all_cancelled = threading.Event()
+
+    async def create(self, **kwargs):
+        if kwargs["index"] == 0:
+            return completion("first")
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            self.cancelled.append(kwargs["index"])
+            if len(self.cancelled) == 3:
+                self.all_cancelled.set()
+            raise
+
+
+def test_closing_complete_as_completed_cancels_running_calls():
+    client = SlowAsyncLLM()
+    completed = outbound.complete_as_completed([{"index": n} for n in range(4)], client=client)
+
+    index, response = next(completed)
+    completed.close()  # what a disconnected stream does
+
+    assert (index, response.choices[0].message.content) == (0, "first")
+    assert client.all_cancelled.wait(5)
+    assert sorted(client.cancelled) == [1, 2, 3]
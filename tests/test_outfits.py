@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+import outfit_engine
+from categorizer import categorize
+from conftest import FakeLLM
+
+WARDROBE = [
+    {"id": "jeans", "type": "Jeans", "color": "blue", "style": "casual", "season": "all"},
+    {"id": "trousers", "type": "Trousers", "color": "beige", "style": "casual", "season": "all"},
+    {"id": "tee", "type": "T-shirt", "color": "white", "style": "casual", "season": "summer"},
+    {"id": "sweater", "type": "Sweater", "color": "navy", "style": "casual", "season": "winter"},
+    {"id": "sneakers", "type": "Sneakers", "color": "white", "style": "casual", "season": "all"},
+    {"id": "boots", "type": "Boots", "color": "brown", "style": "casual", "season": "winter"},
+    {"id": "coat", "type": "Coat", "color": "grey", "style": "classic", "season": "winter"},
+]
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/api/outfit", {"wardrobe": ["jeans"], "mode": "local"}),
+    ("/api/outfit", {"wardrobe": "jeans", "mode": "local"}),
+    ("/api/outfit/remix", {"wardrobe": WARDROBE, "original_outfit": {"items": [["jeans"]]}, "mode": "local"}),
+    ("/api/outfit/remix", {"wardrobe": WARDROBE, "original_outfit": {"items": [{"id": "jeans"}]}}),
+    ("/api/outfit/week", {"wardrobe": [1, 2], "slots": [{"weather": "5°C"}]}),
+    ("/api/outfit", ["not", "an", "object"]),
+    ("/api/wardrobe", {"items": ["not an object"]}),
+    ("/api/wardrobe", ["not an object"]),
+])
+def test_malformed_input_is_400(client, llm, path, body):
+    response = client.post(path, json=body)
+
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    assert not llm.calls
+
+
+def test_generate_rejects_unhashable_exclude():
+    with pytest.raises(ValueError):
+        outfit_engine.generate(WARDROBE, "5°C", {}, exclude=[["jeans"]])
+
+
+def categories(item_ids):
+    by_id = {item["id"]: item for item in WARDROBE}
+    return sorted(categorize(by_id[item_id]["type"]) for item_id in item_ids)
+
+
+def test_local_mode_builds_a_complete_outfit_without_the_llm(client, llm):
+    response = client.post("/api/outfit", json={"wardrobe": WARDROBE, "weather": "2°C, wind 10km/h", "mode": "local"})
+
+    outfit = response.get_json()
+    assert outfit["mode"] == "local"
+    assert categories(outfit["items"]) == ["bottoms", "outerwear", "shoes", "tops"]
+    assert "boots" in outfit["items"] and {"coat", "sweater"} & set(outfit["items"])  # a cold day
+    assert not llm.calls
+
+
+def test_local_remix_avoids_the_previous_outfit(client):
+    first = client.post("/api/outfit", json={"wardrobe": WARDROBE, "weather": "2°C", "mode": "local"}).get_json()
+    remix = client.post("/api/outfit/remix", json={"wardrobe": WARDROBE, "weather": "2°C", "mode": "local",
+                                                   "original_outfit": {"items": first["items"]}}).get_json()
+
+    assert remix["items"] != first["items"]
+
+
+def test_hybrid_mode_lets_the_llm_pick_a_local_candidate(make_app):
+    llm = FakeLLM(reply=lambda kwargs: json.dumps({"choice": 1, "reason": "The second one."}))
+    client = make_app(LLM_CLIENT=llm).test_client()
+
+    outfit = client.post("/api/outfit", json={"wardrobe": WARDROBE, "weather": "18°C", "mode": "hybrid"},
+                         headers={"X-User-Id": "test-user-0001"}).get_json()
+
+    assert outfit["mode"] == "hybrid" and outfit["reason"] == "The second one."
+    assert categories(outfit["items"])[0] == "bottoms"
+    assert len(llm.calls) == 1 and "Candidates:" in llm.calls[0]["messages"][1]["content"]
+
+
+def test_llm_failure_falls_back_to_the_local_engine(make_app):
+    def fail(kwargs):
+        raise RuntimeError("upstream down")
+
+    client = make_app(LLM_CLIENT=FakeLLM(reply=fail)).test_client()
+
+    outfit = client.post("/api/outfit", json={"wardrobe": WARDROBE, "weather": "18°C", "mode": "llm"},
+                         headers={"X-User-Id": "test-user-0001"}).get_json()
+
+    assert outfit["fallback"] is True and outfit["mode"] == "local"
+    assert outfit["items"]
+
+
+def test_replace_repeats_swaps_shoes_while_alternatives_last():
+    slots = [{"weather": "5°C", "event": "Walk"}] * 3
+    plan = [["jeans", "sweater", "sneakers"], ["trousers", "sweater", "sneakers"], ["jeans", "coat", "sneakers"]]
+
+    swaps = outfit_engine.replace_repeats(WARDROBE, plan, slots, {})
+
+    assert swaps == [(1, "sneakers", "boots")]
+    assert [day[-1] for day in plan] == ["sneakers", "boots", "sneakers"]
+    assert plan[0][:2] == ["jeans", "sweater"] and plan[1][:2] == ["trousers", "sweater"]
+
+
+def test_local_week_plan_does_not_repeat_shoes(client, llm):
+    slots = [{"date": f"2026-10-{day}", "weather": "5°C, cloudy"} for day in (19, 20)]
+
+    response = client.post("/api/outfit/week", json={"wardrobe": WARDROBE, "slots": slots, "mode": "local"})
+
+    days = response.get_json()["outfits"]
+    types = {item["id"]: item["type"] for item in WARDROBE}
+    shoes = [[i for i in day["items"] if categorize(types[i]) == "shoes"] for day in days]
+    assert response.status_code == 200 and not llm.calls
+    assert [day["date"] for day in days] == ["2026-10-19", "2026-10-20"]
+    assert sorted(s for day in shoes for s in day) == ["boots", "sneakers"]
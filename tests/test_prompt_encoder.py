@@ -0,0 +1,41 @@
+import prompt_encoder
+from conftest import completion
+
+ITEMS = [{"id": f"item-{n}", "type": "Shirt", "color": "navy|white", "style": "casual", "season": "summer",
+          "warmth": "light", "brand": "left out"} for n in range(60)]
+
+
+def test_table_round_trips_through_short_ids():
+    table, id_map = prompt_encoder.encode_wardrobe(ITEMS[:3])
+
+    assert table.splitlines() == ["id|type|color|style|season|warmth", "1|Shirt|navy/white|casual|summer|light",
+                                  "2|Shirt|navy/white|casual|summer|light", "3|Shirt|navy/white|casual|summer|light"]
+    assert prompt_encoder.decode_ids([3, "1", " 3 ", 99], id_map) == ["item-2", "item-0"]
+    assert prompt_encoder.short_ids(["item-1", "unknown"], ITEMS[:3]) == [2]
+
+
+def test_wardrobe_is_cut_to_the_budget_most_relevant_first():
+    _, _, full_tokens = prompt_encoder.fit_wardrobe(ITEMS, budget=10 ** 6)
+    text, id_map, tokens = prompt_encoder.fit_wardrobe(ITEMS, budget=full_tokens // 2)
+
+    assert tokens <= full_tokens // 2
+    assert prompt_encoder.MIN_ROWS <= len(id_map) < len(ITEMS)
+    assert list(id_map.values()) == [item["id"] for item in ITEMS[:len(id_map)]]
+    assert len(text.splitlines()) == len(id_map) + 1
+
+
+def test_never_fewer_than_min_rows():
+    _, id_map, _ = prompt_encoder.fit_wardrobe(ITEMS, budget=1)
+
+    assert len(id_map) == prompt_encoder.MIN_ROWS
+
+
+def test_usage_is_totalled_per_endpoint():
+    before = prompt_encoder.usage_stats()
+
+    prompt_encoder.record_usage("test_endpoint", completion("ok"), estimated_prompt=12)
+
+    after = prompt_encoder.usage_stats()
+    assert after["calls"] == before.get("calls", 0) + 1
+    assert after["test_endpoint.prompt_tokens"] == 10 and after["test_endpoint.completion_tokens"] == 5
+    assert after["tokenizer"] in ("tiktoken", "heuristic")
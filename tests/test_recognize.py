@@ -0,0 +1,95 @@
+import base64
+import io
+import json
+
+import pytest
+
+import image_pipeline
+from conftest import FakeAsyncLLM, FakeLLM, png_data_url
+
+pytestmark = pytest.mark.skipif(not image_pipeline.available(), reason="needs Pillow")
+
+RESULT = {"is_clothing": True, "type": "Shirt", "style": "casual", "season": "summer", "warmth": "light",
+          "brand": "", "tags": []}
+
+
+def photo_data_url(color, size=(900, 600), fmt="PNG") -> str:
+    """
+    A striped garment-like picture, so the difference hash has gradients to compare.
+    """
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (900, 600), "white")
+    draw = ImageDraw.Draw(image)
+    for x in range(0, 900, 150):
+        draw.rectangle((x, 0, x + 70, 600), fill=color)
+    draw.ellipse((300, 150, 600, 450), fill="black")
+    out = io.BytesIO()
+    image.resize(size).save(out, format=fmt)
+    return f"data:image/{fmt.lower()};base64," + base64.b64encode(out.getvalue()).decode("ascii")
+
+
+@pytest.fixture
+def vision():
+    return FakeAsyncLLM(reply=lambda kwargs: json.dumps(RESULT))
+
+
+@pytest.fixture
+def batch(make_app, vision):
+    client = make_app(ASYNC_LLM_CLIENT=vision).test_client()
+    client.environ_base["HTTP_X_USER_ID"] = "test-user-0001"
+
+    def post(images):
+        response = client.post("/api/recognize/batch", json={"images": images})
+        assert response.status_code == 200 and response.mimetype == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        return sorted(lines, key=lambda line: line["index"])
+
+    return post
+
+
+def test_duplicates_share_one_call_and_are_cached(batch, vision):
+    navy = png_data_url("navy")
+    images = [navy, {"id": "b", "imageDataUrl": navy}, None, "data:image/png;base64,bm90IGFuIGltYWdl"]
+
+    first = batch(images)
+    again = batch([navy])
+
+    assert [line.get("result") for line in first[:2]] == [RESULT, RESULT]
+    assert first[1]["id"] == "b" and first[0]["hash"] == first[1]["hash"]
+    assert first[2]["error"] == "No image" and first[3]["error"] == "Unreadable image"
+    assert again == [{**first[0], "cached": True}]
+    assert len(vision.calls) == 1
+
+
+def test_too_many_images_is_413(make_app):
+    client = make_app().test_client()
+    response = client.post("/api/recognize/batch", json={"images": ["x"] * 1000},
+                           headers={"X-User-Id": "test-user-0001"})
+
+    assert response.status_code == 413
+
+
+def test_near_duplicates_share_one_call(batch, vision):
+    photo = photo_data_url("navy")
+    resaved = photo_data_url("navy", size=(600, 400), fmt="JPEG")
+    other_color = photo_data_url("firebrick")
+
+    lines = batch([photo, resaved, other_color])
+
+    assert lines[0]["hash"] != lines[1]["hash"]
+    assert all(line["result"] == RESULT for line in lines)
+    assert len(vision.calls) == 2
+
+
+def test_single_recognition_reuses_a_reencoded_photo(make_app):
+    llm = FakeLLM(reply=lambda kwargs: json.dumps(RESULT))
+    client = make_app(LLM_CLIENT=llm).test_client()
+    headers = {"X-User-Id": "test-user-0001"}
+
+    first = client.post("/api/recognize", json={"imageDataUrl": photo_data_url("navy")}, headers=headers)
+    resaved = client.post("/api/recognize", json={"imageDataUrl": photo_data_url("navy", (1800, 1200), "JPEG")},
+                          headers=headers)
+
+    assert first.get_json() == resaved.get_json() == RESULT
+    assert len(llm.calls) == 1
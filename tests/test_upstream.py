@@ -0,0 +1,53 @@
+"""
+The real clients (OpenAI, AsyncOpenAI and the pooled requests.Session)
+against bench/mock_upstream.py instead of OpenAI and Open-Meteo.
+"""
+
+import pytest
+
+import mock_upstream
+import outbound
+import weather
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    server, calls = mock_upstream.start(latency=0.01)
+    base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    monkeypatch.setattr(weather, "GEOCODING_URL", f"{base}/search")
+    monkeypatch.setattr(weather, "FORECAST_URL", f"{base}/forecast")
+    yield base, calls
+    server.shutdown()
+
+
+@pytest.fixture
+def mocked_client(make_app, upstream):
+    from openai import AsyncOpenAI, OpenAI
+
+    base, _ = upstream
+    app = make_app(LLM_CLIENT=OpenAI(base_url=base, api_key="mock"),
+                   ASYNC_LLM_CLIENT=AsyncOpenAI(base_url=base, api_key="mock"),
+                   HTTP_SESSION=outbound.make_session())
+    client = app.test_client()
+    client.environ_base["HTTP_X_USER_ID"] = "test-user-0001"
+    return client
+
+
+def test_chat_reply_and_stream_from_the_upstream(mocked_client, upstream):
+    chat_id = mocked_client.post("/api/chats").get_json()["id"]
+
+    reply = mocked_client.post(f"/api/chats/{chat_id}/message", json={"message": "hi"}).get_json()["reply"]
+    streamed = mocked_client.post(f"/api/chats/{chat_id}/message/stream", json={"message": "again"})
+
+    assert reply.startswith("Mock stylist reply")
+    assert "event: done" in streamed.get_data(as_text=True)
+    assert upstream[1].calls["/v1/chat/completions"] == 2
+
+
+def test_weather_is_cached_per_app(mocked_client, upstream):
+    first = mocked_client.get("/api/weather?city=Kosice").get_json()
+    second = mocked_client.get("/api/weather?city=Kosice").get_json()
+
+    assert first == second and "temperature" in first
+    assert upstream[1].calls["/v1/search"] == 1
+    assert upstream[1].calls["/v1/forecast"] == 1
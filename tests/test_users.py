@@ -0,0 +1,76 @@
+import threading
+
+import users
+from app import create_app
+from conftest import FakeLLM
+
+USER_ID = "test-user-0001"
+PROFILE_FIELDS = {"name": "Ann", "email": "ann@example.com", "city": "Kosice", "about": "Likes linen",
+                  "height": "170", "weight": "60", "body_type": "Slim", "skin_tone": "Warm", "style": "Classic",
+                  "gender": "Female"}
+
+
+def run_concurrently(target, args_list):
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_profile_updates_keep_every_field(app):
+    # Each request changes one field; none may be lost to another's read-modify-write
+    def update(key, value):
+        client = app.test_client()
+        assert client.post("/api/profile", json={key: value}, headers={"X-User-Id": USER_ID}).status_code == 200
+
+    run_concurrently(update, PROFILE_FIELDS.items())
+
+    profile = app.test_client().get("/api/profile", headers={"X-User-Id": USER_ID}).get_json()
+    assert {key: profile[key] for key in PROFILE_FIELDS} == PROFILE_FIELDS
+
+
+def test_concurrent_chat_messages_are_all_saved(app, client, llm):
+    chat_id = client.post("/api/chats").get_json()["id"]
+
+    def send(n):
+        response = app.test_client().post(f"/api/chats/{chat_id}/message", json={"message": f"question {n}"},
+                                          headers={"X-User-Id": USER_ID})
+        assert response.status_code == 200
+
+    run_concurrently(send, [(n,) for n in range(10)])
+
+    messages = client.get(f"/api/chats/{chat_id}?limit=100").get_json()["messages"]
+    assert len(llm.calls) == 10
+    assert len(messages) == 20
+    assert sorted(m["content"] for m in messages if m["role"] == "user") == sorted(f"question {n}" for n in range(10))
+    seqs = [m["seq"] for m in messages]
+    assert seqs == sorted(seqs) and len(set(seqs)) == len(seqs)
+
+
+def test_new_user_reads_defaults_without_creating_files(app, tmp_path):
+    client = app.test_client()
+    headers = {"X-User-Id": "visitor-0001"}
+
+    assert client.get("/", headers=headers).status_code == 200
+    assert client.get("/api/profile", headers=headers).get_json()["name"] == "User"
+    assert client.get("/api/wardrobe", headers=headers).get_json()["items"] == []
+    assert client.get("/api/chats", headers=headers).get_json() == []
+    assert client.get("/").status_code == 200  # anonymous, gets a new id
+    assert not (tmp_path / "users").exists()
+
+    client.post("/api/chats", headers=headers)
+    space = app.extensions["services"].user_spaces.path("visitor-0001")
+    assert (space / "chats.db").exists() and not (space / "wardrobe.db").exists()
+
+
+def test_legacy_files_are_only_served_when_opted_in(make_app, tmp_path, monkeypatch):
+    (tmp_path / "profile.json").write_text('{"name": "Old Me"}', encoding="utf-8")
+    monkeypatch.delenv("DEFAULT_USER_ID", raising=False)
+
+    default = create_app({"LLM_CLIENT": FakeLLM(), "USERS_DIR": str(tmp_path / "users"),
+                          "BLOBS_DIR": str(tmp_path / "blobs")})
+    opted_in = make_app(DEFAULT_USER_ID=users.LOCAL_USER)
+
+    assert default.test_client().get("/api/profile").get_json()["name"] == "User"
+    assert opted_in.test_client().get("/api/profile").get_json()["name"] == "Old Me"
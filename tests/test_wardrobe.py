@@ -0,0 +1,42 @@
+def add_items(client, count):
+    items = [{"id": f"item-{n}", "type": "Shirt", "color": "navy"} for n in range(count)]
+    assert client.post("/api/wardrobe", json={"items": items}).status_code == 201
+
+
+def test_pages_in_insertion_order_with_total(client):
+    add_items(client, 5)
+
+    first = client.get("/api/wardrobe?limit=2").get_json()
+    last = client.get("/api/wardrobe?offset=4&limit=2").get_json()
+
+    assert [item["id"] for item in first["items"]] == ["item-0", "item-1"]
+    assert [item["id"] for item in last["items"]] == ["item-4"]
+    assert first["total"] == last["total"] == 5
+
+
+def test_unchanged_page_is_304_until_a_write(client):
+    add_items(client, 3)
+    etag = client.get("/api/wardrobe?limit=2").headers["ETag"]
+
+    unchanged = client.get("/api/wardrobe?limit=2", headers={"If-None-Match": etag})
+    client.post("/api/wardrobe/worn", json={"ids": ["item-0"]})
+    changed = client.get("/api/wardrobe?limit=2", headers={"If-None-Match": etag})
+
+    assert unchanged.status_code == 304
+    assert changed.status_code == 200 and changed.get_json()["items"][0]["usageCount"] == 1
+
+
+def test_etag_is_per_page_and_per_user(app, client):
+    other = app.test_client()
+    other.environ_base["HTTP_X_USER_ID"] = "other-user-01"
+    add_items(client, 3)
+    add_items(other, 3)  # same wardrobe version as client's
+    response = client.get("/api/wardrobe?limit=2")
+    etag = {"If-None-Match": response.headers["ETag"]}
+
+    next_page = client.get("/api/wardrobe?offset=2&limit=2", headers=etag)
+    other_user = other.get("/api/wardrobe?limit=2", headers=etag)
+
+    assert next_page.status_code == 200 and [i["id"] for i in next_page.get_json()["items"]] == ["item-2"]
+    assert other_user.status_code == 200
+    assert {"X-User-Id", "Cookie"} <= set(response.vary)
@@ -0,0 +1,85 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import weather
+
+LOCATION = {"results": [{"name": "Kosice", "country": "Slovakia", "latitude": 48.72, "longitude": 21.26}]}
+FORECAST = {"current_weather": {"temperature": 12.5, "windspeed": 9.0}}
+
+
+class FakeSession:
+    """
+    Stands in for requests.Session against Open-Meteo: answers after
+    `delay` seconds, or raises ConnectionError while `down` is set.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.down = False
+        self.calls = {"geocode": 0, "forecast": 0}
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        kind = "geocode" if url == weather.GEOCODING_URL else "forecast"
+        with self._lock:
+            self.calls[kind] += 1
+        time.sleep(self.delay)
+        if self.down:
+            raise requests.ConnectionError("Open-Meteo is down")
+        payload = LOCATION if kind == "geocode" else FORECAST
+        return SimpleNamespace(json=lambda: payload, raise_for_status=lambda: None)
+
+
+@pytest.fixture
+def session():
+    return FakeSession()
+
+
+@pytest.fixture
+def weather_client(make_app, session):
+    return make_app(HTTP_SESSION=session).test_client()
+
+
+def test_stale_forecast_is_served_when_upstream_fails(weather_client, session, monkeypatch):
+    monkeypatch.setattr(weather, "WEATHER_TTL", 0.05)
+    fresh = weather_client.get("/api/weather?city=Kosice").get_json()
+    time.sleep(0.1)  # the forecast expires
+    session.down = True
+
+    stale = weather_client.get("/api/weather?city=Kosice")
+
+    assert stale.status_code == 200
+    assert stale.get_json() == {**fresh, "stale": True}
+    assert session.calls["forecast"] == 2
+
+
+def test_503_when_upstream_fails_and_nothing_is_cached(weather_client, session):
+    session.down = True
+
+    response = weather_client.get("/api/weather?city=Kosice")
+
+    assert response.status_code == 503
+    assert response.get_json() == {"error": "Weather service unavailable"}
+
+
+def test_concurrent_lookups_share_upstream_calls(make_app):
+    session = FakeSession(delay=0.2)
+    app = make_app(HTTP_SESSION=session)
+    responses = []
+
+    def lookup():
+        responses.append(app.test_client().get("/api/weather?city=Kosice").status_code)
+
+    threads = [threading.Thread(target=lookup) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert responses == [200] * 10
+    assert session.calls == {"geocode": 1, "forecast": 1}
+    assert app.extensions["services"].weather.stats()["coalesced"] >= 9
@@ -0,0 +1,166 @@
+"""
+Per-user storage.
+
+Every user has a directory of their own holding profile.json, chats.db and
+wardrobe.db. The directory path comes from a hash of the user id
+(users/3f/a2/<id>/), so finding a user's data is a path computation rather
+than a lookup in a shared table, and the two-level fan-out keeps every
+directory small at tens of thousands of users. Images stay in the shared,
+content-addressed blob store. The directory is created by the user's first
+write; until then they read as a new user (default profile, no items or
+chats), so visitors who only look around leave nothing on disk.
+
+Opened users (parsed profile, database handles and in-memory indexes) are
+kept in an LRU, so a request from a hot user costs one dict lookup and a
+cold one opens two SQLite files; neither depends on how many users exist.
+Each open user holds one connection per database, so the LRU is sized to
+the process's file descriptor limit (USER_CACHE_SIZE overrides it).
+
+The single-user files from before (profile.json, chats.db, wardrobe.db next
+to app.py) belong to the user LOCAL_USER, which is never reachable from a
+request id; they are only served (to everyone) with DEFAULT_USER_ID=local.
+"""
+
+import hashlib
+import os
+import re
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import outbound
+import storage
+from blob_store import BlobStore
+from chat_context import ChatContext
+from chat_store import ChatStore
+from wardrobe_store import WardrobeStore
+
+USER_HEADER = "X-User-Id"
+USER_COOKIE = "uid"
+FDS_PER_USER = 6  # two databases, each with its -wal and -shm file
+LOCAL_USER = "local"
+LEGACY_FILES = ("profile.json", "chats.json", "chats.db", "wardrobe.db")
+
+_USER_ID = re.compile(r"[A-Za-z0-9_-]{8,64}")
+
+
+def _default_cache_size() -> int:
+    """
+    256 users, or fewer when that would take more than half of the file descriptor limit.
+    """
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, OSError, ValueError):  # no resource module on Windows
+        return 256
+    if soft == resource.RLIM_INFINITY:
+        return 256
+    return max(16, min(256, soft // 2 // FDS_PER_USER))
+
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE") or _default_cache_size())
+
+
+def valid_user_id(user_id) -> bool:
+    return isinstance(user_id, str) and _USER_ID.fullmatch(user_id) is not None
+
+
+def new_user_id() -> str:
+    return secrets.token_hex(16)
+
+
+def legacy_files(local_root: Path = Path(".")) -> list:
+    """
+    Names of the single-user files from before per-user storage found in local_root.
+    """
+    return [name for name in LEGACY_FILES if (Path(local_root) / name).exists()]
+
+
+class UserSpace:
+    """
+    One user's profile, chats and wardrobe.
+    """
+
+    def __init__(self, user_id: str, root: Path, blobs: BlobStore, profile_transform=None,
+                 legacy_chats: Path = None, async_llm=outbound.async_llm):
+        self.user_id = user_id
+        self.root = Path(root)
+        self.profile = storage.CachedJSONFile(self.root / "profile.json", transform=profile_transform, default={})
+        self.chats = ChatStore(self.root / "chats.db", legacy_json=legacy_chats)
+        self.chat_window = ChatContext(self.chats, async_llm=async_llm)
+        self.wardrobe = WardrobeStore(self.root / "wardrobe.db", blobs, blob_url_prefix="/blobs/")
+        self.chat_system = (None, None)  # (profile version, rendered chat system message)
+
+    def exists(self) -> bool:
+        """
+        False until something was saved: profile and stores create their files on first write.
+        """
+        return self.root.is_dir()
+
+    def close(self) -> None:
+        self.chats.close()
+        self.wardrobe.close()
+
+
+class UserDirectory:
+    def __init__(self, root: Path, blobs: BlobStore, profile_transform=None, maxsize: int = USER_CACHE_SIZE,
+                 local_root: Path = Path("."), async_llm=outbound.async_llm):
+        self.root = Path(root)
+        self.blobs = blobs
+        self.profile_transform = profile_transform
+        self.async_llm = async_llm  # () -> AsyncOpenAI client, used for chat summaries
+        self.maxsize = maxsize
+        self.local_root = Path(local_root)
+        self.hits = 0
+        self.misses = 0
+        self._spaces = OrderedDict()
+        self._lock = threading.Lock()
+        self._closer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-close")
+
+    def path(self, user_id: str) -> Path:
+        if user_id == LOCAL_USER:
+            return self.local_root
+        digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()
+        return self.root / digest[:2] / digest[2:4] / user_id
+
+    def get(self, user_id: str) -> UserSpace:
+        """
+        The user's space. A user with nothing saved yet gets a fresh space
+        that reads as empty (default profile, no chats or items) without
+        touching the disk; it is cached once its first write has created
+        the directory.
+        """
+        with self._lock:
+            space = self._spaces.get(user_id)
+            if space is not None:
+                self._spaces.move_to_end(user_id)
+                self.hits += 1
+                return space
+            self.misses += 1
+
+        # Opened outside the lock so a cold user doesn't stall everyone else
+        legacy_chats = self.local_root / "chats.json" if user_id == LOCAL_USER else None
+        opened = UserSpace(user_id, self.path(user_id), self.blobs, self.profile_transform, legacy_chats,
+                           self.async_llm)
+        if not opened.exists():
+            # Anonymous visitors mostly never write; caching them would evict users who do
+            return opened
+        evicted = []
+        with self._lock:
+            space = self._spaces.setdefault(user_id, opened)
+            self._spaces.move_to_end(user_id)
+            while len(self._spaces) > self.maxsize:
+                evicted.append(self._spaces.popitem(last=False)[1])
+        if space is not opened:
+            evicted.append(opened)  # another request opened this user first
+        # Closing checkpoints the databases, so it happens off the request path. A request still
+        # holding an evicted space reopens what it needs, and lets go of it with the space.
+        for old in evicted:
+            self._closer.submit(old.close)
+        return space
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._spaces), "maxsize": self.maxsize}
@@ -0,0 +1,168 @@
+"""
+Server-side wardrobe storage.
+
+Item metadata lives in SQLite (one row per item, insertion order kept for
+pagination); images are moved out of the item into the content-addressed
+BlobStore and referenced by id. Every write bumps a version number that
+doubles as the ETag for list responses and as the key of the in-memory
+copy handed to the outfit endpoints.
+"""
+
+import json
+import threading
+import uuid
+from pathlib import Path
+
+import storage
+from blob_store import BlobStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    pos INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('rev', 0);
+"""
+
+# Fields a client may set on an item (image handled separately)
+ITEM_FIELDS = ["type", "style", "season", "warmth", "brand", "color", "colors", "tags", "usageCount", "lastUsed",
+               "createdAt"]
+
+
+class WardrobeStore:
+    def __init__(self, path: Path, blobs: BlobStore, blob_url_prefix: str = "/blobs/"):
+        self.path = Path(path)
+        self.blobs = blobs
+        self.blob_url_prefix = blob_url_prefix
+        self.db = storage.SQLiteFile(self.path, SCHEMA)
+        self._lock = threading.Lock()
+        self._all = None
+        self._all_rev = -1
+
+    # --- CONNECTIONS ---
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _write(self, fn, create: bool = True):
+        # create=False when fn only changes existing items (see SQLiteFile)
+        with self.db.transaction(create) as conn:
+            result = fn(conn)
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'rev'")
+        return result
+
+    # --- ITEM SHAPE ---
+
+    def _prepare(self, item: dict, base: dict = None) -> dict:
+        """
+        Copies allowed fields over base and moves an inline imageDataUrl into the blob store.
+        Raises ValueError if item is not a dict.
+        """
+        if not isinstance(item, dict):
+            raise ValueError("Wardrobe items must be objects")
+        data = dict(base or {})
+        for key in ITEM_FIELDS:
+            if key in item:
+                data[key] = item[key]
+        if item.get("imageDataUrl"):
+            data["image"] = self.blobs.put_data_url(item["imageDataUrl"])
+        data["id"] = str((base or {}).get("id") or item.get("id") or uuid.uuid4().hex)
+        return data
+
+    def _public(self, data: dict) -> dict:
+        if data.get("image"):
+            return {**data, "imageUrl": self.blob_url_prefix + data["image"]}
+        return data
+
+    # --- READS ---
+
+    def version(self) -> int:
+        with self.db.read() as conn:
+            return conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0]
+
+    def all_items(self) -> list:
+        """
+        Every item (no image payloads), cached until the next write. Read-only.
+        """
+        with self._lock:
+            rev = self.version()
+            if self._all is None or self._all_rev != rev:
+                with self.db.read() as conn:
+                    rows = conn.execute("SELECT data FROM items ORDER BY pos").fetchall()
+                self._all = [self._public(json.loads(r[0])) for r in rows]
+                self._all_rev = rev
+            return self._all
+
+    def page(self, offset: int = 0, limit: int = 50) -> tuple:
+        """
+        Returns (items, total) for one page in insertion order.
+        """
+        with self.db.read() as conn:
+            total = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+            rows = conn.execute("SELECT data FROM items ORDER BY pos LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+        return [self._public(json.loads(r[0])) for r in rows], total
+
+    def get(self, item_id: str):
+        with self.db.read() as conn:
+            row = conn.execute("SELECT data FROM items WHERE id = ?", (item_id,)).fetchone()
+        return self._public(json.loads(row[0])) if row else None
+
+    # --- WRITES ---
+
+    def add_many(self, items: list) -> list:
+        """
+        Inserts items (or replaces ones with the same id, keeping their position).
+        """
+        prepared = [self._prepare(item) for item in items]
+
+        def insert(conn):
+            conn.executemany(
+                "INSERT INTO items (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+                [(d["id"], json.dumps(d, ensure_ascii=False)) for d in prepared],
+            )
+
+        self._write(insert)
+        return [self._public(d) for d in prepared]
+
+    def add(self, item: dict) -> dict:
+        return self.add_many([item])[0]
+
+    def update(self, item_id: str, fields: dict):
+        def update(conn):
+            row = conn.execute("SELECT data FROM items WHERE id = ?", (item_id,)).fetchone()
+            if row is None:
+                return None
+            data = self._prepare(fields, base=json.loads(row[0]))
+            conn.execute("UPDATE items SET data = ? WHERE id = ?", (json.dumps(data, ensure_ascii=False), item_id))
+            return data
+
+        data = self._write(update, create=False)
+        return self._public(data) if data else None
+
+    def mark_worn(self, item_ids: list, when: str) -> int:
+        """
+        Increments usageCount and sets lastUsed for each id; returns how many were found.
+        """
+        def mark(conn):
+            found = 0
+            for item_id in item_ids:
+                row = conn.execute("SELECT data FROM items WHERE id = ?", (item_id,)).fetchone()
+                if row is None:
+                    continue
+                data = json.loads(row[0])
+                data["usageCount"] = int(data.get("usageCount") or 0) + 1
+                data["lastUsed"] = when
+                conn.execute("UPDATE items SET data = ? WHERE id = ?", (json.dumps(data, ensure_ascii=False), item_id))
+                found += 1
+            return found
+
+        return self._write(mark, create=False)
+
+    def delete(self, item_id: str) -> bool:
+        return self._write(lambda conn: conn.execute("DELETE FROM items WHERE id = ?", (item_id,)).rowcount > 0,
+                           create=False)
@@ -0,0 +1,116 @@
+"""
+Open-Meteo client with a two-tier cache.
+
+City -> coordinates lookups are cached for the life of the Weather object,
+one per app (they don't change); current weather is cached for WEATHER_TTL
+seconds, keyed on coordinates rounded to ~1 km. Concurrent requests for the
+same key share a single upstream call, and when Open-Meteo is unavailable
+the last known forecast is served instead of failing.
+"""
+
+import os
+
+import outbound
+from cache import SingleFlight, TTLCache
+
+GEOCODING_URL = os.getenv("OPEN_METEO_GEOCODING_URL", "https://geocoding-api.open-meteo.com/v1/search")
+FORECAST_URL = os.getenv("OPEN_METEO_FORECAST_URL", "https://api.open-meteo.com/v1/forecast")
+WEATHER_TTL = float(os.getenv("WEATHER_TTL", "600"))
+NOT_FOUND_TTL = 3600
+COORD_PRECISION = 2
+TIMEOUT = 3
+
+
+class WeatherError(Exception):
+    """Upstream weather service failed and nothing usable was cached."""
+
+
+class CityNotFound(WeatherError):
+    pass
+
+
+class Weather:
+    """
+    Weather lookups with their own caches. session is a zero-argument
+    callable returning the requests.Session to use, so nothing is imported
+    or connected until the first cache miss.
+    """
+
+    def __init__(self, session=outbound.session):
+        self.session = session
+        self.geocode_cache = TTLCache(maxsize=10000)
+        self.forecast_cache = TTLCache(maxsize=2000, ttl=WEATHER_TTL)
+        self.flights = SingleFlight()
+
+    def _fetch_location(self, city: str):
+        resp = self.session().get(GEOCODING_URL, timeout=TIMEOUT,
+                                  params={"name": city, "count": 1, "language": "en", "format": "json"})
+        resp.raise_for_status()
+        geo = resp.json()
+        if not geo.get("results"):
+            return None
+        loc = geo["results"][0]
+        return {"name": loc["name"], "country": loc.get("country", ""),
+                "latitude": loc["latitude"], "longitude": loc["longitude"]}
+
+    def geocode(self, city: str) -> dict:
+        """
+        Returns {"name", "country", "latitude", "longitude"} for a city.
+        Unknown cities are cached too (for NOT_FOUND_TTL) and raise CityNotFound.
+        """
+        key = " ".join(city.casefold().split())
+        loc = self.geocode_cache.get(key, False)
+        if loc is False:
+            from requests import RequestException  # loaded with the session on the first miss
+
+            try:
+                loc = self.flights.do(("geo", key), lambda: self._fetch_location(city))
+            except (RequestException, ValueError, KeyError) as e:
+                raise WeatherError(f"Geocoding failed for {city!r}: {e}") from e
+            self.geocode_cache.set(key, loc, ttl=NOT_FOUND_TTL if loc is None else None)
+        if loc is None:
+            raise CityNotFound(city)
+        return loc
+
+    def _fetch_current(self, lat: float, lon: float) -> dict:
+        resp = self.session().get(FORECAST_URL, timeout=TIMEOUT,
+                                  params={"latitude": lat, "longitude": lon, "current_weather": True})
+        resp.raise_for_status()
+        return resp.json().get("current_weather", {})
+
+    def current_weather(self, lat: float, lon: float) -> tuple:
+        """
+        Returns (current_weather, is_stale) for the rounded coordinates.
+        """
+        key = (round(lat, COORD_PRECISION), round(lon, COORD_PRECISION))
+        w = self.forecast_cache.get(key)
+        if w is not None:
+            return w, False
+
+        def fetch():
+            fresh = self._fetch_current(*key)
+            self.forecast_cache.set(key, fresh)
+            return fresh
+
+        from requests import RequestException
+
+        try:
+            return self.flights.do(("forecast", key), fetch), False
+        except (RequestException, ValueError) as e:
+            stale = self.forecast_cache.get_stale(key)
+            if stale is None:
+                raise WeatherError(f"Forecast failed for {key}: {e}") from e
+            return stale, True
+
+    def get_weather(self, city: str) -> dict:
+        loc = self.geocode(city)
+        w, stale = self.current_weather(loc["latitude"], loc["longitude"])
+        result = {"city": loc["name"], "country": loc["country"], "temperature": w.get("temperature"),
+                  "windspeed": w.get("windspeed")}
+        if stale:
+            result["stale"] = True
+        return result
+
+    def stats(self) -> dict:
+        return {"geocode": self.geocode_cache.stats(), "forecast": self.forecast_cache.stats(),
+                "coalesced": self.flights.coalesced}